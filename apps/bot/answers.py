@@ -0,0 +1,82 @@
+from datetime import timedelta
+
+from django.db import connection, transaction
+from django.db.models import Case, Exists, F, OuterRef, Subquery, When
+from django.utils import timezone
+
+from apps.bot.bitmaps import count_bits, order_key, rebuild_bitmap, with_bit
+from apps.bot.models import PollMapping, TelegramUser, UserAnswer, UserCategoryProgress
+from apps.content.models import PDFUpload
+from apps.content.question_order import get_category_questions
+
+# Answering a poll leaves its mapping in place, mappings older than this are deleted when the user
+# is sent a new poll
+POLL_MAPPING_MAX_AGE = timedelta(days=7)
+
+
+def load_poll_mapping(poll_id: str) -> PollMapping | None:
+    """
+    The poll's mapping with its question, category and user, annotated in the same query with what
+    recording the answer needs: the bitmap of the user's progress row and the file of the category's PDF.
+    """
+    progress = UserCategoryProgress.objects.filter(user=OuterRef("user"), category=OuterRef("question__category"))
+    pdf = PDFUpload.objects.filter(category=OuterRef("question__category")).order_by("id")
+
+    return PollMapping.objects.select_related("question__category", "user").annotate(
+        progress_answered=Subquery(progress.values("answered")[:1]),
+        progress_retry=Subquery(progress.values("retry")[:1]),
+        progress_size=Subquery(progress.values("size")[:1]),
+        progress_order_key=Subquery(progress.values("order_key")[:1]),
+        pdf_file=Subquery(pdf.values("file")[:1]),
+    ).filter(poll_id=poll_id).first()
+
+
+def record_poll_answer(mapping: PollMapping, selected_option: str, is_correct: bool) -> int:
+    """
+    Stores the answer to a mapping from load_poll_mapping and returns the user's new number of
+    answered questions in the category. In one transaction: a single UPDATE of the progress row that
+    sets the question's bit and moves the counters by the difference between the previous answer,
+    read by that UPDATE, and the new one, then an upsert of the answer.
+
+    The UPDATE only matches the bitmap as load_poll_mapping read it and holds the row lock until
+    commit, so concurrent answers of the user can't apply their deltas twice. When it matches nothing
+    (no row yet, another question order, or a concurrent change) the row is rebuilt from UserAnswer.
+    """
+    user, question = mapping.user, mapping.question
+    questions = get_category_questions(question.category_id, question.category.question_version)
+    position = questions.position(question.id)
+    previous = UserAnswer.objects.filter(user=user, question=question, is_active=True)
+
+    with transaction.atomic():
+        updated = 0
+        if position is not None and mapping.progress_size == len(questions) and mapping.progress_order_key == order_key(questions.ids):
+            answered, retry = bytes(mapping.progress_answered), bytes(mapping.progress_retry)
+            new_answered = with_bit(answered, position, len(questions), True)
+            updated = UserCategoryProgress.objects.filter(user=user, category_id=question.category_id, answered=answered, retry=retry).update(
+                total_answered=F("total_answered") + Case(When(Exists(previous), then=0), default=1),
+                correct_count=F("correct_count") + int(is_correct) - Case(When(Exists(previous.filter(is_correct=True)), then=1), default=0),
+                answered=new_answered,
+                retry=with_bit(retry, position, len(questions), False)
+            )
+
+        # MySQL takes the conflict from the unique key and rejects an explicit target
+        unique_fields = ["user", "question"] if connection.features.supports_update_conflicts_with_target else None
+        UserAnswer.objects.bulk_create(
+            [UserAnswer(
+                user=user, question=question, category_id=question.category_id,
+                selected_option=selected_option, is_correct=is_correct, is_active=True
+            )],
+            update_conflicts=True,
+            unique_fields=unique_fields,
+            update_fields=["category", "selected_option", "is_correct", "is_active"]
+        )
+
+        if updated:
+            return count_bits(new_answered)
+        return rebuild_bitmap(user, question.category_id, questions).total_answered
+
+
+def purge_poll_mappings(user: TelegramUser) -> int:
+    """Deletes the user's mappings older than POLL_MAPPING_MAX_AGE. Returns how many were deleted."""
+    deleted, _ = PollMapping.objects.filter(user=user, created_at__lt=timezone.now() - POLL_MAPPING_MAX_AGE).delete()
+    return deleted
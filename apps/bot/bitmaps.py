@@ -0,0 +1,92 @@
+import zlib
+from array import array
+
+from django.db import transaction
+
+from apps.bot.models import TelegramUser, UserAnswer, UserCategoryProgress
+from apps.content.question_order import CategoryQuestions, get_category_questions
+
+
+def order_key(question_ids: array) -> int:
+    """Checksum of the ordered ids, a bitmap built for another order has to be rebuilt."""
+    return zlib.crc32(question_ids.tobytes())
+
+
+# Bits are stored little-endian: position i is bit i % 8 of byte i // 8
+def to_int(bits: bytes) -> int:
+    return int.from_bytes(bits, "little")
+
+
+def to_bytes(value: int, size: int) -> bytes:
+    return value.to_bytes((size + 7) // 8, "little")
+
+
+def first_zero_bit(bits: bytes, size: int) -> int | None:
+    value = to_int(bits)
+    position = (~value & (value + 1)).bit_length() - 1
+    return position if position < size else None
+
+
+def first_set_bit(bits: bytes) -> int | None:
+    value = to_int(bits)
+    return (value & -value).bit_length() - 1 if value else None
+
+
+def count_bits(bits: bytes) -> int:
+    return to_int(bits).bit_count()
+
+
+def with_bit(bits: bytes, position: int, size: int, value: bool) -> bytes:
+    current = to_int(bits)
+    current = current | (1 << position) if value else current & ~(1 << position)
+    return to_bytes(current, size)
+
+
+def rebuild_bitmap(user: TelegramUser, category_id: int, questions: CategoryQuestions | None = None) -> UserCategoryProgress:
+    """Recomputes the user's bitmap and counters of the category from UserAnswer."""
+    if questions is None:
+        questions = get_category_questions(category_id)
+
+    with transaction.atomic():
+        # The row is locked before the answers are read, an answer recorded meanwhile can't be left out
+        progress, _ = UserCategoryProgress.objects.select_for_update().get_or_create(user=user, category_id=category_id)
+
+        answered = retry = correct_count = 0
+        answers = UserAnswer.objects.filter(user=user, category_id=category_id).values_list("question_id", "is_active", "is_correct")
+        for question_id, is_active, is_correct in answers:
+            position = questions.position(question_id)
+            if position is None:
+                continue
+            if is_active:
+                answered |= 1 << position
+                correct_count += is_correct
+            else:
+                retry |= 1 << position
+
+        progress.size = len(questions)
+        progress.answered = to_bytes(answered, progress.size)
+        progress.retry = to_bytes(retry, progress.size)
+        progress.order_key = order_key(questions.ids)
+        progress.total_answered = answered.bit_count()
+        progress.correct_count = correct_count
+        progress.save(update_fields=["answered", "retry", "size", "order_key", "total_answered", "correct_count"])
+    return progress
+
+
+def load_bitmap(user: TelegramUser, category_id: int, questions: CategoryQuestions) -> UserCategoryProgress:
+    """The user's progress row with its bitmap over `questions`, rebuilt when missing or built for another question order."""
+    progress = UserCategoryProgress.objects.filter(user=user, category_id=category_id).first()
+    if progress is None or progress.size != len(questions) or progress.order_key != order_key(questions.ids):
+        progress = rebuild_bitmap(user, category_id, questions)
+    return progress
+
+
+def next_question_id(user: TelegramUser, category_id: int) -> int | None:
+    """Questions marked for retry come first, then the first question without an active answer."""
+    questions = get_category_questions(category_id)
+    bitmap = load_bitmap(user, category_id, questions)
+
+    position = first_set_bit(bitmap.retry)
+    if position is None:
+        position = first_zero_bit(bitmap.answered, bitmap.size)
+    return questions.ids[position] if position is not None and position < len(questions) else None
@@ -2,7 +2,10 @@ import telebot
 from telebot.types import InlineKeyboardMarkup, InlineKeyboardButton, Message, CallbackQuery
 from django.conf import settings
 from django.db.models import Count, Q
-from apps.content.models import Test, Category, Question
+from apps.content.models import Test, Category, PDFUpload, Question
+from apps.content.question_order import get_category_questions
+from apps.bot.answers import load_poll_mapping, purge_poll_mappings, record_poll_answer
+from apps.bot.bitmaps import count_bits, load_bitmap, next_question_id, rebuild_bitmap
 from apps.bot.models import TelegramUser, UserCategoryProgress, UserAnswer, PollMapping
 from telebot.apihelper import ApiTelegramException
 
@@ -42,8 +45,8 @@ def show_topics(call: CallbackQuery) -> None:
     user = TelegramUser.objects.get(telegram_id=user_id)
     subject = Test.objects.get(id=subject_id)
 
-    # Optimization: Annotate with question count
-    topics = Category.objects.filter(test=subject).annotate(total_questions=Count("question"))
+    # Question counts are stored on the category by ingestion
+    topics = Category.objects.filter(test=subject)
 
     # Optimization: Fetch all progress for these topics in one query
     progress_qs = UserCategoryProgress.objects.filter(user=user, category__in=topics)
@@ -55,7 +58,7 @@ def show_topics(call: CallbackQuery) -> None:
         prog = progress_map.get(topic.id)
 
         if prog and prog.total_answered > 0:
-            total_q = topic.total_questions
+            total_q = topic.question_count
             btn_text = f"{topic.name} ({prog.total_answered}/{total_q})"
 
             if prog.total_answered >= total_q:
@@ -85,23 +88,12 @@ def get_next_question(user: TelegramUser, category_id: int) -> Question | None:
     Fetches the next question.
     PRIORITY 1: Questions marked for retry (is_active=False)
     PRIORITY 2: New questions (not in UserAnswer with is_active=True)
+    Both are read from the user's answer bitmap of the category instead of joining UserAnswer.
     """
-
-    retry_q = Question.objects.filter(
-        category_id=category_id,
-        useranswer__user=user,
-        useranswer__is_active=False
-    ).select_related("category").defer("explanation").order_by("page_number", "question_number", "id").first()
-
-    if retry_q:
-        return retry_q
-
-    return Question.objects.filter(
-        category_id=category_id
-    ).exclude(
-        useranswer__user=user,
-        useranswer__is_active=True
-    ).select_related("category").defer("explanation").order_by("page_number", "question_number", "id").first()
+    question_id = next_question_id(user, category_id)
+    if question_id is None:
+        return None
+    return Question.objects.select_related("category").defer("explanation").filter(id=question_id).first()
 
 
 @bot.callback_query_handler(func=lambda call: call.data.startswith("topic:"))
@@ -112,10 +104,10 @@ def start_quiz(call: CallbackQuery) -> None:
     user = TelegramUser.objects.get(telegram_id=user_id)
     category = Category.objects.get(id=topic_id)
 
-    total_q = Question.objects.filter(category=category).count()
+    total_q = category.question_count
 
     # Optimization: Use aggregate to fetch all stats in one query
-    stats = UserAnswer.objects.filter(user=user, question__category=category).aggregate(
+    stats = UserAnswer.objects.filter(user=user, category=category).aggregate(
         correct_count=Count("id", filter=Q(is_correct=True, is_active=True)),
         active_mistakes=Count("id", filter=Q(is_correct=False, is_active=True)),
         pending_retries=Count("id", filter=Q(is_correct=False, is_active=False))
@@ -197,8 +189,10 @@ def send_question_card(chat_id: int, question: Question) -> None:
     user = TelegramUser.objects.get(telegram_id=chat_id)
     category = question.category
 
-    total_questions = Question.objects.filter(category=category).count()
-    passed_count = UserAnswer.objects.filter(user=user, question__category=category, is_active=True).count()
+    # Progress comes from the user's answer bitmap over the cached question order
+    total_questions = category.question_count
+    questions = get_category_questions(category.id, category.question_version)
+    passed_count = count_bits(load_bitmap(user, category.id, questions).answered)
 
     # Progress header (plain text for poll)
     header = f"[{passed_count+1}/{total_questions}] {category.name}"
@@ -235,7 +229,9 @@ def send_question_card(chat_id: int, question: Question) -> None:
             reply_markup=markup
         )
 
-        # Store the mapping so we know which question this poll belongs to when answered
+        # Store the mapping so we know which question this poll belongs to when answered,
+        # answered mappings stay until they age out here to keep the answer handler short
+        purge_poll_mappings(user)
         PollMapping.objects.create(
             poll_id=poll_msg.poll.id,
             question=question,
@@ -251,32 +247,17 @@ def send_question_card(chat_id: int, question: Question) -> None:
 @bot.poll_answer_handler()
 def handle_poll_answer(poll_answer: telebot.types.PollAnswer) -> None:
     """Handles the user's interaction with the native poll."""
-    try:
-        mapping = PollMapping.objects.select_related("question", "user", "question__category").get(poll_id=poll_answer.poll_id)
-    except PollMapping.DoesNotExist:
+    mapping = load_poll_mapping(poll_answer.poll_id)
+    if mapping is None:
         return
 
-    user = mapping.user
     question = mapping.question
     selected_idx = poll_answer.option_ids[0]
     selected_option = chr(65 + selected_idx)
     is_correct = (selected_idx == (ord(question.correct_option.upper()) - 65))
 
-    # Record the answer
-    UserAnswer.objects.update_or_create(
-        user=user, question=question,
-        defaults={
-            "selected_option": selected_option,
-            "is_correct": is_correct,
-            "is_active": True
-        }
-    )
-
-    # Update general stats
-    prog, _ = UserCategoryProgress.objects.get_or_create(user=user, category=question.category)
-    prog.total_answered = UserAnswer.objects.filter(user=user, question__category=question.category, is_active=True).count()
-    prog.correct_count = UserAnswer.objects.filter(user=user, question__category=question.category, is_active=True, is_correct=True).count()
-    prog.save()
+    # Record the answer, update general stats and the answer bitmap
+    total_answered = record_poll_answer(mapping, selected_option, is_correct)
 
     # Now update the poll's buttons to show "Next" and "PDF"
     markup = InlineKeyboardMarkup(row_width=1)
@@ -291,22 +272,19 @@ def handle_poll_answer(poll_answer: telebot.types.PollAnswer) -> None:
 
     # PDF Link Button
     site_url = getattr(settings, "SITE_URL", "http://127.0.0.1:8000")
-    pdf_upload = question.category.pdfupload_set.first()
-    if pdf_upload:
-        page_link = f"{site_url}{pdf_upload.file.url}#page={question.page_number}"
+    if mapping.pdf_file:
+        page_link = f"{site_url}{PDFUpload.file.field.storage.url(mapping.pdf_file)}#page={question.page_number}"
         markup.add(InlineKeyboardButton(f"📖 Open PDF (Page {question.page_number})", url=page_link))
 
     markup.add(
         InlineKeyboardButton("🔙 Menu", callback_data="start_menu")
     )
 
-    if prog.total_answered > 1:
+    if total_answered > 1:
         markup.add(InlineKeyboardButton("🔄 Reset Progress", callback_data=f"reset:{question.category.id}"))
 
     try:
-        # Use .only() to fetch only what we need, and delete mapping to keep DB small
         bot.edit_message_reply_markup(mapping.chat_id, mapping.message_id, reply_markup=markup)
-        mapping.delete()
     except Exception as e:
         print(f"Error updating reply markup: {e}")
 
@@ -342,9 +320,9 @@ def handle_next_question(call: CallbackQuery) -> None:
         send_question_card(user_id, question)
     else:
         category = Category.objects.get(id=topic_id)
-        total_q = Question.objects.filter(category=category).count()
-        correct_count = UserAnswer.objects.filter(user=user, question__category=category, is_correct=True, is_active=True).count()
-        mistakes_count = UserAnswer.objects.filter(user=user, question__category=category, is_correct=False, is_active=True).count()
+        total_q = category.question_count
+        correct_count = UserAnswer.objects.filter(user=user, category=category, is_correct=True, is_active=True).count()
+        mistakes_count = UserAnswer.objects.filter(user=user, category=category, is_correct=False, is_active=True).count()
         send_result_screen(user_id, category, correct_count, mistakes_count, total_q)
 
 
@@ -354,10 +332,9 @@ def reset_progress_handler(call: CallbackQuery) -> None:
     user_id = call.from_user.id
     user = TelegramUser.objects.get(telegram_id=user_id)
 
-    UserAnswer.objects.filter(user=user, question__category_id=topic_id).delete()
-    UserCategoryProgress.objects.filter(user=user, category_id=topic_id).update(
-        correct_count=0, total_answered=0
-    )
+    UserAnswer.objects.filter(user=user, category_id=topic_id).delete()
+    # Without answers the rebuilt bitmap and counters are empty
+    rebuild_bitmap(user, topic_id)
 
     bot.answer_callback_query(call.id, "🔄 Full reset complete!")
     call.data = f"topic:{topic_id}"
@@ -373,10 +350,11 @@ def handle_retry_fail(call: CallbackQuery) -> None:
 
         updated_rows = UserAnswer.objects.filter(
             user=user,
-            question__category_id=topic_id,
+            category_id=topic_id,
             is_correct=False,
             is_active=True
         ).update(is_active=False)
+        rebuild_bitmap(user, topic_id)
 
         bot.answer_callback_query(call.id, f"Reloading {updated_rows} questions...")
 
@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand
+
+from apps.bot.bitmaps import rebuild_bitmap
+from apps.bot.models import TelegramUser, UserAnswer
+from apps.content.question_order import CategoryQuestions, get_category_questions
+
+
+class Command(BaseCommand):
+    help = (
+        "Rebuilds the users' answer bitmaps and counters (see UserCategoryProgress) from UserAnswer, for every category a user has "
+        "answered in. Pass telegram ids to limit it to those users."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("telegram_ids", nargs="*", type=int)
+
+    def handle(self, *args, **options):
+        answers = UserAnswer.objects.all()
+        if options["telegram_ids"]:
+            answers = answers.filter(user__telegram_id__in=options["telegram_ids"])
+        pairs = list(answers.values_list("user_id", "category_id").distinct().order_by("category_id"))
+
+        users = TelegramUser.objects.in_bulk({user_id for user_id, _ in pairs})
+        questions: dict[int, CategoryQuestions] = {}
+        for user_id, category_id in pairs:
+            if category_id not in questions:
+                questions[category_id] = get_category_questions(category_id)
+            rebuild_bitmap(users[user_id], category_id, questions[category_id])
+
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {len(pairs)} answer bitmaps."))
@@ -0,0 +1,31 @@
+# Generated by Django 6.0.1 on 2026-10-17 03:45
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bot', '0001_initial'),
+        ('content', '0018_page_metrics'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AnswerBitmap',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('answered', models.BinaryField(default=b'')),
+                ('retry', models.BinaryField(default=b'')),
+                ('size', models.PositiveIntegerField(default=0, help_text='Number of positions the bits cover')),
+                ('order_key', models.BigIntegerField(default=0, help_text='Checksum of the question order the positions refer to')),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('category', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='content.category')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='answer_bitmaps', to='bot.telegramuser')),
+            ],
+            options={
+                'unique_together': {('user', 'category')},
+            },
+        ),
+    ]
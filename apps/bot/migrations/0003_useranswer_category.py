@@ -0,0 +1,20 @@
+# Generated by Django 6.0.1 on 2026-10-17 03:52
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bot', '0002_answer_bitmap'),
+        ('content', '0020_category_question_counts'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='useranswer',
+            name='category',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='content.category'),
+        ),
+    ]
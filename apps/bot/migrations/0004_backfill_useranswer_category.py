@@ -0,0 +1,30 @@
+# Generated by Django 6.0.1 on 2026-10-17 03:52
+
+from django.db import migrations
+from django.db.models import OuterRef, Subquery
+
+# Rows per UPDATE. Each chunk commits on its own, so no long lock is held on the answers table.
+CHUNK_SIZE = 2000
+
+
+def backfill_category(apps, schema_editor):
+    UserAnswer = apps.get_model("bot", "UserAnswer")
+    Question = apps.get_model("content", "Question")
+    category = Subquery(Question.objects.filter(id=OuterRef("question_id")).values("category_id")[:1])
+
+    last_id = UserAnswer.objects.order_by("-id").values_list("id", flat=True).first() or 0
+    for start in range(0, last_id + 1, CHUNK_SIZE):
+        UserAnswer.objects.filter(id__gte=start, id__lt=start + CHUNK_SIZE, category__isnull=True).update(category_id=category)
+
+
+class Migration(migrations.Migration):
+    # Chunks run in autocommit instead of one transaction around the whole table
+    atomic = False
+
+    dependencies = [
+        ('bot', '0003_useranswer_category'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_category, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 6.0.1 on 2026-10-17 03:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bot', '0004_backfill_useranswer_category'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='useranswer',
+            index=models.Index(fields=['user', 'category', 'is_active', 'is_correct'], name='bot_userans_user_id_42bc63_idx'),
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 6.0.1 on 2026-10-17 04:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bot', '0005_useranswer_stats_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='usercategoryprogress',
+            name='answered',
+            field=models.BinaryField(default=b''),
+        ),
+        migrations.AddField(
+            model_name='usercategoryprogress',
+            name='order_key',
+            field=models.BigIntegerField(default=0, help_text='Checksum of the question order the positions refer to'),
+        ),
+        migrations.AddField(
+            model_name='usercategoryprogress',
+            name='retry',
+            field=models.BinaryField(default=b''),
+        ),
+        migrations.AddField(
+            model_name='usercategoryprogress',
+            name='size',
+            field=models.PositiveIntegerField(default=0, help_text='Number of positions the bits cover'),
+        ),
+        migrations.DeleteModel(
+            name='AnswerBitmap',
+        ),
+    ]
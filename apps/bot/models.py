@@ -22,6 +22,14 @@ class UserCategoryProgress(models.Model):
     total_answered = models.IntegerField(default=0)
     is_completed = models.BooleanField(default=False)
 
+    # Bitsets over the category's ordered question positions, a derived copy of UserAnswer (see
+    # apps/bot/bitmaps.py). Bit i of `answered` is set when the question at position i has an active
+    # answer, bit i of `retry` when it is marked for retry.
+    answered = models.BinaryField(default=b"")
+    retry = models.BinaryField(default=b"")
+    size = models.PositiveIntegerField(default=0, help_text="Number of positions the bits cover")
+    order_key = models.BigIntegerField(default=0, help_text="Checksum of the question order the positions refer to")
+
     class Meta:
         unique_together = ("user", "category")
 
@@ -30,9 +38,12 @@ class UserCategoryProgress(models.Model):
         self.correct_count = 0
         self.total_answered = 0
         self.is_completed = False
-        self.save(update_fields=["correct_count", "total_answered", "is_completed"])
+        # An empty bitmap no longer matches the question order and is rebuilt on the next lookup
+        self.answered = self.retry = b""
+        self.size = self.order_key = 0
+        self.save(update_fields=["correct_count", "total_answered", "is_completed", "answered", "retry", "size", "order_key"])
         # Delete detailed logs
-        UserAnswer.objects.filter(user=self.user, question__category=self.category).delete()
+        UserAnswer.objects.filter(user=self.user, category=self.category).delete()
 
     def __str__(self) -> str:
         return f"{self.user} - {self.category}"
@@ -42,6 +53,8 @@ class UserAnswer(models.Model):
     """Tracks every single click (History Log)"""
     user = models.ForeignKey(TelegramUser, on_delete=models.CASCADE, related_name="attempts")
     question = models.ForeignKey(Question, on_delete=models.CASCADE)
+    # Copy of question.category, the stats queries filter on it without joining Question
+    category = models.ForeignKey(Category, on_delete=models.CASCADE, null=True, related_name="+")
 
     selected_option = models.CharField(max_length=1)
     is_correct = models.BooleanField()
@@ -53,8 +66,14 @@ class UserAnswer(models.Model):
         indexes = [
             models.Index(fields=["user", "is_correct"]),
             models.Index(fields=["user", "is_active"]),
+            models.Index(fields=["user", "category", "is_active", "is_correct"]),
         ]
 
+    def save(self, *args, **kwargs) -> None:
+        if self.category_id is None:
+            self.category_id = self.question.category_id
+        super().save(*args, **kwargs)
+
     def __str__(self) -> str:
         return f"{self.user} - Q{self.question.id}"
 
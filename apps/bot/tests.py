@@ -1,3 +1,193 @@
-# from django.test import TestCases
+from contextlib import nullcontext
+from datetime import timedelta
+from importlib import import_module
+from types import SimpleNamespace
+from unittest import mock
 
-# Create your tests here.
+from django.apps import apps as django_apps
+from django.core.cache import cache
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, TransactionTestCase
+from django.utils import timezone
+
+from apps.bot.answers import POLL_MAPPING_MAX_AGE, load_poll_mapping, purge_poll_mappings, record_poll_answer
+from apps.bot.bitmaps import count_bits, first_set_bit, first_zero_bit, rebuild_bitmap, with_bit
+from apps.bot.bot import get_next_question, handle_poll_answer
+from apps.bot.models import PollMapping, TelegramUser, UserAnswer, UserCategoryProgress
+from apps.content.models import Category, Question, Test
+from apps.content.question_order import bump_question_version
+
+
+class BitHelperTests(SimpleTestCase):
+    def test_first_zero_and_first_set_bit(self):
+        bits = b""
+        for position in (0, 1, 2, 9):
+            bits = with_bit(bits, position, 12, True)
+
+        self.assertEqual(len(bits), 2)
+        self.assertEqual(first_zero_bit(bits, 12), 3)
+        self.assertEqual(first_set_bit(bits), 0)
+        self.assertEqual(first_set_bit(with_bit(bits, 0, 12, False)), 1)
+        self.assertIsNone(first_zero_bit(b"\xff\x0f", 12))
+        self.assertIsNone(first_set_bit(b"\x00\x00"))
+
+
+class QuizFixture:
+    """
+    A user and the HEMATOLOJİ category, with an empty question order cache. Created in setUp rather
+    than setUpTestData so that TransactionTestCase classes can use it too.
+    """
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.user = TelegramUser.objects.create(telegram_id=1)
+        self.category = Category.objects.create(test=Test.objects.create(name="DAHİLİYE"), name="HEMATOLOJİ")
+
+
+class AnswerBitmapTests(QuizFixture, TestCase):
+    def setUp(self):
+        super().setUp()
+        # Created out of order, the quiz walks them by page then question number
+        self.q3 = self.make_question(page=2, number=1)
+        self.q1 = self.make_question(page=1, number=1)
+        self.q2 = self.make_question(page=1, number=2)
+
+    def make_question(self, page, number):
+        question = Question.objects.create(
+            category=self.category, question_number=number, page_number=page,
+            text=f"Q{page}.{number}", options=["A) a", "B) b"], correct_option="A"
+        )
+        bump_question_version(self.category.id)
+        return question
+
+    def answer(self, question, is_correct=True, is_active=True):
+        UserAnswer.objects.update_or_create(
+            user=self.user, question=question,
+            defaults={"selected_option": "A", "is_correct": is_correct, "is_active": is_active}
+        )
+
+    def test_next_question_follows_answers_and_retries(self):
+        # Existing answers without a bitmap are picked up by the first lookup
+        self.answer(self.q1)
+        self.assertEqual(get_next_question(self.user, self.category.id), self.q2)
+
+        bitmap = UserCategoryProgress.objects.get(user=self.user, category=self.category)
+        self.assertEqual(first_zero_bit(bitmap.answered, bitmap.size), 1)
+        self.assertEqual(bitmap.total_answered, 1)
+
+        # Marked for retry in UserAnswer, the bitmap is rebuilt from it
+        self.answer(self.q2, is_correct=False, is_active=False)
+        rebuild_bitmap(self.user, self.category.id)
+        self.assertEqual(get_next_question(self.user, self.category.id), self.q2)
+
+        self.answer(self.q2)
+        rebuild_bitmap(self.user, self.category.id)
+        self.assertEqual(get_next_question(self.user, self.category.id), self.q3)
+
+        self.answer(self.q3)
+        rebuild_bitmap(self.user, self.category.id)
+        self.assertIsNone(get_next_question(self.user, self.category.id))
+
+    def test_bitmap_is_rebuilt_when_the_question_order_changes(self):
+        self.answer(self.q1)
+        self.answer(self.q2)
+        self.assertEqual(get_next_question(self.user, self.category.id), self.q3)
+
+        new_first = self.make_question(page=0, number=1)
+        self.assertEqual(get_next_question(self.user, self.category.id), new_first)
+
+        bitmap = UserCategoryProgress.objects.get(user=self.user, category=self.category)
+        self.assertEqual((bitmap.size, first_set_bit(bitmap.answered)), (4, 1))
+
+
+class PollAnswerFixture(QuizFixture):
+    def setUp(self):
+        super().setUp()
+        self.questions = [
+            Question.objects.create(
+                category=self.category, question_number=n, page_number=1, text=f"Q{n}", options=["A) a", "B) b"], correct_option="A"
+            )
+            for n in range(1, 4)
+        ]
+        bump_question_version(self.category.id)
+
+    def answer(self, question, option_id, queries=None):
+        """Sends the poll answer through the handler, `queries` is the exact number it may run."""
+        poll_id = f"p{question.id}-{option_id}"
+        PollMapping.objects.create(poll_id=poll_id, question=question, user=self.user, chat_id=1, message_id=1)
+        with mock.patch("apps.bot.bot.bot") as telegram, self.assertNumQueries(queries) if queries is not None else nullcontext():
+            handle_poll_answer(SimpleNamespace(poll_id=poll_id, option_ids=[option_id]))
+        telegram.edit_message_reply_markup.assert_called_once()
+
+
+class PollAnswerQueryBudgetTests(PollAnswerFixture, TransactionTestCase):
+    """
+    Runs in a real transaction, without the savepoints of TestCase. SQLite logs the BEGIN and
+    COMMIT of the answer's transaction as two statements, MySQL does not.
+    """
+
+    def test_answer_handler_query_budget(self):
+        # The category's first answer builds the progress row from UserAnswer
+        self.answer(self.questions[0], 1)
+
+        # Warm path: the mapping read, then the progress UPDATE and the answer upsert
+        self.answer(self.questions[1], 0, queries=3 + 2)
+
+        # A cold question order cache adds the read of the category's ordered ids
+        cache.clear()
+        self.answer(self.questions[2], 1, queries=4 + 2)
+
+        # Answering again moves the counters by the difference to the previous answer
+        PollMapping.objects.create(poll_id="p", question=self.questions[0], user=self.user, chat_id=1, message_id=1)
+        mapping = load_poll_mapping("p")
+        with self.assertNumQueries(2 + 2):
+            self.assertEqual(record_poll_answer(mapping, "A", True), 3)
+
+        progress = UserCategoryProgress.objects.get(user=self.user, category=self.category)
+        self.assertEqual((progress.total_answered, progress.correct_count, count_bits(progress.answered)), (3, 2, 3))
+        self.assertEqual(dict(UserAnswer.objects.values_list("question_id", "is_correct")), {
+            self.questions[0].id: True, self.questions[1].id: True, self.questions[2].id: False
+        })
+
+
+class PollAnswerTests(PollAnswerFixture, TestCase):
+    def test_upsert_leaves_out_the_conflict_target_where_the_backend_takes_none(self):
+        # As on MySQL, where bulk_create refuses unique_fields
+        with mock.patch.object(connection.features, "supports_update_conflicts_with_target", False):
+            self.answer(self.questions[0], 0)
+        self.assertTrue(UserAnswer.objects.filter(question=self.questions[0], is_correct=True).exists())
+
+    def test_stale_bitmap_falls_back_to_a_rebuild(self):
+        self.answer(self.questions[0], 0)
+        PollMapping.objects.create(poll_id="p", question=self.questions[1], user=self.user, chat_id=1, message_id=1)
+        mapping = load_poll_mapping("p")
+
+        # Another answer lands between the mapping read and the write
+        self.answer(self.questions[2], 1)
+        self.assertEqual(record_poll_answer(mapping, "A", True), 3)
+
+        progress = UserCategoryProgress.objects.get(user=self.user, category=self.category)
+        self.assertEqual((progress.total_answered, progress.correct_count, count_bits(progress.answered)), (3, 2, 3))
+
+    def test_mappings_are_purged_once_they_age_out(self):
+        for poll_id in ("old", "new"):
+            PollMapping.objects.create(poll_id=poll_id, question=self.questions[0], user=self.user, chat_id=1, message_id=1)
+        PollMapping.objects.filter(poll_id="old").update(created_at=timezone.now() - POLL_MAPPING_MAX_AGE - timedelta(minutes=1))
+
+        self.assertEqual(purge_poll_mappings(self.user), 1)
+        self.assertEqual(list(PollMapping.objects.values_list("poll_id", flat=True)), ["new"])
+
+
+class UserAnswerCategoryTests(QuizFixture, TestCase):
+    def test_backfill_copies_the_question_category_in_chunks(self):
+        for n in range(5):
+            question = Question.objects.create(category=self.category, page_number=1, text=f"Q{n}", options=["A) a"], correct_option="A")
+            UserAnswer.objects.create(user=self.user, question=question, selected_option="A", is_correct=True)
+        self.assertEqual(UserAnswer.objects.filter(category=self.category).count(), 5)
+
+        UserAnswer.objects.update(category=None)
+        backfill = import_module("apps.bot.migrations.0004_backfill_useranswer_category")
+        with mock.patch.object(backfill, "CHUNK_SIZE", 2):
+            backfill.backfill_category(django_apps, None)
+        self.assertEqual(UserAnswer.objects.filter(category=self.category).count(), 5)
@@ -1,9 +1,15 @@
 from django.contrib import admin
 from django.contrib import messages
+from django.db.models import F, Max, Min
 from django.http import HttpRequest
+from django.template.response import TemplateResponse
+from django.urls import path
 
-from apps.content.models import Test, Category, PDFUpload, Question
-from apps.content.services import launch_detached_worker
+from apps.content.constants import INGEST_MANUAL_PRIORITY, METRICS_WINDOW_PAGES
+from apps.content.metrics import STAGE_FIELDS, format_minutes, pdf_metrics
+from apps.content.models import Test, Category, PDFUpload, Question, PageResult, LLMResponseCache, IngestJob, JSONRepair, PageTriage, ParserCheckpoint, FailedPage
+from apps.content.question_order import recount_questions
+from apps.content.services import enqueue_failed_page_retries, enqueue_pdf_batches, enqueue_reprocess
 
 
 @admin.register(Test)
@@ -13,8 +19,9 @@ class TestAdmin(admin.ModelAdmin):
 
 @admin.register(Category)
 class CategoryAdmin(admin.ModelAdmin):
-    list_display = ("name", "test")
+    list_display = ("name", "test", "question_count")
     list_filter = ("test",)
+    readonly_fields = ("question_count", "subcategory_counts")
 
 
 @admin.register(Question)
@@ -33,12 +40,166 @@ class QuestionAdmin(admin.ModelAdmin):
     def short_text(self, obj: Question) -> str:
         return f"{obj.text[:50]}..."
 
+    # Hand edits change the quiz order and the question counts too
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        category_ids = {obj.category_id}
+        if change and "category" in form.changed_data:
+            category_ids.add(form.initial["category"])
+            # Answers keep a copy of their question's category
+            obj.useranswer_set.update(category_id=obj.category_id)
+        self.questions_changed(category_ids)
+
+    def delete_model(self, request, obj):
+        super().delete_model(request, obj)
+        self.questions_changed({obj.category_id})
+
+    def delete_queryset(self, request, queryset):
+        category_ids = set(queryset.values_list("category_id", flat=True))
+        super().delete_queryset(request, queryset)
+        self.questions_changed(category_ids)
+
+    @staticmethod
+    def questions_changed(category_ids: set[int]) -> None:
+        Category.objects.filter(id__in=category_ids).update(question_version=F("question_version") + 1)
+        recount_questions(category_ids)
+
+
+@admin.register(PageResult)
+class PageResultAdmin(admin.ModelAdmin):
+    list_display = ("pdf", "page_number", "source", "model_name", "from_cache", "prompt_tokens", "completion_tokens", "llm_seconds", "model_tier", "repaired_items", "failed_items")
+    list_filter = ("pdf", "source", "from_cache", "model_tier")
+    ordering = ("pdf", "page_number")
+    actions = ("reprocess_pages",)
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def get_actions(self, request):
+        actions = super().get_actions(request)
+
+        if not request.user.is_superuser:
+            actions.pop("reprocess_pages", None)
+
+        return actions
+
+    @admin.action(description="🔁 Reprocess Pages (First to Last Selected, Fresh Model Calls)")
+    def reprocess_pages(self, request, queryset):
+        ranges = queryset.values("pdf_id").annotate(first=Min("page_number"), last=Max("page_number"))
+
+        for page_range in ranges:
+            pdf = PDFUpload.objects.get(id=page_range["pdf_id"])
+            try:
+                # Waits for the PDF's lease and for ingestion to move past the range, like any queued range
+                job = enqueue_reprocess(pdf, page_range["first"] - 1, page_range["last"], priority=INGEST_MANUAL_PRIORITY)
+            except ValueError as e:
+                self.message_user(request, f"⚠️ {pdf.title}: {e}", level=messages.WARNING)
+                continue
+
+            self.message_user(
+                request,
+                f"📥 Queued {pdf.title} Pages {job.start_page + 1}-{job.end_page} for reprocessing. Only their questions are replaced.",
+                level=messages.INFO
+            )
+
+
+@admin.register(FailedPage)
+class FailedPageAdmin(admin.ModelAdmin):
+    list_display = ("pdf", "page_number", "error_class", "status", "attempts", "next_retry_at", "updated_at")
+    list_filter = ("status", "error_class", "pdf")
+    readonly_fields = ("pdf", "page_number", "error_class", "error", "payload", "attempts", "status", "next_retry_at", "created_at", "updated_at", "resolved_at")
+    ordering = ("pdf", "page_number")
+    actions = ("retry_now", "give_up")
+
+    def has_add_permission(self, request):
+        return False
+
+    @admin.action(description="🔁 Retry Now (Fresh Model Calls, Background)")
+    def retry_now(self, request, queryset):
+        jobs = enqueue_failed_page_retries(queryset.exclude(status=FailedPage.STATUS_RESOLVED), priority=INGEST_MANUAL_PRIORITY)
+        self.message_user(request, f"📥 Queued {len(jobs)} page ranges for reprocessing.", level=messages.INFO)
+
+    @admin.action(description="🛑 Give Up (No More Automatic Retries)")
+    def give_up(self, request, queryset):
+        updated = queryset.filter(status=FailedPage.STATUS_PENDING).update(status=FailedPage.STATUS_GAVE_UP, next_retry_at=None)
+        self.message_user(request, f"Stopped retrying {updated} pages.", level=messages.INFO)
+
+
+@admin.register(JSONRepair)
+class JSONRepairAdmin(admin.ModelAdmin):
+    list_display = ("pdf", "page_number", "method", "succeeded", "truncated", "created_at")
+    list_filter = ("method", "succeeded", "truncated", "pdf")
+    ordering = ("-id",)
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(PageTriage)
+class PageTriageAdmin(admin.ModelAdmin):
+    list_display = ("pdf", "page_number", "kind", "duplicate_of", "override", "skipped", "text_chars", "ink_coverage")
+    list_filter = ("kind", "override", "pdf")
+    readonly_fields = ("pdf", "page_number", "kind", "duplicate_of", "text_chars", "ink_coverage", "phash", "text_hash", "updated_at")
+    ordering = ("pdf", "page_number")
+    actions = ("force_process", "force_skip", "clear_override")
+
+    def has_add_permission(self, request):
+        return False
+
+    @admin.display(description="Skipped", boolean=True)
+    def skipped(self, obj: PageTriage) -> bool:
+        return obj.should_skip
+
+    def _set_override(self, request: HttpRequest, queryset, override: str) -> None:
+        updated = queryset.update(override=override)
+        self.message_user(request, f"Updated {updated} pages. Pages already processed are only affected when reprocessed.", level=messages.INFO)
+
+    @admin.action(description="✅ Always process these pages")
+    def force_process(self, request, queryset):
+        self._set_override(request, queryset, PageTriage.OVERRIDE_PROCESS)
+
+    @admin.action(description="⏭️ Always skip these pages")
+    def force_skip(self, request, queryset):
+        self._set_override(request, queryset, PageTriage.OVERRIDE_SKIP)
+
+    @admin.action(description="↩️ Use the automatic decision")
+    def clear_override(self, request, queryset):
+        self._set_override(request, queryset, "")
+
+
+@admin.register(LLMResponseCache)
+class LLMResponseCacheAdmin(admin.ModelAdmin):
+    list_display = ("cache_key", "model_name", "hit_count", "created_at")
+    list_filter = ("model_name",)
+    readonly_fields = ("cache_key", "model_name", "response", "hit_count", "created_at")
+
+
+@admin.register(IngestJob)
+class IngestJobAdmin(admin.ModelAdmin):
+    list_display = ("id", "pdf", "kind", "pages", "priority", "status", "attempts", "created_at", "started_at", "finished_at")
+    list_filter = ("status", "kind", "pdf")
+    readonly_fields = ("pdf", "kind", "start_page", "end_page", "use_cache", "status", "attempts", "result", "created_at", "started_at", "finished_at")
+    ordering = ("-id",)
+
+    def has_add_permission(self, request):
+        return False
+
+    @admin.display(description="Pages")
+    def pages(self, obj: IngestJob) -> str:
+        return f"{obj.start_page + 1}-{obj.end_page}"
+
 
 @admin.register(PDFUpload)
 class PDFUploadAdmin(admin.ModelAdmin):
-    list_display = ("title", "category", "file_completion_status", "is_processing", "last_processed_page", "total_pages")
-    readonly_fields = ("parser_state", "total_pages")
-    actions = ("process_batch_5", "process_batch_10", "reset_pdf_status")
+    list_display = ("title", "category", "file_completion_status", "processing", "last_processed_page", "total_pages", "upload_savings")
+    readonly_fields = ("parser_state", "total_pages", "encoding_stats", "lease_owner", "lease_expires_at")
+    actions = ("process_batch_auto", "process_batch_5", "process_batch_10", "reset_pdf_status")
 
     def get_readonly_fields(self, request, obj=None):
         fields = super().get_readonly_fields(request, obj)
@@ -55,7 +216,7 @@ class PDFUploadAdmin(admin.ModelAdmin):
         actions = super().get_actions(request)
 
         if not request.user.is_superuser:
-            for action in ("process_batch_5", "process_batch_10", "reset_pdf_status"):
+            for action in ("process_batch_auto", "process_batch_5", "process_batch_10", "reset_pdf_status"):
                 actions.pop(action, None)
 
         return actions
@@ -92,21 +253,67 @@ class PDFUploadAdmin(admin.ModelAdmin):
 
         return "⏳ 0%"
 
-    def _process_batch(self, request: HttpRequest, queryset, batch_size: int) -> None:
-        valid_ids = list(queryset.filter(is_processing=False).values_list("id", flat=True))
-        all_selected_ids = list(queryset.values_list("id", flat=True))
-        busy_ids = list(set(all_selected_ids) - set(valid_ids))
-
-        if valid_ids:
-            # Lock them immediately
-            PDFUpload.objects.filter(id__in=valid_ids).update(is_processing=True)
-
-            launch_detached_worker(pdf_ids=valid_ids, batch_size=batch_size)
-
-            self.message_user(request, f"🚀 OS Background Worker started for {len(valid_ids)} PDFs (Batch {batch_size}).", level=messages.INFO)
-
-        if busy_ids:
-            self.message_user(request, f"⚠️ Skipped {len(busy_ids)} busy PDFs.", level=messages.WARNING)
+    @admin.display(description="Processing", boolean=True)
+    def processing(self, obj: PDFUpload) -> bool:
+        return obj.has_active_lease()
+
+    def get_urls(self):
+        urls = [
+            path("metrics/", self.admin_site.admin_view(self.metrics_view), name="content_pdfupload_metrics"),
+        ]
+        return urls + super().get_urls()
+
+    def metrics_view(self, request: HttpRequest) -> TemplateResponse:
+        """Throughput, ETA, per-stage p50/p95 and tokens per question of every PDF, see apps.content.metrics."""
+        rows = []
+        for pdf in PDFUpload.objects.filter(last_processed_page__gt=0).select_related("category").order_by("id"):
+            metrics = pdf_metrics(pdf)
+            rows.append({
+                "pdf": pdf,
+                "metrics": metrics,
+                "eta": format_minutes(metrics.eta_minutes) if pdf.last_processed_page < pdf.total_pages else "✅",
+                "stages": [metrics.stages[stage] for stage in STAGE_FIELDS],
+                "upload_mb": metrics.upload_bytes / 1024 / 1024,
+            })
+
+        context = {
+            **self.admin_site.each_context(request),
+            "title": "Ingestion Metrics",
+            "opts": self.model._meta,
+            "rows": rows,
+            "stage_names": list(STAGE_FIELDS),
+            "window_pages": METRICS_WINDOW_PAGES,
+        }
+        return TemplateResponse(request, "admin/content/pdfupload/metrics.html", context)
+
+    @admin.display(description="Upload Saved")
+    def upload_savings(self, obj: PDFUpload) -> str:
+        pages = (obj.encoding_stats or {}).values()
+        original = sum(p["original_bytes"] for p in pages)
+        encoded = sum(p["encoded_bytes"] for p in pages)
+
+        if not original:
+            return "-"
+
+        return f"{(original - encoded) / 1024 / 1024:.1f} MB ({int((1 - encoded / original) * 100)}%, {obj.image_encoding})"
+
+    def _process_batch(self, request: HttpRequest, queryset, batch_size: int | None) -> None:
+        pending_ids = list(queryset.filter(last_processed_page__lt=F("total_pages")).values_list("id", flat=True))
+        finished_count = queryset.count() - len(pending_ids)
+
+        if pending_ids:
+            # Queued behind what is already queued for each PDF, but ahead of the cron backlog
+            jobs = enqueue_pdf_batches(pdf_ids=pending_ids, batch_size=batch_size, priority=INGEST_MANUAL_PRIORITY)
+
+            sizes = ", ".join(f"{job.pdf.title}: {job.end_page - job.start_page}" for job in jobs)
+            self.message_user(request, f"📥 Queued {len(jobs)} page ranges for the ingest workers ({sizes} pages).", level=messages.INFO)
+
+        if finished_count:
+            self.message_user(request, f"⚠️ Skipped {finished_count} finished PDFs.", level=messages.WARNING)
+
+    @admin.action(description="⚡ Process Next Batch (Sized from Page Latency, Background)")
+    def process_batch_auto(self, request, queryset):
+        self._process_batch(request, queryset, None)
 
     @admin.action(description="⚡ Process Next Batch (5 Pages, Background)")
     def process_batch_5(self, request, queryset):
@@ -118,20 +325,28 @@ class PDFUploadAdmin(admin.ModelAdmin):
 
     @admin.action(description="🔥 Reset Status & Delete Questions")
     def reset_pdf_status(self, request, queryset):
-        valid_ids = list(queryset.filter(is_processing=False).values_list("id", flat=True))
-        all_selected_ids = list(queryset.values_list("id", flat=True))
-        busy_ids = list(set(all_selected_ids) - set(valid_ids))
+        busy_ids = [pdf.id for pdf in queryset if pdf.has_active_lease()]
+        valid_ids = list(queryset.exclude(id__in=busy_ids).values_list("id", flat=True))
 
         if valid_ids:
             valid_queryset = queryset.filter(id__in=valid_ids)
             category_ids = valid_queryset.values_list("category_id", flat=True)
 
             deleted_count, _ = Question.objects.filter(category_id__in=category_ids).delete()
+            Category.objects.filter(id__in=category_ids).update(
+                question_version=F("question_version") + 1, question_count=0, subcategory_counts={}
+            )
+            IngestJob.objects.filter(pdf_id__in=valid_ids).delete()
+            ParserCheckpoint.objects.filter(pdf_id__in=valid_ids).delete()
+            FailedPage.objects.filter(pdf_id__in=valid_ids).delete()
 
             valid_queryset.update(
                 last_processed_page=0,
                 is_processing=False,
-                parser_state={}
+                lease_owner="",
+                lease_expires_at=None,
+                parser_state={},
+                encoding_stats={}
             )
 
             self.message_user(
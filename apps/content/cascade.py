@@ -0,0 +1,91 @@
+from collections.abc import Iterable
+from dataclasses import dataclass, field
+from typing import Any
+
+from apps.content.constants import CASCADE_ENABLED, MODEL_TIERS, VALIDATION_MIN_OPTIONS
+from apps.content.parsers import as_question_number
+
+
+@dataclass(frozen=True)
+class ModelTier:
+    name: str
+    model: str
+    text_model: str
+
+
+def get_tiers() -> list[ModelTier]:
+    """The configured cascade, only the first tier when the cascade is off."""
+    tiers = [ModelTier(**tier) for tier in MODEL_TIERS]
+    return tiers if CASCADE_ENABLED else tiers[:1]
+
+
+@dataclass
+class TierAttempt:
+    tier: str
+    model_name: str
+    passed: bool
+    seconds: float | None
+    problems: list[str] = field(default_factory=list)
+
+
+def validate_page_items(items: Iterable[dict[str, Any]], failed_items: int = 0) -> list[str]:
+    """
+    Sanity checks on the items of one page, an empty list means the page passed.
+    Only complete questions are checked: option count, correct_option within the options,
+    no empty text, and question numbers that never go backwards in reading order.
+    """
+    problems = []
+    if failed_items:
+        problems.append(f"{failed_items} items could not be decoded")
+
+    last_number = None
+    for item in items:
+        if item.get("type") != "question" or item.get("is_incomplete"):
+            continue
+
+        number = as_question_number(item.get("question_number"))
+        label = f"Q{number}" if number is not None else "Unnumbered question"
+
+        if not (item.get("question") or "").strip():
+            problems.append(f"{label} has no text")
+
+        options = [option for option in item.get("options") or [] if option and option.strip()]
+        if len(options) < VALIDATION_MIN_OPTIONS:
+            problems.append(f"{label} has {len(options)} options")
+
+        correct_option = str(item.get("correct_option") or "").strip().upper()
+        if correct_option and correct_option != "?":
+            index = ord(correct_option[0]) - ord("A")
+            if not 0 <= index < len(options):
+                problems.append(f"{label} has correct_option {correct_option} outside its {len(options)} options")
+
+        if number is not None:
+            # Boxed variants repeat the number of their main question
+            if last_number is not None and number < last_number:
+                problems.append(f"Q{number} follows Q{last_number}")
+            last_number = number
+
+    return problems
+
+
+class CascadeStats:
+    """Per-tier pass rate and latency of a batch."""
+
+    def __init__(self) -> None:
+        self.attempts: dict[str, list[TierAttempt]] = {}
+
+    def record(self, attempts: Iterable[TierAttempt]) -> None:
+        for attempt in attempts:
+            self.attempts.setdefault(attempt.tier, []).append(attempt)
+
+    def summary(self) -> str:
+        if not self.attempts:
+            return "No model calls"
+
+        parts = []
+        for tier, attempts in self.attempts.items():
+            passed = sum(attempt.passed for attempt in attempts)
+            timings = [attempt.seconds for attempt in attempts if attempt.seconds is not None]
+            latency = f", avg {sum(timings) / len(timings):.1f}s" if timings else ""
+            parts.append(f"tier {tier} passed {passed}/{len(attempts)}{latency}")
+        return "Cascade: " + ", ".join(parts)
@@ -1,9 +1,7 @@
-MAX_FILE_SIZE = 5 * 1024 * 1024
-
 GITHUB_API_BASE = "https://api.github.com"
 MODEL_NAME = "meta-llama/llama-4-scout-17b-16e-instruct"
 
-QUIZ_PROMPT = """
+QUIZ_PAGE_READING = """
 You are an expert medical exam transcriptionist processing a page from a Turkish medical textbook.
 The page has a complex two-column layout, containing questions, images, nested boxes, and explanations.
 
@@ -12,7 +10,21 @@ The page has a complex two-column layout, containing questions, images, nested b
 2. Then read the **Right Column** strictly from Top to Bottom.
 3. **Subcategory Scope:** A header title (e.g., "HEMATOPOEZ") ONLY applies to questions below it in the SAME column.
 
-### PART 1: HANDLING COMPLEX QUESTION FORMATS (CRITICAL)
+"""
+
+# Reading instructions for one cropped column, used by the "columns" layout mode (see PDFUpload.layout_mode)
+QUIZ_COLUMN_READING = """
+You are an expert medical exam transcriptionist processing ONE column of a two-column page from a Turkish medical textbook.
+The image is a crop of the page holding either its left or its right column, with questions, images, nested boxes, and explanations.
+
+### CRITICAL READING STRATEGY
+1. Read the column strictly from Top to Bottom.
+2. Text at the very top of the column may continue a question from the previous column or page. If it has no new question number, mark it as `"type": "fragment"`.
+3. A header that spans both columns may be cut at the edge of the image. Use it as the subcategory only if it is readable.
+
+"""
+
+QUIZ_EXTRACTION_RULES = """### PART 1: HANDLING COMPLEX QUESTION FORMATS (CRITICAL)
 - **Questions Split by Images (e.g., Q24):** If a question starts with text, is interrupted by a medical image/diagram, and continues below the image, you MUST combine the text before AND after the image into a single `question` string. Do not skip the introductory text above the image.
 - **Main Questions vs. Boxed Variants (e.g., Q23):** * Extract the MAIN numbered question FIRST.
   * If you see a box containing "Bu soru, başka bir hoca tarafından şöyle de sorulabilirdi:", extract the content inside that box as a COMPLETELY SEPARATE question.
@@ -59,8 +71,7 @@ If you find a paragraph ending with or containing "Doğru cevap: [X]" that is NO
     "question": "Ateş, böbrek fonksiyon bozukluğu... saptanması...",
     "options": ["A) ...", "B) ..."],
     "correct_option": "C",
-    "explanation": "Kutu içi alternatif sorunun açıklaması...",
-    "is_variant": true
+    "explanation": "Kutu içi alternatif sorunun açıklaması..."
   },
   {
     "type": "explanation_only",
@@ -76,5 +87,192 @@ If you find a paragraph ending with or containing "Doğru cevap: [X]" that is NO
 - CRITICAL: Do NOT use Unicode escape sequences (like \u00fc) for Turkish characters. Output the raw UTF-8 characters directly (e.g., write 'ü' instead of '\u00fc').
 """
 
+QUIZ_PROMPT = QUIZ_PAGE_READING + QUIZ_EXTRACTION_RULES
+QUIZ_COLUMN_PROMPT = QUIZ_COLUMN_READING + QUIZ_EXTRACTION_RULES
+
+QUIZ_TEXT_PROMPT = """
+You are an expert medical exam transcriptionist processing the extracted text layer of a page from a Turkish medical textbook.
+The page has a two-column layout. The text below is already in reading order: the Left Column top to bottom, then the Right Column top to bottom.
+Headers that span both columns appear where they occur on the page.
+
+Apply exactly the same extraction rules as for page images:
+- Each numbered question with multiple-choice options becomes `"type": "question"` with `question_number`, `question`, `options`, `correct_option` (letter only, from "Doğru cevap: X"), `subcategory` and `explanation`.
+- Boxed variants introduced by "Bu soru, başka bir hoca tarafından şöyle de sorulabilirdi:" are SEPARATE questions with the same `question_number` as the main question. Never let a variant replace the main question.
+- A paragraph with "Doğru cevap: [X]" that is not attached to a question is `"type": "explanation_only"` with `"linked_question_number"`.
+- Text at the very top of the page that continues a question from the previous page is `"type": "fragment"`.
+- Set `"is_incomplete": true` if a question or its options are cut off at the end of the page.
+- Numbered lists of facts without options or answers are NOT questions.
+
+### IMPORTANT:
+- Return ONLY the raw JSON list, in the same format as for page images.
+- Do NOT use markdown formatting or add any conversational text.
+- Escape internal double-quotes and do NOT use Unicode escape sequences for Turkish characters.
+"""
+
 TEMPERATURE = 0.1
 MAX_TOKENS = 4096
+
+RENDER_DPI = 300
+
+# Pipelined batch processing: number of vision calls in flight at once and
+# number of processes rasterizing pages ahead of them. 1 = strictly sequential.
+PIPELINE_CONCURRENCY = 3
+RENDER_WORKERS = 2
+
+# Rendered page image cache, least recently used files are evicted above this size
+PAGE_CACHE_MAX_BYTES = 2 * 1024 * 1024 * 1024
+
+# Image encoding applied between get_pixmap and the vision call, selectable per PDF.
+# max_pixels downsizes large renders, max_bytes is the per-request budget: quality is lowered
+# in QUALITY_STEP steps down to MIN_QUALITY, then the image is shrunk until it fits.
+# Pages go out as the lossless rendered PNG unless a lossy profile is chosen for the PDF, those
+# trade recognition accuracy for upload size and have to be checked per book.
+IMAGE_ENCODING_PROFILES = {
+    "png": {"format": "png", "quality": None, "grayscale": False, "max_pixels": None, "max_bytes": None},
+    "png_gray": {"format": "png", "quality": None, "grayscale": True, "max_pixels": None, "max_bytes": 3 * 1024 * 1024},
+    "jpeg": {"format": "jpeg", "quality": 85, "grayscale": False, "max_pixels": 2500 * 3500, "max_bytes": 3 * 1024 * 1024},
+    "jpeg_gray": {"format": "jpeg", "quality": 80, "grayscale": True, "max_pixels": 2500 * 3500, "max_bytes": 2 * 1024 * 1024},
+    "webp_gray": {"format": "webp", "quality": 75, "grayscale": True, "max_pixels": 2500 * 3500, "max_bytes": 1024 * 1024},
+}
+DEFAULT_IMAGE_ENCODING = "png"
+QUALITY_STEP = 10
+MIN_QUALITY = 40
+
+# Layout mode, selectable per PDF. "columns" finds the gutter of two-column pages on a low-DPI
+# grayscale render (the emptiest vertical strip in the middle band of the page) and sends the two
+# column crops to the vision model in parallel with QUIZ_COLUMN_PROMPT. Pages without a clear gutter
+# are sent whole.
+LAYOUT_PAGE = "page"
+LAYOUT_COLUMNS = "columns"
+LAYOUT_MODES = [(LAYOUT_PAGE, "Whole page"), (LAYOUT_COLUMNS, "Split columns")]
+DEFAULT_LAYOUT_MODE = LAYOUT_PAGE
+COLUMN_DETECT_DPI = 50
+# The gutter is searched between these fractions of the page width
+COLUMN_SEARCH_BAND = (0.35, 0.65)
+# Share of pixel rows with ink a gutter may have (full-width headers and rules cross it)
+COLUMN_GUTTER_MAX_INK = 0.05
+COLUMN_GUTTER_MIN_POINTS = 10
+# Each crop extends past the gutter by this much so nothing on the gutter edge is lost
+COLUMN_OVERLAP_POINTS = 4
+
+# Text-layer fast path: pages whose PDF text layer is usable skip rasterization and go to a
+# text-only prompt. Scanned, image-heavy or badly encoded pages still use the vision call.
+TEXT_LAYER_ENABLED = True
+TEXT_MODEL_NAME = MODEL_NAME
+TEXT_LAYER_MIN_CHARS = 200
+TEXT_LAYER_MAX_IMAGE_RATIO = 0.25
+TEXT_LAYER_MAX_GARBAGE_RATIO = 0.05
+
+# Persistent cache of model responses, keyed by page input, model, prompt, temperature and context.
+# Can be bypassed per run with `process_pdf_batch --no_cache`.
+LLM_CACHE_ENABLED = True
+
+# Groq quota used by the request scheduler (token-bucket pacing). Adjusted at runtime from the
+# x-ratelimit-* response headers. Rate-limited and transient failures are retried with jittered
+# exponential backoff.
+GROQ_REQUESTS_PER_MINUTE = 30
+GROQ_TOKENS_PER_MINUTE = 30000
+# Rough prompt token cost of one page image, replaced by the real usage once the call returns
+IMAGE_TOKEN_ESTIMATE = 1500
+RATE_LIMIT_MAX_RETRIES = 5
+BACKOFF_BASE_SECONDS = 2
+BACKOFF_MAX_SECONDS = 60
+
+# run_ingest_worker daemon: seconds between queue polls when idle, and the RSS (MB) after which it
+# exits once the current job is done so the process supervisor restarts it with fresh memory.
+INGEST_POLL_SECONDS = 5
+INGEST_MAX_MEMORY_MB = 1024
+
+# Ingest job queue: a failing page range is retried up to INGEST_MAX_ATTEMPTS times before it is
+# marked failed. Batches queued by hand from the admin jump ahead of the cron backlog.
+INGEST_MAX_ATTEMPTS = 3
+INGEST_MANUAL_PRIORITY = 10
+
+# Dead-letter queue: a page that fails on its own (model/API error, undecodable items, DB writes)
+# does not stop the batch, it is stored as a FailedPage with the error and the raw response. Due
+# pages are reprocessed alone with fresh model calls, FAILED_PAGE_RETRY_SECONDS after the first
+# failure and twice as long after every further one, until FAILED_PAGE_MAX_ATTEMPTS.
+FAILED_PAGE_MAX_ATTEMPTS = 4
+FAILED_PAGE_RETRY_SECONDS = 300
+
+# Ingestion metrics dashboard (PDFUpload admin), computed over the PageResult timings of the last
+# METRICS_WINDOW_PAGES pages of each PDF. Gaps longer than METRICS_IDLE_GAP_SECONDS between two
+# pages (waiting for the next trigger, a paused queue) do not count towards pages per minute.
+METRICS_WINDOW_PAGES = 100
+METRICS_IDLE_GAP_SECONDS = 300
+
+# Adaptive batch sizing: unless a size is asked for explicitly, a PDF is processed in batches of as
+# many pages as fit in BATCH_TARGET_SECONDS at the throughput measured over its last
+# BATCH_SIZING_WINDOW_PAGES pages (BATCH_DEFAULT_SECONDS_PER_PAGE before it has any). The target
+# keeps a batch well inside the 30-minute trigger window of scheduled_processor.yml.
+BATCH_TARGET_SECONDS = 20 * 60
+BATCH_SIZING_WINDOW_PAGES = 20
+BATCH_DEFAULT_SECONDS_PER_PAGE = 30
+BATCH_MIN_PAGES = 2
+BATCH_MAX_PAGES = 200
+
+# Each category's question ids in quiz order (page, question number, id) and their subcategories
+# are cached as integer arrays under the category's question_version, which ingestion bumps in the
+# transaction that creates or updates its questions. Entries of older versions just expire.
+CATEGORY_QUESTIONS_CACHE_SECONDS = 24 * 60 * 60
+
+# Processing locks are leases: the worker renews its lease every INGEST_HEARTBEAT_SECONDS, and a
+# lease not renewed for INGEST_LEASE_SECONDS (crashed or killed worker) is taken over by another one.
+INGEST_LEASE_SECONDS = 120
+INGEST_HEARTBEAT_SECONDS = 30
+
+# Stream completions and hand finished array items to the parser while the model is still writing.
+# A response cut off at MAX_TOKENS is continued with up to MAX_CONTINUATIONS follow-up requests.
+STREAMING_ENABLED = True
+MAX_CONTINUATIONS = 2
+CONTINUATION_PROMPT = (
+    "Your previous answer was cut off. Continue the JSON array exactly where it stopped, "
+    "without repeating anything and without any preamble or markdown."
+)
+
+# Malformed array items are repaired locally (trailing commas, stray quotes, cut-off objects) and,
+# if that fails, sent alone to the text model with JSON_FIX_PROMPT. The page image is never resent.
+JSON_FIX_CALL_ENABLED = True
+JSON_FIX_PROMPT = (
+    "The following JSON object is malformed. Return only the corrected JSON object, keeping every "
+    "key and value as it is. Do not add explanations or markdown."
+)
+
+# Model cascade: every page goes to the first (fast, cheap) tier, and only pages whose items fail
+# validation (see cascade.validate_page_items) are re-run on the next tier. Each tier has a vision
+# model and a model for the text-layer prompt.
+CASCADE_ENABLED = True
+MODEL_TIERS = [
+    {"name": "fast", "model": MODEL_NAME, "text_model": TEXT_MODEL_NAME},
+    {"name": "strong", "model": "meta-llama/llama-4-maverick-17b-128e-instruct", "text_model": "llama-3.3-70b-versatile"},
+]
+# A complete question needs at least this many options to pass validation
+VALIDATION_MIN_OPTIONS = 2
+
+# Pre-LLM page triage on a small grayscale render and the text layer. Blank pages (almost no ink
+# and no text), covers (few words on the first pages), tables of contents and near-duplicates of
+# earlier pages (perceptual hash within TRIAGE_DUPLICATE_MAX_DISTANCE bits confirmed on the pixels,
+# and the same text when either page has a text layer) are skipped without a model call. Decisions
+# are stored in PageTriage and can be overridden in the admin.
+TRIAGE_ENABLED = True
+TRIAGE_DPI = 36
+# Grayscale level below which a pixel counts as ink
+TRIAGE_INK_LEVEL = 160
+TRIAGE_BLANK_MAX_INK = 0.005
+TRIAGE_BLANK_MAX_CHARS = 20
+TRIAGE_COVER_PAGES = 2
+TRIAGE_COVER_MAX_CHARS = 150
+# A keyword makes a page an index only as a heading line of its own among the first few lines
+TRIAGE_INDEX_KEYWORDS = ("içindekiler", "contents", "table of contents")
+TRIAGE_INDEX_HEADING_LINES = 3
+# Share of text lines ending in a page number, after a leader ("....", "…") or in a column of rising
+# numbers, that makes a page an index
+TRIAGE_INDEX_MIN_LINE_RATIO = 0.6
+TRIAGE_INDEX_MIN_LINES = 8
+TRIAGE_HASH_SIZE = 16
+TRIAGE_DUPLICATE_MAX_DISTANCE = 6
+# Same-layout pages of different text can share a hash, so a hash match is confirmed by the mean
+# grayscale difference (0-255) of both pages rendered at TRIAGE_CONFIRM_DPI. Sparse text pages
+# differ by little on average, so only near-identical renders pass.
+TRIAGE_CONFIRM_DPI = 72
+TRIAGE_DUPLICATE_MAX_PIXEL_DIFF = 3
@@ -0,0 +1,71 @@
+from datetime import timedelta
+
+from django.db import DatabaseError
+from django.db.models import QuerySet
+from django.utils import timezone
+from groq import APIError
+
+from apps.content.constants import FAILED_PAGE_MAX_ATTEMPTS, FAILED_PAGE_RETRY_SECONDS
+from apps.content.models import FailedPage, PDFUpload
+
+
+def classify_error(error: Exception) -> str:
+    if isinstance(error, APIError):
+        return FailedPage.ERROR_API
+    if isinstance(error, DatabaseError):
+        return FailedPage.ERROR_DATABASE
+    # json.JSONDecodeError is a ValueError, as is the empty-response check of process_next_batch
+    if isinstance(error, ValueError):
+        return FailedPage.ERROR_DECODE
+    return FailedPage.ERROR_OTHER
+
+
+def retry_delay(attempts: int) -> timedelta:
+    """Wait before the next retry of a page that failed `attempts` times."""
+    return timedelta(seconds=FAILED_PAGE_RETRY_SECONDS * 2 ** (attempts - 1))
+
+
+def record_failed_page(pdf: PDFUpload, page_num: int, error_class: str, error: str, payload: str = "") -> FailedPage:
+    """Stores (or updates) the dead-letter entry of the 0-based `page_num`."""
+    # The PDF's lease keeps other workers off its pages, a plain read-modify-write is safe
+    failed, _ = FailedPage.objects.get_or_create(pdf=pdf, page_number=page_num + 1, defaults={"attempts": 0})
+    failed.attempts += 1
+    failed.error_class, failed.error, failed.payload = error_class, error, payload
+    gave_up = failed.attempts >= FAILED_PAGE_MAX_ATTEMPTS
+    failed.status = FailedPage.STATUS_GAVE_UP if gave_up else FailedPage.STATUS_PENDING
+    failed.next_retry_at = None if gave_up else timezone.now() + retry_delay(failed.attempts)
+    failed.resolved_at = None
+    failed.save()
+
+    print(f"📮 Page {page_num} recorded as failed ({error_class}, attempt {failed.attempts}/{FAILED_PAGE_MAX_ATTEMPTS}).")
+    return failed
+
+
+def resolve_failed_page(pdf: PDFUpload, page_num: int) -> None:
+    """Closes the dead-letter entry of a page that was just processed successfully, if it had one."""
+    FailedPage.objects.filter(pdf=pdf, page_number=page_num + 1).exclude(status=FailedPage.STATUS_RESOLVED).update(
+        status=FailedPage.STATUS_RESOLVED,
+        next_retry_at=None,
+        resolved_at=timezone.now()
+    )
+
+
+def due_failed_pages(force: bool = False) -> QuerySet[FailedPage]:
+    """Pages whose retry is due. `force` takes every unresolved page, given up or not."""
+    if force:
+        return FailedPage.objects.exclude(status=FailedPage.STATUS_RESOLVED)
+    return FailedPage.objects.filter(status=FailedPage.STATUS_PENDING, next_retry_at__lte=timezone.now())
+
+
+def page_ranges(page_numbers: list[int]) -> list[tuple[int, int]]:
+    """
+    Groups 1-based page numbers into 0-based [start, end) ranges of consecutive pages, so failed
+    neighbours are retried together and the carry-over flows from one to the next.
+    """
+    ranges: list[tuple[int, int]] = []
+    for page_number in sorted(set(page_numbers)):
+        if ranges and ranges[-1][1] == page_number - 1:
+            ranges[-1] = (ranges[-1][0], page_number)
+        else:
+            ranges.append((page_number - 1, page_number))
+    return ranges
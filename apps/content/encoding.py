@@ -0,0 +1,85 @@
+import io
+import math
+from dataclasses import dataclass
+
+from PIL import Image
+
+from apps.content.constants import DEFAULT_IMAGE_ENCODING, IMAGE_ENCODING_PROFILES, MIN_QUALITY, QUALITY_STEP
+
+MIME_TYPES = {"png": "image/png", "jpeg": "image/jpeg", "webp": "image/webp"}
+
+# Never shrink below roughly an A4 page at 100 dpi, small print stops being legible
+MIN_PIXELS = 800 * 1150
+
+
+@dataclass
+class EncodedImage:
+    data: bytes
+    mime_type: str
+    original_bytes: int
+    width: int
+    height: int
+    quality: int | None = None
+    # Time spent in encode_page_image, set by the rendering helpers
+    encode_seconds: float = 0.0
+
+    @property
+    def bytes_saved(self) -> int:
+        return self.original_bytes - len(self.data)
+
+
+def get_encoding_profile(name: str | None) -> dict:
+    return IMAGE_ENCODING_PROFILES.get(name or DEFAULT_IMAGE_ENCODING, IMAGE_ENCODING_PROFILES[DEFAULT_IMAGE_ENCODING])
+
+
+def _save(img: Image.Image, fmt: str, quality: int | None) -> bytes:
+    out = io.BytesIO()
+    if fmt == "png":
+        img.save(out, format="PNG", optimize=True)
+    else:
+        img.save(out, format=fmt.upper(), quality=quality)
+    return out.getvalue()
+
+
+def encode_page_image(png_bytes: bytes, profile_name: str | None = None) -> EncodedImage:
+    """
+    Re-encodes a rendered PNG page according to an IMAGE_ENCODING_PROFILES entry:
+    grayscale conversion, max-pixel downscaling and a per-request byte budget.
+    """
+    profile = get_encoding_profile(profile_name)
+    fmt = profile["format"]
+
+    img = Image.open(io.BytesIO(png_bytes))
+    original_width, original_height = img.size
+    original_pixels = original_width * original_height
+
+    if fmt == "png" and not profile["grayscale"] and not profile["max_pixels"] and not profile["max_bytes"]:
+        # Pass-through, the pixmap is already a PNG
+        return EncodedImage(png_bytes, MIME_TYPES["png"], len(png_bytes), original_width, original_height)
+
+    img = img.convert("L") if profile["grayscale"] else img.convert("RGB")
+
+    max_pixels = profile["max_pixels"]
+    if max_pixels and img.width * img.height > max_pixels:
+        scale = math.sqrt(max_pixels / (img.width * img.height))
+        img = img.resize((int(img.width * scale), int(img.height * scale)), Image.LANCZOS)
+
+    quality = profile["quality"]
+    data = _save(img, fmt, quality)
+
+    max_bytes = profile["max_bytes"]
+    while max_bytes and len(data) > max_bytes:
+        if fmt != "png" and quality - QUALITY_STEP >= MIN_QUALITY:
+            quality -= QUALITY_STEP
+        elif img.width * img.height * 0.64 >= MIN_PIXELS:
+            img = img.resize((int(img.width * 0.8), int(img.height * 0.8)), Image.LANCZOS)
+        else:
+            # Cannot go lower without hurting legibility, send it over budget
+            break
+        data = _save(img, fmt, quality)
+
+    if len(data) >= len(png_bytes) and (not max_bytes or len(png_bytes) <= max_bytes) and (not max_pixels or original_pixels <= max_pixels):
+        # Mostly blank/text-only pages compress better as PNG, never upload more than the raw render
+        return EncodedImage(png_bytes, MIME_TYPES["png"], len(png_bytes), original_width, original_height)
+
+    return EncodedImage(data, MIME_TYPES[fmt], len(png_bytes), img.width, img.height, quality)
@@ -1,44 +1,220 @@
 import os
+import threading
+from collections.abc import Callable
 
-from groq import Groq
+from groq import Groq, APIConnectionError, InternalServerError, RateLimitError
 
-from apps.content.constants import MODEL_NAME, QUIZ_PROMPT, TEMPERATURE, MAX_TOKENS
+from apps.content.constants import (
+    MODEL_NAME, QUIZ_PROMPT, QUIZ_TEXT_PROMPT, TEXT_MODEL_NAME, TEMPERATURE, MAX_TOKENS,
+    IMAGE_TOKEN_ESTIMATE, RATE_LIMIT_MAX_RETRIES, STREAMING_ENABLED, MAX_CONTINUATIONS, CONTINUATION_PROMPT,
+    JSON_FIX_PROMPT
+)
+from apps.content.rate_limiter import RateLimitScheduler, get_scheduler, parse_reset_duration
+
+
+def estimate_tokens(messages: list[dict]) -> int:
+    """Rough pre-call token estimate used for pacing, ~4 characters per token plus the expected completion."""
+    chars = 0
+    images = 0
+    for message in messages:
+        content = message["content"]
+        if isinstance(content, str):
+            chars += len(content)
+            continue
+        for part in content:
+            if part["type"] == "text":
+                chars += len(part["text"])
+            else:
+                images += 1
+    return chars // 4 + images * IMAGE_TOKEN_ESTIMATE + MAX_TOKENS // 2
 
 
 class GroqClient:
-    def __init__(self):
-        self.client = Groq(api_key=os.environ.get("GROQ_API_KEY"))
+    def __init__(self, scheduler: RateLimitScheduler | None = None):
+        # Retries are owned by the scheduler, the SDK's own retry loop would ignore our pacing
+        self.client = Groq(api_key=os.environ.get("GROQ_API_KEY"), max_retries=0)
+        self.scheduler = scheduler or get_scheduler()
+        # The pipeline shares one client between threads, keep per-thread usage of the last call
+        self._local = threading.local()
+
+    @property
+    def last_usage(self) -> dict[str, int] | None:
+        """Token usage block of the last completion made from the current thread."""
+        return getattr(self._local, "usage", None)
+
+    @property
+    def last_retries(self) -> int:
+        """Requests of the last completion from the current thread that were retried (rate limits, transient errors)."""
+        return getattr(self._local, "retries", 0)
+
+    def _context_message(self, context_text: str) -> dict:
+        return {
+            "role": "system",
+            "content": f"PREVIOUS PAGE CONTEXT:\n{context_text}\n\nUse this context to handle fragments or missing data at the top of the current page."
+        }
+
+    def _create(self, model: str, messages: list[dict], estimated_tokens: int, stream: bool = False):
+        """One paced request, retried on rate limits and transient API errors. Returns the raw response."""
+        for attempt in range(RATE_LIMIT_MAX_RETRIES + 1):
+            self.scheduler.acquire(estimated_tokens)
+            try:
+                raw_response = self.client.chat.completions.with_raw_response.create(
+                    model=model,
+                    messages=messages,
+                    temperature=TEMPERATURE,
+                    max_tokens=MAX_TOKENS,
+                    stream=stream
+                )
+                break
+            except RateLimitError as e:
+                if attempt == RATE_LIMIT_MAX_RETRIES:
+                    raise
+                self.scheduler.update_from_headers(e.response.headers)
+                delay = self.scheduler.backoff_delay(
+                    attempt, parse_reset_duration(e.response.headers.get("retry-after")), rate_limited=True
+                )
+                self._local.retries = self.last_retries + 1
+                print(f"⏳ Groq rate limit hit (Attempt {attempt+1}/{RATE_LIMIT_MAX_RETRIES}). Backing off {delay:.1f}s...")
+            except (APIConnectionError, InternalServerError) as e:
+                if attempt == RATE_LIMIT_MAX_RETRIES:
+                    raise
+                delay = self.scheduler.backoff_delay(attempt)
+                self._local.retries = self.last_retries + 1
+                print(f"⚠️ Groq request failed: {e} (Attempt {attempt+1}/{RATE_LIMIT_MAX_RETRIES}). Retrying in {delay:.1f}s...")
+
+        self.scheduler.update_from_headers(raw_response.headers)
+        return raw_response
+
+    def _complete(self, model: str, messages: list[dict]) -> str | None:
+        self._local.retries = 0
+        estimated_tokens = estimate_tokens(messages)
+        completion = self._create(model, messages, estimated_tokens).parse()
+
+        usage = getattr(completion, "usage", None)
+        self._local.usage = {
+            "prompt_tokens": usage.prompt_tokens,
+            "completion_tokens": usage.completion_tokens
+        } if usage else None
+        self.scheduler.record_usage(estimated_tokens, usage.total_tokens if usage else None)
+
+        return completion.choices[0].message.content if completion.choices else None
+
+    def _stream(self, model: str, messages: list[dict], on_text: Callable[[str], None]) -> str | None:
+        """
+        Streams the completion into `on_text` chunk by chunk. A response cut off at MAX_TOKENS is
+        continued with follow-up requests that carry the partial answer, up to MAX_CONTINUATIONS.
+        """
+        parts: list[str] = []
+        total_usage = {"prompt_tokens": 0, "completion_tokens": 0}
+        self._local.retries = 0
+
+        for continuation in range(MAX_CONTINUATIONS + 1):
+            estimated_tokens = estimate_tokens(messages)
+            stream = self._create(model, messages, estimated_tokens, stream=True).parse()
+
+            part: list[str] = []
+            finish_reason = None
+            usage = None
+            for chunk in stream:
+                if chunk.choices:
+                    choice = chunk.choices[0]
+                    text = choice.delta.content
+                    if text:
+                        if continuation and not part:
+                            # Models like to reopen a fenced block when asked to go on
+                            text = text.lstrip().removeprefix("```json").removeprefix("```").lstrip()
+                        if text:
+                            part.append(text)
+                            on_text(text)
+                    finish_reason = choice.finish_reason or finish_reason
+
+                x_groq = getattr(chunk, "x_groq", None)
+                if x_groq and x_groq.usage:
+                    usage = x_groq.usage
+
+            parts.append("".join(part))
+            if usage:
+                total_usage["prompt_tokens"] += usage.prompt_tokens
+                total_usage["completion_tokens"] += usage.completion_tokens
+            self.scheduler.record_usage(estimated_tokens, usage.total_tokens if usage else None)
 
-    def get_quiz_content_from_image(self, base64_image: str, context_text: str | None = None) -> str | None:
+            if finish_reason != "length":
+                break
+
+            if continuation == MAX_CONTINUATIONS:
+                print(f"⚠️ Response still cut off after {MAX_CONTINUATIONS} continuations.")
+                break
+
+            print(f"✂️ Response hit MAX_TOKENS, requesting continuation {continuation + 1}/{MAX_CONTINUATIONS}...")
+            messages = messages + [
+                {"role": "assistant", "content": "".join(parts)},
+                {"role": "user", "content": CONTINUATION_PROMPT}
+            ]
+
+        self._local.usage = total_usage if total_usage["prompt_tokens"] else None
+        response = "".join(parts)
+        return response or None
+
+    def _run(self, model: str, messages: list[dict], on_text: Callable[[str], None] | None) -> str | None:
+        if STREAMING_ENABLED and on_text:
+            return self._stream(model, messages, on_text)
+        return self._complete(model, messages)
+
+    def get_quiz_content_from_image(
+        self,
+        base64_image: str,
+        context_text: str | None = None,
+        mime_type: str = "image/png",
+        on_text: Callable[[str], None] | None = None,
+        model: str = MODEL_NAME,
+        prompt: str = QUIZ_PROMPT
+    ) -> str | None:
         messages = []
 
         if context_text:
-            messages.append({
-                "role": "system",
-                "content": f"PREVIOUS PAGE CONTEXT:\n{context_text}\n\nUse this context to handle fragments or missing data at the top of the current page."
-            })
+            messages.append(self._context_message(context_text))
 
         messages.append({
             "role": "user",
             "content": [
                 {
                     "type": "text",
-                    "text": QUIZ_PROMPT
+                    "text": prompt
                 },
                 {
                     "type": "image_url",
                     "image_url": {
-                        "url": f"data:image/jpeg;base64,{base64_image}"
+                        "url": f"data:{mime_type};base64,{base64_image}"
                     }
                 }
             ]
         })
 
-        completion = self.client.chat.completions.create(
-            model=MODEL_NAME,
-            messages=messages,
-            temperature=TEMPERATURE,
-            max_tokens=MAX_TOKENS
-        )
+        return self._run(model, messages, on_text)
 
-        return completion.choices[0].message.content if completion.choices else None
+    def get_quiz_content_from_text(
+        self,
+        page_text: str,
+        context_text: str | None = None,
+        on_text: Callable[[str], None] | None = None,
+        model: str = TEXT_MODEL_NAME
+    ) -> str | None:
+        messages = []
+
+        if context_text:
+            messages.append(self._context_message(context_text))
+
+        messages.append({
+            "role": "user",
+            "content": f"{QUIZ_TEXT_PROMPT}\n### PAGE TEXT\n{page_text}"
+        })
+
+        return self._run(model, messages, on_text)
+
+    def fix_json(self, broken_text: str) -> str | None:
+        """Text-only request asking the cheap model to correct one malformed JSON object."""
+        messages = [
+            {"role": "system", "content": JSON_FIX_PROMPT},
+            {"role": "user", "content": broken_text}
+        ]
+        return self._complete(TEXT_MODEL_NAME, messages)
@@ -0,0 +1,191 @@
+import os
+import signal
+import threading
+
+from django.db import close_old_connections, connection, connections, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from apps.content.constants import INGEST_MAX_ATTEMPTS, INGEST_MAX_MEMORY_MB, INGEST_POLL_SECONDS, PIPELINE_CONCURRENCY
+from apps.content.leases import LeaseHeartbeat, acquire_lease, category_is_free, lease_is_free, release_expired_leases, release_lease, worker_id
+from apps.content.metrics import adaptive_batch_size
+from apps.content.models import IngestJob
+from apps.content.services import process_next_batch, reprocess_pages
+
+
+def current_rss_mb() -> float:
+    """Resident memory of this process in MB."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 1024 / 1024
+    except (OSError, ValueError):
+        import resource
+
+        # Peak instead of current RSS (kilobytes on Linux), good enough as an upper bound
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+class IngestWorker:
+    """
+    Long-running loop behind `run_ingest_worker`. Claims queued IngestJobs one at a time and runs
+    them in this process, so Django setup, fitz/groq imports and the DB connection are paid once.
+    Several workers can run side by side, each on a PDF of a different category.
+    SIGTERM/SIGINT end the current range after the page in progress and requeue what is left of it.
+    """
+
+    def __init__(
+        self,
+        concurrency: int = PIPELINE_CONCURRENCY,
+        max_memory_mb: int = INGEST_MAX_MEMORY_MB,
+        poll_seconds: float = INGEST_POLL_SECONDS,
+        max_jobs: int | None = None
+    ) -> None:
+        self.concurrency = concurrency
+        self.max_memory_mb = max_memory_mb
+        self.poll_seconds = poll_seconds
+        self.max_jobs = max_jobs
+        self.worker_id = worker_id()
+        self.stop_event = threading.Event()
+
+    def install_signal_handlers(self) -> None:
+        signal.signal(signal.SIGTERM, self._handle_signal)
+        signal.signal(signal.SIGINT, self._handle_signal)
+
+    def _handle_signal(self, signum, frame) -> None:
+        print(f"🛑 Received {signal.Signals(signum).name}, stopping after the current page...", flush=True)
+        self.stop_event.set()
+
+    def should_stop(self) -> bool:
+        return self.stop_event.is_set()
+
+    def claim_next_job(self) -> IngestJob | None:
+        release_expired_leases()
+
+        candidates = (
+            IngestJob.objects
+            # Ranges of one PDF run in page order, and never while another worker holds the PDF's lease
+            # or that of another PDF of its category
+            .filter(status=IngestJob.STATUS_QUEUED)
+            .filter(
+                Q(kind=IngestJob.KIND_INGEST, start_page__lte=F("pdf__last_processed_page"))
+                | Q(kind=IngestJob.KIND_REPROCESS, end_page__lte=F("pdf__last_processed_page"))
+            )
+            .filter(lease_is_free("pdf__"), category_is_free("pdf__"))
+            .order_by("-priority", "start_page", "id")
+        )
+
+        with transaction.atomic():
+            if connection.features.has_select_for_update_skip_locked:
+                # MySQL: rows another worker is claiming are skipped instead of waited on
+                of = ("self",) if connection.features.has_select_for_update_of else ()
+                candidates = candidates.select_for_update(skip_locked=True, of=of)
+            job = candidates.first()
+            if not job:
+                return None
+
+            # SQLite has no row locks but serializes writers, the conditional updates
+            # make sure only one worker wins a job and its PDF's lease there
+            claimed = IngestJob.objects.filter(id=job.id, status=IngestJob.STATUS_QUEUED).update(
+                status=IngestJob.STATUS_RUNNING,
+                started_at=timezone.now(),
+                attempts=F("attempts") + 1
+            )
+            if not claimed or not acquire_lease(job.pdf_id, self.worker_id):
+                transaction.set_rollback(True)
+                return None
+
+        job.refresh_from_db()
+        return job
+
+    def run_job(self, job: IngestJob) -> None:
+        pdf = job.pdf
+        reprocessing = job.kind == IngestJob.KIND_REPROCESS
+        # A reprocess range always runs whole, replacing a page twice is harmless
+        start_page = job.start_page if reprocessing else pdf.last_processed_page
+        batch_size = job.end_page - start_page
+        if not reprocessing:
+            # A long range is run in batches sized from the PDF's page latency, the rest is requeued
+            batch_size = min(batch_size, adaptive_batch_size(pdf))
+        print(f"▶️ Job {job.id}: {pdf.title} Pages {start_page + 1}-{start_page + batch_size} of {job.end_page} (Attempt {job.attempts}/{INGEST_MAX_ATTEMPTS})...", flush=True)
+
+        status = IngestJob.STATUS_DONE
+        with LeaseHeartbeat(pdf.id, self.worker_id) as heartbeat:
+            def should_stop() -> bool:
+                return self.should_stop() or heartbeat.lost.is_set()
+
+            try:
+                if reprocessing:
+                    result = reprocess_pages(
+                        pdf, job.start_page, job.end_page, use_cache=job.use_cache, concurrency=self.concurrency, should_stop=should_stop
+                    )
+                elif batch_size > 0:
+                    result = process_next_batch(
+                        pdf, batch_size, use_cache=job.use_cache, concurrency=self.concurrency, should_stop=should_stop
+                    )
+                else:
+                    result = "Range was already processed."
+                print(f"✅ Job {job.id} finished: {result}", flush=True)
+            except Exception as e:
+                status, result = IngestJob.STATUS_FAILED, str(e)
+                print(f"❌ Job {job.id} failed: {e}", flush=True)
+
+        close_old_connections()
+        if heartbeat.lost.is_set():
+            # The job was requeued and belongs to whoever took the lease over
+            return
+
+        interrupted = (
+            status == IngestJob.STATUS_DONE and self.should_stop()
+            and (reprocessing or pdf.last_processed_page < min(job.end_page, pdf.total_pages))
+        )
+        # Only when the batch moved forward, a page that keeps failing to save must not loop forever
+        more_batches = (
+            status == IngestJob.STATUS_DONE and not reprocessing
+            and start_page < pdf.last_processed_page < min(job.end_page, pdf.total_pages)
+        )
+
+        with transaction.atomic():
+            if interrupted or more_batches:
+                # Not the job's fault, so it does not cost an attempt. The new start puts the
+                # range behind other PDFs' ranges, so one long book does not hold up the rest.
+                IngestJob.objects.filter(id=job.id).update(
+                    status=IngestJob.STATUS_QUEUED, started_at=None, attempts=F("attempts") - 1, result=result,
+                    start_page=start_page if reprocessing else pdf.last_processed_page
+                )
+                print(f"⏸️ Job {job.id} requeued, continues from Page {start_page + 1 if reprocessing else pdf.last_processed_page + 1}.", flush=True)
+            elif status == IngestJob.STATUS_FAILED and job.attempts < INGEST_MAX_ATTEMPTS:
+                IngestJob.objects.filter(id=job.id).update(status=IngestJob.STATUS_QUEUED, started_at=None, result=result)
+                print(f"🔁 Job {job.id} requeued for another attempt.", flush=True)
+            else:
+                IngestJob.objects.filter(id=job.id).update(status=status, result=result, finished_at=timezone.now())
+
+            release_lease(pdf.id, self.worker_id)
+
+    def run(self) -> None:
+        self.install_signal_handlers()
+        print(f"--- 🚀 Ingest worker started ({self.worker_id}, concurrency {self.concurrency}, memory limit {self.max_memory_mb} MB) ---", flush=True)
+
+        jobs_done = 0
+        while not self.should_stop():
+            close_old_connections()
+            job = self.claim_next_job()
+
+            if job is None:
+                # Returns early when a signal arrives
+                self.stop_event.wait(self.poll_seconds)
+                continue
+
+            self.run_job(job)
+            jobs_done += 1
+
+            rss_mb = current_rss_mb()
+            if rss_mb > self.max_memory_mb:
+                print(f"♻️ Memory at {rss_mb:.0f} MB (limit {self.max_memory_mb} MB), exiting so the supervisor restarts the worker.", flush=True)
+                break
+
+            if self.max_jobs and jobs_done >= self.max_jobs:
+                print(f"♻️ Reached the job limit ({jobs_done}), exiting.", flush=True)
+                break
+
+        connections.close_all()
+        print("--- 🏁 Ingest worker stopped ---", flush=True)
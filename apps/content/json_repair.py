@@ -0,0 +1,167 @@
+import json
+from dataclasses import dataclass
+from typing import Any
+
+from apps.content.constants import JSON_FIX_CALL_ENABLED, JSON_FIX_PROMPT, TEXT_MODEL_NAME
+from apps.content.groq_client import GroqClient
+from apps.content.llm_cache import ResponseCache
+from apps.content.parsers import defuse_unicode_escapes
+
+REPAIR_LOCAL = "local"
+REPAIR_LLM = "llm"
+MAX_TRUNCATION_CUTS = 5
+
+
+@dataclass
+class RepairOutcome:
+    method: str
+    succeeded: bool
+    truncated: bool
+    original_text: str
+    repaired_text: str = ""
+
+
+def _next_significant_char(text: str, start: int) -> str | None:
+    for char in text[start:]:
+        if not char.isspace():
+            return char
+    return None
+
+
+def _drop_trailing_comma(out: list[str]) -> None:
+    i = len(out) - 1
+    while i >= 0 and out[i].isspace():
+        i -= 1
+    if i >= 0 and out[i] == ",":
+        del out[i]
+
+
+def repair_json_text(text: str) -> str:
+    """
+    Fixes the usual near-misses of model output: trailing commas, unescaped quotes and raw
+    newlines inside strings, and an object cut off mid-way (open strings/brackets are closed).
+    """
+    out: list[str] = []
+    closers: list[str] = []
+    in_string = False
+    escaped = False
+
+    for i, char in enumerate(text):
+        if in_string:
+            if escaped:
+                escaped = False
+            elif char == "\\":
+                escaped = True
+            elif char == '"':
+                # A quote that is not followed by a delimiter belongs to the text
+                if _next_significant_char(text, i + 1) in (None, ",", ":", "}", "]"):
+                    in_string = False
+                else:
+                    out.append("\\")
+            elif char == "\n":
+                out.append("\\n")
+                continue
+            out.append(char)
+            continue
+
+        if char == '"':
+            in_string = True
+        elif char in "{[":
+            closers.append("}" if char == "{" else "]")
+        elif char in "}]":
+            _drop_trailing_comma(out)
+            if closers:
+                closers.pop()
+        out.append(char)
+
+    if in_string:
+        out.append('"')
+
+    repaired = "".join(out).rstrip()
+    if repaired.endswith(","):
+        repaired = repaired[:-1]
+    if repaired.endswith(":"):
+        repaired += " null"
+    return repaired + "".join(reversed(closers))
+
+
+def _load_object(text: str) -> dict[str, Any] | None:
+    try:
+        item = json.loads(text)
+    except json.JSONDecodeError:
+        return None
+    return item if isinstance(item, dict) else None
+
+
+def repair_item_locally(text: str, truncated: bool = False) -> tuple[dict[str, Any] | None, str]:
+    """Returns the repaired item (or None) and the text that was finally tried."""
+    text = defuse_unicode_escapes(text)
+    candidate = repair_json_text(text)
+    item = _load_object(candidate)
+
+    # A cut-off object may end in a dangling key or half a value, drop trailing members until it loads
+    cut_text = text
+    for _ in range(MAX_TRUNCATION_CUTS if truncated else 0):
+        if item is not None:
+            break
+        cut = cut_text.rfind(",")
+        if cut <= 0:
+            break
+        cut_text = cut_text[:cut]
+        candidate = repair_json_text(cut_text)
+        item = _load_object(candidate)
+
+    if item is not None and truncated:
+        # Whatever was cut off is missing, the parser buffers the item for the next page
+        item["is_incomplete"] = True
+    return item, candidate
+
+
+class JSONRepairer:
+    """
+    Second chance for array items that do not decode: the tolerant local repair first, then
+    (if enabled) a cheap text-only "fix this JSON" call that does not resend the page image.
+    Every attempt is kept in `outcomes` so it can be stored with the page (see JSONRepair).
+    """
+
+    def __init__(self, groq: GroqClient | None = None, cache: ResponseCache | None = None) -> None:
+        self.groq = groq if JSON_FIX_CALL_ENABLED else None
+        self.cache = cache
+        self.outcomes: list[RepairOutcome] = []
+
+    def repair(self, text: str, truncated: bool = False) -> dict[str, Any] | None:
+        item, candidate = repair_item_locally(text, truncated)
+        self.outcomes.append(RepairOutcome(REPAIR_LOCAL, item is not None, truncated, text, candidate if item is not None else ""))
+        if item is not None:
+            return item
+
+        fixed = self._fix_call(text)
+        if fixed is None:
+            return None
+
+        item = _load_object(repair_json_text(defuse_unicode_escapes(fixed.strip().removeprefix("```json").removesuffix("```"))))
+        if item is not None and truncated:
+            item["is_incomplete"] = True
+        self.outcomes.append(RepairOutcome(REPAIR_LLM, item is not None, truncated, text, fixed))
+        return item
+
+    def _fix_call(self, text: str) -> str | None:
+        cache_key = ResponseCache.make_key(text.encode("utf-8"), TEXT_MODEL_NAME, JSON_FIX_PROMPT, None) if self.cache else None
+        if cache_key:
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                return cached
+
+        if not self.groq:
+            return None
+
+        try:
+            fixed = self.groq.fix_json(text)
+        except Exception as e:
+            print(f"⚠️ JSON fix call failed: {e}")
+            self.outcomes.append(RepairOutcome(REPAIR_LLM, False, False, text))
+            return None
+
+        if cache_key and fixed:
+            self.cache.set(cache_key, TEXT_MODEL_NAME, fixed)
+        return fixed
@@ -0,0 +1,123 @@
+import os
+import socket
+import threading
+from datetime import timedelta
+
+from django.db import DatabaseError, connections, transaction
+from django.db.models import Exists, OuterRef, Q
+from django.utils import timezone
+
+from apps.content.constants import INGEST_HEARTBEAT_SECONDS, INGEST_LEASE_SECONDS, INGEST_MAX_ATTEMPTS
+from apps.content.models import Category, IngestJob, PDFUpload
+
+
+def worker_id() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def lease_is_free(prefix: str = "") -> Q:
+    """Filter for PDFs nobody holds an unexpired lease on, `prefix` is the lookup path to the PDF (e.g. 'pdf__')."""
+    return Q(**{f"{prefix}lease_expires_at__isnull": True}) | Q(**{f"{prefix}lease_expires_at__lt": timezone.now()})
+
+
+def category_is_free(prefix: str = "") -> Exists:
+    """
+    Filter for PDFs no other PDF of the same category holds an unexpired lease on, `prefix` as in
+    lease_is_free. The parser links fragments and explanations to the category's last questions.
+    """
+    leased = PDFUpload.objects.exclude(lease_is_free()).filter(category=OuterRef(f"{prefix}category")).exclude(id=OuterRef(f"{prefix}id"))
+    return ~Exists(leased)
+
+
+def acquire_lease(pdf_id: int, owner: str) -> bool:
+    """
+    Takes the processing lease of a PDF if it is free or expired and no other PDF of its category is
+    leased. Conditional update under the category's row lock, so only one caller wins.
+    """
+    with transaction.atomic():
+        category_id = PDFUpload.objects.filter(id=pdf_id).values_list("category_id", flat=True).first()
+        # Serializes claims of PDFs of one category, checking the other PDFs and updating are two statements
+        if category_id is None or Category.objects.select_for_update().filter(id=category_id).values_list("id", flat=True).first() is None:
+            return False
+        if PDFUpload.objects.exclude(lease_is_free()).filter(category_id=category_id).exclude(id=pdf_id).exists():
+            return False
+        return bool(PDFUpload.objects.filter(lease_is_free(), id=pdf_id).update(
+            is_processing=True,
+            lease_owner=owner,
+            lease_expires_at=timezone.now() + timedelta(seconds=INGEST_LEASE_SECONDS)
+        ))
+
+
+def renew_lease(pdf_id: int, owner: str) -> bool:
+    """Returns False once the lease belongs to someone else."""
+    return bool(PDFUpload.objects.filter(id=pdf_id, lease_owner=owner).update(
+        lease_expires_at=timezone.now() + timedelta(seconds=INGEST_LEASE_SECONDS)
+    ))
+
+
+def release_lease(pdf_id: int, owner: str) -> None:
+    PDFUpload.objects.filter(id=pdf_id, lease_owner=owner).update(is_processing=False, lease_owner="", lease_expires_at=None)
+
+
+def release_expired_leases() -> int:
+    """
+    Requeues the running ranges of PDFs whose worker stopped renewing its lease (crashed, killed, OOM).
+    The next worker resumes them from last_processed_page and the saved parser_state.
+    A range that already used up its attempts is marked failed instead.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        expired_ids = list(PDFUpload.objects.filter(is_processing=True, lease_expires_at__lt=now).values_list("id", flat=True))
+        if not expired_ids:
+            return 0
+
+        running = IngestJob.objects.filter(pdf_id__in=expired_ids, status=IngestJob.STATUS_RUNNING)
+        running.filter(attempts__gte=INGEST_MAX_ATTEMPTS).update(
+            status=IngestJob.STATUS_FAILED, result="Worker lost (lease expired)", finished_at=now
+        )
+        running.update(status=IngestJob.STATUS_QUEUED, started_at=None, result="Worker lost (lease expired), requeued")
+
+        PDFUpload.objects.filter(id__in=expired_ids, lease_expires_at__lt=now).update(
+            is_processing=False, lease_owner="", lease_expires_at=None
+        )
+
+    print(f"♻️ Released expired leases of PDFs {expired_ids}", flush=True)
+    return len(expired_ids)
+
+
+class LeaseHeartbeat:
+    """
+    Renews a PDF lease from a background thread while the batch runs.
+    `lost` is set when the lease was taken over, the batch should stop then.
+    """
+
+    def __init__(self, pdf_id: int, owner: str, interval: float = INGEST_HEARTBEAT_SECONDS) -> None:
+        self.pdf_id = pdf_id
+        self.owner = owner
+        self.interval = interval
+        self.lost = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, name=f"lease-heartbeat-{pdf_id}", daemon=True)
+
+    def __enter__(self) -> "LeaseHeartbeat":
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self._stopped.set()
+        self._thread.join()
+
+    def _run(self) -> None:
+        try:
+            while not self._stopped.wait(self.interval):
+                try:
+                    if not renew_lease(self.pdf_id, self.owner):
+                        print(f"⚠️ Lease of PDF {self.pdf_id} was taken over, stopping.", flush=True)
+                        self.lost.set()
+                        return
+                except DatabaseError as e:
+                    # Try again on the next beat, the lease is long enough to miss a few
+                    print(f"⚠️ Could not renew lease of PDF {self.pdf_id}: {e}", flush=True)
+        finally:
+            # Connections are per thread
+            connections.close_all()
@@ -0,0 +1,68 @@
+import hashlib
+import threading
+
+from django.db import DatabaseError
+from django.db.models import F
+
+from apps.content.constants import TEMPERATURE
+from apps.content.models import LLMResponseCache
+
+
+def prompt_version(prompt: str) -> str:
+    """Editing a prompt changes its version, which invalidates every cached response made with it."""
+    return hashlib.sha256(prompt.encode("utf-8")).hexdigest()[:12]
+
+
+class ResponseCache:
+    """
+    Read-through cache in front of GroqClient backed by LLMResponseCache.
+    Counters are per run and shared by the pipeline threads.
+    """
+
+    def __init__(self, enabled: bool = True) -> None:
+        self.enabled = enabled
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(input_bytes: bytes, model_name: str, prompt: str, context_text: str | None) -> str:
+        input_hash = hashlib.sha256(input_bytes).hexdigest()
+        parts = [input_hash, model_name, prompt_version(prompt), str(TEMPERATURE), context_text or ""]
+        return hashlib.sha256("\x1f".join(parts).encode("utf-8")).hexdigest()
+
+    def get(self, cache_key: str) -> str | None:
+        if not self.enabled:
+            return None
+
+        try:
+            response = LLMResponseCache.objects.filter(cache_key=cache_key).values_list("response", flat=True).first()
+            if response is not None:
+                LLMResponseCache.objects.filter(cache_key=cache_key).update(hit_count=F("hit_count") + 1)
+        except DatabaseError as e:
+            # A cache problem must never cost the page, just call the model
+            print(f"⚠️ LLM cache lookup failed: {e}")
+            response = None
+
+        with self._lock:
+            if response is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+
+        return response
+
+    def set(self, cache_key: str, model_name: str, response: str) -> None:
+        # Stored even when bypassed, so a forced re-extraction refreshes the cache
+        try:
+            LLMResponseCache.objects.update_or_create(
+                cache_key=cache_key,
+                defaults={"model_name": model_name, "response": response}
+            )
+        except DatabaseError as e:
+            print(f"⚠️ Could not store LLM response in cache: {e}")
+
+    def summary(self) -> str:
+        if not self.enabled:
+            return "LLM cache bypassed"
+        return f"LLM cache {self.hits} hits / {self.misses} misses"
@@ -3,17 +3,19 @@ from apps.content.services import background_worker
 
 
 class Command(BaseCommand):
-    help = "Runs the PDF parsing worker in a detached background process."
+    help = "Processes the next batch of the given PDFs in the foreground. Queued work is run by run_ingest_worker."
 
     def add_arguments(self, parser):
         # Accepts multiple PDF IDs and a batch size
         parser.add_argument("pdf_ids", nargs="+", type=int)
-        parser.add_argument("--batch_size", type=int, default=5)
+        parser.add_argument("--batch_size", type=int, help="Pages per PDF, sized from the measured page latency if omitted")
+        parser.add_argument("--no_cache", action="store_true", help="Bypass the LLM response cache and always call Groq")
 
     def handle(self, *args, **options):
         pdf_ids = options["pdf_ids"]
         batch_size = options["batch_size"]
+        use_cache = not options["no_cache"]
 
-        self.stdout.write(f"Starting detached batch for PDFs: {pdf_ids} (Size: {batch_size})")
-        background_worker(pdf_ids, batch_size)
-        self.stdout.write("Detached batch completed.")
+        self.stdout.write(f"Starting batch for PDFs: {pdf_ids} (Size: {batch_size or 'adaptive'})")
+        background_worker(pdf_ids, batch_size, use_cache=use_cache)
+        self.stdout.write("Batch completed.")
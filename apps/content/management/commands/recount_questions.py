@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from apps.content.models import Category
+from apps.content.question_order import recount_questions
+
+
+class Command(BaseCommand):
+    help = (
+        "Recomputes the stored question counts (Category.question_count and subcategory_counts) of the given "
+        "categories, or of every category, from their questions. Ingestion keeps them up to date, this repairs "
+        "counts changed outside it, e.g. by questions deleted in the shell."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("category_ids", nargs="*", type=int)
+
+    def handle(self, *args, **options):
+        category_ids = options["category_ids"] or list(Category.objects.values_list("id", flat=True))
+        repaired = recount_questions(category_ids)
+        self.stdout.write(self.style.SUCCESS(f"Checked {len(category_ids)} categories, repaired {repaired}."))
@@ -0,0 +1,85 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import F
+
+from apps.content.json_repair import JSONRepairer
+from apps.content.llm_cache import ResponseCache
+from apps.content.models import Category, PDFUpload, PageResult, PageTriage, Question
+from apps.content.parsers import ParserSession
+from apps.content.services import save_parsed_page
+from apps.content.streaming import JSONItemStream
+
+
+class Command(BaseCommand):
+    help = (
+        "Rebuilds the questions of a PDF's category by re-running the parser over the stored per-page "
+        "model responses (PageResult), in page order and without any network calls. "
+        "Existing questions of the category and their user answers are deleted, like a reset."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("pdf_id", type=int)
+
+    def handle(self, *args, **options):
+        try:
+            pdf = PDFUpload.objects.get(id=options["pdf_id"])
+        except PDFUpload.DoesNotExist:
+            raise CommandError(f"PDF {options['pdf_id']} not found.")
+
+        if pdf.has_active_lease():
+            raise CommandError(f"PDF {pdf.id} is processing, try again once the worker is done.")
+
+        last_page = pdf.last_processed_page
+        results = {r.page_number: r for r in PageResult.objects.filter(pdf=pdf, page_number__lte=last_page)}
+        skipped = {t.page_number for t in PageTriage.objects.filter(pdf=pdf, page_number__lte=last_page) if t.should_skip}
+
+        buffer, current_subcat_state, pending_explanations = None, "Genel", {}
+        total_created = 0
+        session = ParserSession(pdf.category_id)
+        cache = ResponseCache()
+        missing_pages = []
+
+        with transaction.atomic():
+            deleted_count, _ = Question.objects.filter(category_id=pdf.category_id).delete()
+            # The replay adds the questions back through record_question_changes, counting from zero
+            Category.objects.filter(id=pdf.category_id).update(
+                question_version=F("question_version") + 1, question_count=0, subcategory_counts={}
+            )
+            self.stdout.write(f"Deleted {deleted_count} objects of category {pdf.category}.")
+
+            for page_number in range(1, last_page + 1):
+                result = results.get(page_number)
+                response = result.raw_response if result else ""
+                if page_number in skipped and not result:
+                    # Triaged away during processing, parsed as an empty page like then
+                    response = "[]"
+
+                # Decoded from the raw output the same way as a live stream, so decoding fixes apply to the replay too
+                # Repairs stay offline: local fixes and fix-call results already in the cache only
+                item_stream = JSONItemStream(JSONRepairer(cache=cache))
+                item_stream.feed(response)
+                item_stream.finish()
+                response_json = item_stream.items if response else None
+                if item_stream.failed_items and not item_stream.items:
+                    self.stdout.write(self.style.WARNING(f"Page {page_number}: stored response has no decodable items."))
+                    response_json = None
+
+                if response_json is None:
+                    missing_pages.append(page_number)
+                    continue
+
+                is_last_page = (page_number == pdf.total_pages)
+                buffer, current_subcat_state, pending_explanations, count = save_parsed_page(
+                    pdf, response_json, buffer, current_subcat_state, pending_explanations, page_number - 1, is_last_page, session
+                )
+                total_created += count
+
+            # Pages without a usable response must not move progress backwards
+            if pdf.last_processed_page != last_page:
+                pdf.last_processed_page = last_page
+                pdf.save(update_fields=["last_processed_page"])
+
+        if missing_pages:
+            self.stdout.write(self.style.WARNING(f"Skipped {len(missing_pages)} pages without a usable stored response: {missing_pages}"))
+
+        self.stdout.write(self.style.SUCCESS(f"Replayed {last_page - len(missing_pages)} pages of {pdf.title}, created {total_created} questions."))
@@ -0,0 +1,44 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.content.leases import LeaseHeartbeat, acquire_lease, release_lease, worker_id
+from apps.content.models import PDFUpload
+from apps.content.services import check_reprocess_range, reprocess_pages
+
+
+class Command(BaseCommand):
+    help = (
+        "Reprocesses pages FIRST to LAST (1-based, inclusive) of an already processed PDF in the foreground. "
+        "Only the questions of those pages are replaced, every other question and its user answers are kept. "
+        "Fresh model calls are made unless --use_cache is given."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("pdf_id", type=int)
+        parser.add_argument("first_page", type=int)
+        parser.add_argument("last_page", type=int)
+        parser.add_argument("--use_cache", action="store_true", help="Reuse cached model responses, e.g. after a parser fix")
+
+    def handle(self, *args, **options):
+        try:
+            pdf = PDFUpload.objects.get(id=options["pdf_id"])
+        except PDFUpload.DoesNotExist:
+            raise CommandError(f"PDF {options['pdf_id']} not found.")
+
+        start_page, end_page = options["first_page"] - 1, options["last_page"]
+        try:
+            check_reprocess_range(pdf, start_page, end_page)
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        owner = worker_id()
+        if not acquire_lease(pdf.id, owner):
+            raise CommandError(f"PDF {pdf.id} is being processed by another worker, try again later.")
+
+        try:
+            pdf.refresh_from_db()
+            with LeaseHeartbeat(pdf.id, owner) as heartbeat:
+                result = reprocess_pages(pdf, start_page, end_page, use_cache=options["use_cache"], should_stop=heartbeat.lost.is_set)
+        finally:
+            release_lease(pdf.id, owner)
+
+        self.stdout.write(self.style.SUCCESS(result))
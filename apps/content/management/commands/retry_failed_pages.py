@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand
+
+from apps.content.dead_letter import due_failed_pages
+from apps.content.leases import LeaseHeartbeat, acquire_lease, release_lease, worker_id
+from apps.content.models import PDFUpload
+from apps.content.services import retry_failed_pages
+
+
+class Command(BaseCommand):
+    help = (
+        "Reprocesses only the failed pages (see FailedPage) of the given PDFs, or of every PDF, in the foreground "
+        "with fresh model calls. By default only pages whose retry is due are taken, --force takes every "
+        "unresolved page including the ones given up on."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("pdf_ids", nargs="*", type=int)
+        parser.add_argument("--force", action="store_true")
+
+    def handle(self, *args, **options):
+        pdf_ids = options["pdf_ids"] or list(due_failed_pages(options["force"]).values_list("pdf_id", flat=True).distinct())
+        owner = worker_id()
+
+        for pdf in PDFUpload.objects.filter(id__in=pdf_ids).order_by("id"):
+            if not acquire_lease(pdf.id, owner):
+                self.stdout.write(self.style.WARNING(f"{pdf.title} is being processed by another worker, skipping."))
+                continue
+
+            try:
+                pdf.refresh_from_db()
+                with LeaseHeartbeat(pdf.id, owner) as heartbeat:
+                    result = retry_failed_pages(pdf, force=options["force"], should_stop=heartbeat.lost.is_set)
+            finally:
+                release_lease(pdf.id, owner)
+
+            self.stdout.write(self.style.SUCCESS(f"{pdf.title}: {result}"))
@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+
+from apps.content.constants import INGEST_MAX_MEMORY_MB, INGEST_POLL_SECONDS, PIPELINE_CONCURRENCY
+from apps.content.ingest_worker import IngestWorker
+
+
+class Command(BaseCommand):
+    help = (
+        "Long-running ingestion worker. Pulls batches queued by the admin actions and the cron trigger "
+        "and processes them in this process. Run it under a supervisor (e.g. an always-on task), "
+        "it exits cleanly on SIGTERM and when it goes over its memory limit."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--concurrency", type=int, default=PIPELINE_CONCURRENCY, help="Vision calls in flight per batch")
+        parser.add_argument("--max_memory_mb", type=int, default=INGEST_MAX_MEMORY_MB, help="Exit after a job once RSS is above this")
+        parser.add_argument("--poll_seconds", type=float, default=INGEST_POLL_SECONDS)
+        parser.add_argument("--max_jobs", type=int, default=None, help="Exit after this many jobs")
+
+    def handle(self, *args, **options):
+        worker = IngestWorker(
+            concurrency=options["concurrency"],
+            max_memory_mb=options["max_memory_mb"],
+            poll_seconds=options["poll_seconds"],
+            max_jobs=options["max_jobs"]
+        )
+        worker.run()
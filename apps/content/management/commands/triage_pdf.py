@@ -0,0 +1,37 @@
+from collections import Counter
+
+import fitz
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.content.models import PDFUpload, PageTriage
+from apps.content.triage import triage_pages
+
+
+class Command(BaseCommand):
+    help = (
+        "Triages every page of a PDF ahead of processing (blank, cover, index, duplicate) so the skip "
+        "decisions can be reviewed and overridden in the admin before any model call. "
+        "--redo drops the stored automatic decisions first, manual overrides are kept."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("pdf_id", type=int)
+        parser.add_argument("--redo", action="store_true")
+
+    def handle(self, *args, **options):
+        try:
+            pdf = PDFUpload.objects.get(id=options["pdf_id"])
+        except PDFUpload.DoesNotExist:
+            raise CommandError(f"PDF {options['pdf_id']} not found.")
+
+        if options["redo"]:
+            deleted_count, _ = PageTriage.objects.filter(pdf=pdf, override="").delete()
+            self.stdout.write(f"Dropped {deleted_count} automatic decisions.")
+
+        with fitz.open(pdf.file.path) as doc:
+            decisions = triage_pages(doc, pdf, list(range(len(doc))))
+
+        kinds = Counter(triage.kind for triage in decisions.values())
+        skipped = sum(1 for triage in decisions.values() if triage.should_skip)
+        summary = ", ".join(f"{count} {kind}" for kind, count in kinds.most_common())
+        self.stdout.write(self.style.SUCCESS(f"{pdf.title}: {summary}. {skipped}/{len(decisions)} pages will be skipped."))
@@ -0,0 +1,48 @@
+from concurrent.futures import ProcessPoolExecutor
+
+import fitz
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.content.constants import RENDER_DPI, RENDER_WORKERS
+from apps.content.models import PDFUpload
+from apps.content.page_cache import PageImageCache, file_sha256
+from apps.content.rendering import init_render_worker, warm_in_worker
+
+
+class Command(BaseCommand):
+    help = "Pre-renders every page of a PDF into the on-disk page image cache using a process pool."
+
+    def add_arguments(self, parser):
+        parser.add_argument("pdf_id", type=int)
+        parser.add_argument("--workers", type=int, default=RENDER_WORKERS)
+        parser.add_argument("--dpi", type=int, default=RENDER_DPI)
+
+    def handle(self, *args, **options):
+        try:
+            pdf = PDFUpload.objects.get(id=options["pdf_id"])
+        except PDFUpload.DoesNotExist:
+            raise CommandError(f"PDF {options['pdf_id']} not found.")
+
+        dpi = options["dpi"]
+        pdf_path = pdf.file.path
+        pdf_hash = file_sha256(pdf_path)
+        cache = PageImageCache()
+
+        with fitz.open(pdf_path) as doc:
+            page_count = len(doc)
+
+        missing_pages = [page_num for page_num in range(page_count) if not cache.has(pdf_hash, page_num, dpi, "png")]
+        self.stdout.write(f"{pdf.title}: {page_count - len(missing_pages)}/{page_count} pages already cached.")
+
+        if not missing_pages:
+            return
+
+        with ProcessPoolExecutor(max_workers=options["workers"], initializer=init_render_worker, initargs=(pdf_path, pdf_hash)) as pool:
+            for done, _ in enumerate(pool.map(warm_in_worker, missing_pages, [dpi] * len(missing_pages)), start=1):
+                if done % 25 == 0 or done == len(missing_pages):
+                    self.stdout.write(f"Rendered {done}/{len(missing_pages)} pages...")
+
+        evicted = cache.evict()
+        if evicted:
+            self.stdout.write(f"Evicted {evicted} least recently used pages to stay within the cache size cap.")
+        self.stdout.write(self.style.SUCCESS(f"Page cache warmed for {pdf.title}."))
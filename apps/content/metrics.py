@@ -0,0 +1,113 @@
+import math
+from dataclasses import dataclass, field
+from datetime import datetime
+
+from django.db.models import QuerySet
+
+from apps.content.constants import (
+    BATCH_DEFAULT_SECONDS_PER_PAGE, BATCH_MAX_PAGES, BATCH_MIN_PAGES, BATCH_SIZING_WINDOW_PAGES, BATCH_TARGET_SECONDS,
+    METRICS_IDLE_GAP_SECONDS, METRICS_WINDOW_PAGES
+)
+from apps.content.models import PDFUpload, PageResult
+
+# Dashboard label -> PageResult field
+STAGE_FIELDS = {
+    "render": "render_seconds",
+    "encode": "encode_seconds",
+    "llm": "llm_seconds",
+    "parse": "parse_seconds",
+    "db": "db_seconds",
+}
+
+
+@dataclass
+class IngestMetrics:
+    pages: int = 0
+    pages_per_minute: float | None = None
+    eta_minutes: float | None = None
+    # Stage -> (p50, p95) in seconds
+    stages: dict[str, tuple[float | None, float | None]] = field(default_factory=dict)
+    tokens_per_question: float | None = None
+    upload_bytes: int = 0
+    retries: int = 0
+
+
+def percentile(values: list[float], fraction: float) -> float | None:
+    """Nearest-rank percentile, None without values."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, math.ceil(fraction * len(ordered)) - 1))]
+
+
+def pages_per_minute(finished_at: list[datetime]) -> float | None:
+    """Throughput from the times pages were finished, idle gaps between runs are left out."""
+    ordered = sorted(finished_at)
+    busy_seconds = 0.0
+    pages = 0
+    for previous, current in zip(ordered, ordered[1:]):
+        gap = (current - previous).total_seconds()
+        if gap <= METRICS_IDLE_GAP_SECONDS:
+            busy_seconds += gap
+            pages += 1
+
+    return pages / busy_seconds * 60 if busy_seconds > 0 else None
+
+
+def collect_metrics(results: QuerySet[PageResult], remaining_pages: int = 0) -> IngestMetrics:
+    """Metrics over the most recently finished pages of `results`."""
+    rows = list(
+        results.order_by("-updated_at").values(
+            "updated_at", "from_cache", "prompt_tokens", "completion_tokens", "question_count",
+            "upload_bytes", "api_retries", "db_retries", *STAGE_FIELDS.values()
+        )[:METRICS_WINDOW_PAGES]
+    )
+    metrics = IngestMetrics(pages=len(rows))
+    if not rows:
+        return metrics
+
+    metrics.pages_per_minute = pages_per_minute([row["updated_at"] for row in rows])
+    if metrics.pages_per_minute:
+        metrics.eta_minutes = remaining_pages / metrics.pages_per_minute
+
+    for stage, field_name in STAGE_FIELDS.items():
+        values = [row[field_name] for row in rows if row[field_name] is not None]
+        metrics.stages[stage] = (percentile(values, 0.5), percentile(values, 0.95))
+
+    # Cached pages cost no tokens, counting their questions would flatter the ratio
+    billed = [row for row in rows if not row["from_cache"] and row["prompt_tokens"] is not None]
+    questions = sum(row["question_count"] for row in billed)
+    if questions:
+        metrics.tokens_per_question = sum(row["prompt_tokens"] + (row["completion_tokens"] or 0) for row in billed) / questions
+
+    metrics.upload_bytes = sum(row["upload_bytes"] or 0 for row in rows)
+    metrics.retries = sum(row["api_retries"] + row["db_retries"] for row in rows)
+    return metrics
+
+
+def pdf_metrics(pdf: PDFUpload) -> IngestMetrics:
+    return collect_metrics(pdf.page_results.all(), max(pdf.total_pages - pdf.last_processed_page, 0))
+
+
+def seconds_per_page(pdf: PDFUpload) -> float | None:
+    """Wall-clock seconds per page over the PDF's recent pages, None without enough history."""
+    finished = pdf.page_results.order_by("-updated_at").values_list("updated_at", flat=True)[:BATCH_SIZING_WINDOW_PAGES]
+    rate = pages_per_minute(list(finished))
+    return 60 / rate if rate else None
+
+
+def adaptive_batch_size(pdf: PDFUpload, target_seconds: float = BATCH_TARGET_SECONDS) -> int:
+    """
+    Pages of this PDF that fit in `target_seconds`: text-layer books get large batches, dense
+    scanned ones small batches.
+    """
+    per_page = seconds_per_page(pdf) or BATCH_DEFAULT_SECONDS_PER_PAGE
+    return max(BATCH_MIN_PAGES, min(BATCH_MAX_PAGES, int(target_seconds // per_page)))
+
+
+def format_minutes(minutes: float | None) -> str:
+    if minutes is None:
+        return "-"
+    if minutes < 60:
+        return f"{minutes:.0f}m"
+    return f"{int(minutes // 60)}h {minutes % 60:.0f}m"
@@ -0,0 +1,23 @@
+# Generated by Django 6.0.1 on 2026-10-17 03:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("content", "0005_remove_pdfupload_current_subcategory_and_more"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="pdfupload",
+            name="encoding_stats",
+            field=models.JSONField(blank=True, default=dict, help_text="Per page upload size: {page_number: {original_bytes, encoded_bytes, mime_type}}"),
+        ),
+        migrations.AddField(
+            model_name="pdfupload",
+            name="image_encoding",
+            field=models.CharField(choices=[("png", "png"), ("png_gray", "png_gray"), ("jpeg", "jpeg"), ("jpeg_gray", "jpeg_gray"), ("webp_gray", "webp_gray")], default="jpeg_gray", help_text="How rendered pages are encoded before the vision call (see IMAGE_ENCODING_PROFILES)", max_length=32),
+        ),
+    ]
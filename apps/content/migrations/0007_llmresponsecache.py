@@ -0,0 +1,28 @@
+# Generated by Django 6.0.1 on 2026-10-17 03:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("content", "0006_pdfupload_image_encoding"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="LLMResponseCache",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("cache_key", models.CharField(help_text="SHA-256 of input hash, model, prompt, temperature and context", max_length=64, unique=True)),
+                ("model_name", models.CharField(max_length=255)),
+                ("response", models.TextField()),
+                ("hit_count", models.IntegerField(default=0)),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                "verbose_name": "LLM Response Cache",
+                "verbose_name_plural": "LLM Response Cache",
+            },
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 6.0.1 on 2026-10-17 03:07
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("content", "0007_llmresponsecache"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="PageResult",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("page_number", models.IntegerField(help_text="1-based, same as Question.page_number")),
+                ("source", models.CharField(choices=[("image", "Vision (page image)"), ("text", "Text layer")], default="image", max_length=16)),
+                ("model_name", models.CharField(blank=True, max_length=255)),
+                ("from_cache", models.BooleanField(default=False)),
+                ("raw_response", models.TextField(blank=True)),
+                ("cleaned_response", models.TextField(blank=True, help_text="Response after clean_ai_response, before json.loads", null=True)),
+                ("prompt_tokens", models.IntegerField(blank=True, null=True)),
+                ("completion_tokens", models.IntegerField(blank=True, null=True)),
+                ("prepare_seconds", models.FloatField(blank=True, help_text="Text extraction or render + encode", null=True)),
+                ("llm_seconds", models.FloatField(blank=True, null=True)),
+                ("save_seconds", models.FloatField(blank=True, help_text="Parsing + DB writes", null=True)),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+                ("pdf", models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name="page_results", to="content.pdfupload")),
+            ],
+            options={
+                "unique_together": {("pdf", "page_number")},
+            },
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 6.0.1 on 2026-10-17 03:11
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('content', '0008_pageresult'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='IngestJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('batch_size', models.IntegerField(default=10)),
+                ('use_cache', models.BooleanField(default=True, help_text='Read model responses from the LLM cache')),
+                ('status', models.CharField(choices=[('queued', 'Queued'), ('running', 'Running'), ('done', 'Done'), ('failed', 'Failed')], default='queued', max_length=16)),
+                ('result', models.TextField(blank=True, help_text='Batch summary, or the error of a failed job')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('started_at', models.DateTimeField(blank=True, null=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                ('pdf', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='ingest_jobs', to='content.pdfupload')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['status', 'id'], name='content_ing_status_238d61_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,50 @@
+# Generated by Django 6.0.1 on 2026-10-17 03:13
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('content', '0009_ingestjob'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='ingestjob',
+            name='content_ing_status_238d61_idx',
+        ),
+        migrations.RemoveField(
+            model_name='ingestjob',
+            name='batch_size',
+        ),
+        migrations.AddField(
+            model_name='ingestjob',
+            name='attempts',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='ingestjob',
+            name='end_page',
+            field=models.IntegerField(default=0, help_text='0-based, exclusive'),
+        ),
+        migrations.AddField(
+            model_name='ingestjob',
+            name='priority',
+            field=models.IntegerField(default=0, help_text='Higher runs first'),
+        ),
+        migrations.AddField(
+            model_name='ingestjob',
+            name='start_page',
+            field=models.IntegerField(default=0, help_text='0-based, first page of the range'),
+        ),
+        migrations.AlterField(
+            model_name='ingestjob',
+            name='result',
+            field=models.TextField(blank=True, help_text='Batch summary, or the error of the last failed attempt'),
+        ),
+        migrations.AddIndex(
+            model_name='ingestjob',
+            index=models.Index(fields=['status', 'priority', 'start_page', 'id'], name='content_ing_status_2826de_idx'),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 6.0.1 on 2026-10-17 03:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('content', '0010_ingestjob_page_range'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='pdfupload',
+            name='lease_expires_at',
+            field=models.DateTimeField(blank=True, help_text="Renewed by the worker's heartbeat, an expired lease can be taken over by another worker", null=True),
+        ),
+        migrations.AddField(
+            model_name='pdfupload',
+            name='lease_owner',
+            field=models.CharField(blank=True, help_text='host:pid of the worker holding the lease', max_length=255),
+        ),
+        migrations.AlterField(
+            model_name='pdfupload',
+            name='is_processing',
+            field=models.BooleanField(default=False, help_text='True while a worker holds the processing lease'),
+        ),
+    ]
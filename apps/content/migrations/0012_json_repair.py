@@ -0,0 +1,41 @@
+# Generated by Django 6.0.1 on 2026-10-17 03:23
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('content', '0011_pdfupload_lease'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='pageresult',
+            name='failed_items',
+            field=models.IntegerField(default=0, help_text='Items lost because they could not be decoded or repaired'),
+        ),
+        migrations.AddField(
+            model_name='pageresult',
+            name='repaired_items',
+            field=models.IntegerField(default=0, help_text='Malformed items recovered by the JSON repair stage'),
+        ),
+        migrations.CreateModel(
+            name='JSONRepair',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('page_number', models.IntegerField(help_text='1-based, same as PageResult.page_number')),
+                ('method', models.CharField(choices=[('local', 'Local repair'), ('llm', 'Text-only fix call')], max_length=16)),
+                ('succeeded', models.BooleanField(default=False)),
+                ('truncated', models.BooleanField(default=False, help_text='The response ended inside this item')),
+                ('original_text', models.TextField()),
+                ('repaired_text', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('pdf', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='json_repairs', to='content.pdfupload')),
+            ],
+            options={
+                'verbose_name': 'JSON Repair',
+            },
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 6.0.1 on 2026-10-17 03:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('content', '0012_json_repair'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='pageresult',
+            name='model_tier',
+            field=models.CharField(blank=True, help_text='Cascade tier whose response was kept', max_length=32),
+        ),
+        migrations.AddField(
+            model_name='pageresult',
+            name='tier_attempts',
+            field=models.JSONField(blank=True, default=list, help_text='Every cascade tier tried: model, passed, seconds, problems'),
+        ),
+    ]
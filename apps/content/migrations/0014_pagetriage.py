@@ -0,0 +1,35 @@
+# Generated by Django 6.0.1 on 2026-10-17 03:26
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('content', '0013_pageresult_model_tier'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PageTriage',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('page_number', models.IntegerField(help_text='1-based, same as PageResult.page_number')),
+                ('kind', models.CharField(choices=[('content', 'Content'), ('blank', 'Blank'), ('cover', 'Cover'), ('index', 'Table of contents'), ('duplicate', 'Duplicate')], default='content', max_length=16)),
+                ('duplicate_of', models.IntegerField(blank=True, help_text='Page number of the earlier page this one repeats', null=True)),
+                ('override', models.CharField(blank=True, choices=[('process', 'Always process'), ('skip', 'Always skip')], help_text='Manual decision, wins over `kind`', max_length=16)),
+                ('text_chars', models.IntegerField(default=0)),
+                ('ink_coverage', models.FloatField(default=0)),
+                ('phash', models.CharField(blank=True, help_text='Difference hash of a small grayscale render', max_length=64)),
+                ('text_hash', models.CharField(blank=True, help_text='SHA-256 of the whitespace-normalized text layer', max_length=64)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('pdf', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='page_triage', to='content.pdfupload')),
+            ],
+            options={
+                'verbose_name': 'Page Triage',
+                'verbose_name_plural': 'Page Triage',
+                'unique_together': {('pdf', 'page_number')},
+            },
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 6.0.1 on 2026-10-17 03:29
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('content', '0014_pagetriage'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='pdfupload',
+            name='layout_mode',
+            field=models.CharField(choices=[('page', 'Whole page'), ('columns', 'Split columns')], default='page', help_text='How page images are sent to the vision model: whole, or split at the column gutter into two requests', max_length=16),
+        ),
+        migrations.AlterField(
+            model_name='pdfupload',
+            name='encoding_stats',
+            field=models.JSONField(blank=True, default=dict, help_text='Per page upload size: {page_number: {original_bytes, encoded_bytes, mime_type, requests}}'),
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 6.0.1 on 2026-10-17 03:34
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('content', '0015_pdfupload_layout_mode'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ingestjob',
+            name='kind',
+            field=models.CharField(choices=[('ingest', 'Ingest'), ('reprocess', 'Reprocess')], default='ingest', help_text='Reprocess replaces the questions of an already processed range', max_length=16),
+        ),
+        migrations.CreateModel(
+            name='ParserCheckpoint',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('page_number', models.IntegerField(help_text='1-based, the state holds after this page was parsed')),
+                ('state', models.JSONField(default=dict, help_text='buffer, subcategory and pending_explanations, same shape as PDFUpload.parser_state')),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('pdf', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='parser_checkpoints', to='content.pdfupload')),
+            ],
+            options={
+                'unique_together': {('pdf', 'page_number')},
+            },
+        ),
+    ]
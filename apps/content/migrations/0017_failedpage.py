@@ -0,0 +1,35 @@
+# Generated by Django 6.0.1 on 2026-10-17 03:38
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('content', '0016_parsercheckpoint'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FailedPage',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('page_number', models.IntegerField(help_text='1-based, same as PageResult.page_number')),
+                ('error_class', models.CharField(choices=[('api', 'Model/API error'), ('decode', 'Undecodable response'), ('database', 'Database error'), ('other', 'Other')], default='other', max_length=16)),
+                ('error', models.TextField(blank=True, help_text='Exception of the last failed attempt')),
+                ('payload', models.TextField(blank=True, help_text='Raw model response of the last failed attempt, if there was one')),
+                ('attempts', models.IntegerField(default=1)),
+                ('status', models.CharField(choices=[('pending', 'Pending retry'), ('resolved', 'Resolved'), ('gave_up', 'Gave up')], default='pending', max_length=16)),
+                ('next_retry_at', models.DateTimeField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('resolved_at', models.DateTimeField(blank=True, null=True)),
+                ('pdf', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='failed_pages', to='content.pdfupload')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['status', 'next_retry_at'], name='content_fai_status_9c4d37_idx')],
+                'unique_together': {('pdf', 'page_number')},
+            },
+        ),
+    ]
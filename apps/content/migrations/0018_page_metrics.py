@@ -0,0 +1,53 @@
+# Generated by Django 6.0.1 on 2026-10-17 03:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('content', '0017_failedpage'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='pageresult',
+            name='api_retries',
+            field=models.IntegerField(default=0, help_text='Model requests retried after rate limits or transient errors'),
+        ),
+        migrations.AddField(
+            model_name='pageresult',
+            name='db_retries',
+            field=models.IntegerField(default=0, help_text='Save attempts repeated after a lost DB connection'),
+        ),
+        migrations.AddField(
+            model_name='pageresult',
+            name='db_seconds',
+            field=models.FloatField(blank=True, help_text="The page's write transaction", null=True),
+        ),
+        migrations.AddField(
+            model_name='pageresult',
+            name='encode_seconds',
+            field=models.FloatField(blank=True, help_text='Image encoding of every request of the page', null=True),
+        ),
+        migrations.AddField(
+            model_name='pageresult',
+            name='parse_seconds',
+            field=models.FloatField(blank=True, help_text='Parsing, including the wait for streamed items', null=True),
+        ),
+        migrations.AddField(
+            model_name='pageresult',
+            name='question_count',
+            field=models.IntegerField(default=0, help_text='Questions created from the page'),
+        ),
+        migrations.AddField(
+            model_name='pageresult',
+            name='render_seconds',
+            field=models.FloatField(blank=True, help_text='Text extraction or rasterizing, prepare_seconds without encoding', null=True),
+        ),
+        migrations.AddField(
+            model_name='pageresult',
+            name='upload_bytes',
+            field=models.IntegerField(blank=True, help_text='Encoded image or text layer bytes sent to the model', null=True),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 6.0.1 on 2026-10-17 03:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('content', '0018_page_metrics'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='category',
+            name='question_version',
+            field=models.PositiveIntegerField(default=0, editable=False, help_text="Bumped whenever ingestion changes the category's questions"),
+        ),
+    ]
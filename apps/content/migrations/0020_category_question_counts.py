@@ -0,0 +1,43 @@
+# Generated by Django 6.0.1 on 2026-10-17 03:48
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def count_questions(apps, schema_editor):
+    Category = apps.get_model("content", "Category")
+    Question = apps.get_model("content", "Question")
+
+    counts = {}
+    rows = Question.objects.values("category_id", "subcategory").annotate(total=Count("id")).order_by()
+    for row in rows:
+        subcategory_counts = counts.setdefault(row["category_id"], {})
+        key = row["subcategory"] or ""
+        subcategory_counts[key] = subcategory_counts.get(key, 0) + row["total"]
+
+    for category_id, subcategory_counts in counts.items():
+        Category.objects.filter(id=category_id).update(
+            question_count=sum(subcategory_counts.values()),
+            subcategory_counts=subcategory_counts
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('content', '0019_category_question_version'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='category',
+            name='question_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='category',
+            name='subcategory_counts',
+            field=models.JSONField(blank=True, default=dict, editable=False, help_text='Subcategory -> question count'),
+        ),
+        migrations.RunPython(count_questions, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 6.0.1 on 2026-10-17 03:57
+
+from django.db import migrations, models
+
+
+def restore_lossless(apps, schema_editor):
+    # 0006 gave every book jpeg_gray without anyone choosing it, those go back to the lossless PNG
+    PDFUpload = apps.get_model("content", "PDFUpload")
+    PDFUpload.objects.filter(image_encoding="jpeg_gray").update(image_encoding="png")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('content', '0020_category_question_counts'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='pdfupload',
+            name='image_encoding',
+            field=models.CharField(choices=[('png', 'png'), ('png_gray', 'png_gray'), ('jpeg', 'jpeg'), ('jpeg_gray', 'jpeg_gray'), ('webp_gray', 'webp_gray')], default='png', help_text='How rendered pages are encoded before the vision call (see IMAGE_ENCODING_PROFILES), lossy profiles are opt-in', max_length=32),
+        ),
+        migrations.RunPython(restore_lossless, migrations.RunPython.noop),
+    ]
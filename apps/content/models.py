@@ -1,5 +1,8 @@
 from typing import Any
 from django.db import models
+from django.utils import timezone
+
+from apps.content.constants import DEFAULT_IMAGE_ENCODING, DEFAULT_LAYOUT_MODE, IMAGE_ENCODING_PROFILES, LAYOUT_MODES
 
 
 class Test(models.Model):
@@ -14,6 +17,10 @@ class Category(models.Model):
     """Level 2: The Chapter/File (e.g., 'HEMATOLOJİ', 'KARDİYOLOJİ')"""
     test = models.ForeignKey(Test, on_delete=models.CASCADE, related_name="categories")
     name = models.CharField(max_length=255)
+    question_version = models.PositiveIntegerField(default=0, editable=False, help_text="Bumped whenever ingestion changes the category's questions")
+    # Kept by ingestion in the transaction that writes the questions, recount_questions repairs them
+    question_count = models.PositiveIntegerField(default=0, editable=False)
+    subcategory_counts = models.JSONField(default=dict, blank=True, editable=False, help_text="Subcategory -> question count")
 
     class Meta:
         unique_together = ("test", "name")
@@ -34,8 +41,27 @@ class PDFUpload(models.Model):
         help_text="Stores parsing state between pages: buffer, subcategory, pending_explanations"
     )
 
+    image_encoding = models.CharField(
+        max_length=32, default=DEFAULT_IMAGE_ENCODING,
+        choices=[(name, name) for name in IMAGE_ENCODING_PROFILES],
+        help_text="How rendered pages are encoded before the vision call (see IMAGE_ENCODING_PROFILES), lossy profiles are opt-in"
+    )
+    layout_mode = models.CharField(
+        max_length=16, default=DEFAULT_LAYOUT_MODE, choices=LAYOUT_MODES,
+        help_text="How page images are sent to the vision model: whole, or split at the column gutter into two requests"
+    )
+    encoding_stats = models.JSONField(
+        default=dict, blank=True,
+        help_text="Per page upload size: {page_number: {original_bytes, encoded_bytes, mime_type, requests}}"
+    )
+
     # Progress
-    is_processing = models.BooleanField(default=False, help_text="True if background task is running")
+    is_processing = models.BooleanField(default=False, help_text="True while a worker holds the processing lease")
+    lease_owner = models.CharField(max_length=255, blank=True, help_text="host:pid of the worker holding the lease")
+    lease_expires_at = models.DateTimeField(
+        null=True, blank=True,
+        help_text="Renewed by the worker's heartbeat, an expired lease can be taken over by another worker"
+    )
     total_pages = models.IntegerField(default=0)
     last_processed_page = models.IntegerField(default=0)
 
@@ -69,8 +95,8 @@ class PDFUpload(models.Model):
                 # Catch the error so if GitHub is down, it doesn't crash your Django Admin
                 print(f"❌ Failed to enable GitHub Cron: {e}")
 
-            # Start processing the first batch immediately
-            print("🚀 Triggering initial PDF processing batch...")
+            # Queue the first batch immediately
+            print("📥 Queueing initial PDF processing batch...")
             trigger_next_pdf_batch(is_cron=False)
 
     def delete(self, *args: Any, **kwargs: Any) -> None:
@@ -88,11 +114,15 @@ class PDFUpload(models.Model):
         """
         Returns True if the file should be read-only.
         Locked if:
-        1. It is currently processing (background task running).
+        1. It is currently processing (a worker holds an unexpired lease).
         2. It is fully completed (all pages done).
         """
         is_finished = (self.total_pages > 0 and self.last_processed_page >= self.total_pages)
-        return self.is_processing or is_finished
+        return self.has_active_lease() or is_finished
+
+    def has_active_lease(self) -> bool:
+        """A crashed worker leaves is_processing set, its lease still runs out."""
+        return self.is_processing and self.lease_expires_at is not None and self.lease_expires_at > timezone.now()
 
     def __str__(self) -> str:
         return self.title
@@ -120,3 +150,231 @@ class Question(models.Model):
 
     def __str__(self) -> str:
         return f"{self.text[:50]}..."
+
+
+class PageResult(models.Model):
+    """Raw model output and timings of the last processing run of one PDF page"""
+    SOURCE_IMAGE = "image"
+    SOURCE_TEXT = "text"
+    SOURCE_CHOICES = [(SOURCE_IMAGE, "Vision (page image)"), (SOURCE_TEXT, "Text layer")]
+
+    pdf = models.ForeignKey(PDFUpload, on_delete=models.CASCADE, related_name="page_results")
+    page_number = models.IntegerField(help_text="1-based, same as Question.page_number")
+
+    source = models.CharField(max_length=16, choices=SOURCE_CHOICES, default=SOURCE_IMAGE)
+    model_name = models.CharField(max_length=255, blank=True)
+    from_cache = models.BooleanField(default=False)
+    raw_response = models.TextField(blank=True)
+    cleaned_response = models.TextField(blank=True, null=True, help_text="Response after clean_ai_response, before json.loads")
+
+    prompt_tokens = models.IntegerField(null=True, blank=True)
+    completion_tokens = models.IntegerField(null=True, blank=True)
+    prepare_seconds = models.FloatField(null=True, blank=True, help_text="Text extraction or render + encode")
+    render_seconds = models.FloatField(null=True, blank=True, help_text="Text extraction or rasterizing, prepare_seconds without encoding")
+    encode_seconds = models.FloatField(null=True, blank=True, help_text="Image encoding of every request of the page")
+    upload_bytes = models.IntegerField(null=True, blank=True, help_text="Encoded image or text layer bytes sent to the model")
+    llm_seconds = models.FloatField(null=True, blank=True)
+    save_seconds = models.FloatField(null=True, blank=True, help_text="Parsing + DB writes")
+    parse_seconds = models.FloatField(null=True, blank=True, help_text="Parsing, including the wait for streamed items")
+    db_seconds = models.FloatField(null=True, blank=True, help_text="The page's write transaction")
+    api_retries = models.IntegerField(default=0, help_text="Model requests retried after rate limits or transient errors")
+    db_retries = models.IntegerField(default=0, help_text="Save attempts repeated after a lost DB connection")
+    question_count = models.IntegerField(default=0, help_text="Questions created from the page")
+    repaired_items = models.IntegerField(default=0, help_text="Malformed items recovered by the JSON repair stage")
+    failed_items = models.IntegerField(default=0, help_text="Items lost because they could not be decoded or repaired")
+    model_tier = models.CharField(max_length=32, blank=True, help_text="Cascade tier whose response was kept")
+    tier_attempts = models.JSONField(default=list, blank=True, help_text="Every cascade tier tried: model, passed, seconds, problems")
+
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ("pdf", "page_number")
+
+    def __str__(self) -> str:
+        return f"{self.pdf} - Page {self.page_number}"
+
+
+class PageTriage(models.Model):
+    """Pre-LLM classification of one PDF page, decides whether the page is sent to the model at all"""
+    KIND_CONTENT = "content"
+    KIND_BLANK = "blank"
+    KIND_COVER = "cover"
+    KIND_INDEX = "index"
+    KIND_DUPLICATE = "duplicate"
+    KIND_CHOICES = [
+        (KIND_CONTENT, "Content"),
+        (KIND_BLANK, "Blank"),
+        (KIND_COVER, "Cover"),
+        (KIND_INDEX, "Table of contents"),
+        (KIND_DUPLICATE, "Duplicate"),
+    ]
+
+    OVERRIDE_PROCESS = "process"
+    OVERRIDE_SKIP = "skip"
+    OVERRIDE_CHOICES = [(OVERRIDE_PROCESS, "Always process"), (OVERRIDE_SKIP, "Always skip")]
+
+    pdf = models.ForeignKey(PDFUpload, on_delete=models.CASCADE, related_name="page_triage")
+    page_number = models.IntegerField(help_text="1-based, same as PageResult.page_number")
+    kind = models.CharField(max_length=16, choices=KIND_CHOICES, default=KIND_CONTENT)
+    duplicate_of = models.IntegerField(null=True, blank=True, help_text="Page number of the earlier page this one repeats")
+    override = models.CharField(max_length=16, choices=OVERRIDE_CHOICES, blank=True, help_text="Manual decision, wins over `kind`")
+
+    text_chars = models.IntegerField(default=0)
+    ink_coverage = models.FloatField(default=0)
+    phash = models.CharField(max_length=64, blank=True, help_text="Difference hash of a small grayscale render")
+    text_hash = models.CharField(max_length=64, blank=True, help_text="SHA-256 of the whitespace-normalized text layer")
+
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ("pdf", "page_number")
+        verbose_name = "Page Triage"
+        verbose_name_plural = "Page Triage"
+
+    def __str__(self) -> str:
+        return f"{self.pdf} - Page {self.page_number} ({self.kind})"
+
+    @property
+    def should_skip(self) -> bool:
+        if self.override:
+            return self.override == self.OVERRIDE_SKIP
+        return self.kind != self.KIND_CONTENT
+
+
+class ParserCheckpoint(models.Model):
+    """Parser carry-over state after one page, so a page range can be reprocessed from stored state"""
+    pdf = models.ForeignKey(PDFUpload, on_delete=models.CASCADE, related_name="parser_checkpoints")
+    page_number = models.IntegerField(help_text="1-based, the state holds after this page was parsed")
+    state = models.JSONField(default=dict, help_text="buffer, subcategory and pending_explanations, same shape as PDFUpload.parser_state")
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ("pdf", "page_number")
+
+    def __str__(self) -> str:
+        return f"{self.pdf} - After Page {self.page_number}"
+
+
+class FailedPage(models.Model):
+    """Dead-letter entry of a page whose processing failed, retried on its own (see retry_failed_pages)"""
+    ERROR_API = "api"
+    ERROR_DECODE = "decode"
+    ERROR_DATABASE = "database"
+    ERROR_OTHER = "other"
+    ERROR_CHOICES = [
+        (ERROR_API, "Model/API error"),
+        (ERROR_DECODE, "Undecodable response"),
+        (ERROR_DATABASE, "Database error"),
+        (ERROR_OTHER, "Other"),
+    ]
+
+    STATUS_PENDING = "pending"
+    STATUS_RESOLVED = "resolved"
+    STATUS_GAVE_UP = "gave_up"
+    STATUS_CHOICES = [(STATUS_PENDING, "Pending retry"), (STATUS_RESOLVED, "Resolved"), (STATUS_GAVE_UP, "Gave up")]
+
+    pdf = models.ForeignKey(PDFUpload, on_delete=models.CASCADE, related_name="failed_pages")
+    page_number = models.IntegerField(help_text="1-based, same as PageResult.page_number")
+    error_class = models.CharField(max_length=16, choices=ERROR_CHOICES, default=ERROR_OTHER)
+    error = models.TextField(blank=True, help_text="Exception of the last failed attempt")
+    payload = models.TextField(blank=True, help_text="Raw model response of the last failed attempt, if there was one")
+    attempts = models.IntegerField(default=1)
+    status = models.CharField(max_length=16, choices=STATUS_CHOICES, default=STATUS_PENDING)
+    next_retry_at = models.DateTimeField(null=True, blank=True)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    resolved_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        unique_together = ("pdf", "page_number")
+        indexes = [
+            models.Index(fields=["status", "next_retry_at"]),
+        ]
+
+    def __str__(self) -> str:
+        return f"{self.pdf} - Page {self.page_number} ({self.error_class}, {self.status})"
+
+
+class JSONRepair(models.Model):
+    """One repair attempt on a malformed array item of a page response"""
+    METHOD_LOCAL = "local"
+    METHOD_LLM = "llm"
+    METHOD_CHOICES = [(METHOD_LOCAL, "Local repair"), (METHOD_LLM, "Text-only fix call")]
+
+    pdf = models.ForeignKey(PDFUpload, on_delete=models.CASCADE, related_name="json_repairs")
+    page_number = models.IntegerField(help_text="1-based, same as PageResult.page_number")
+    method = models.CharField(max_length=16, choices=METHOD_CHOICES)
+    succeeded = models.BooleanField(default=False)
+    truncated = models.BooleanField(default=False, help_text="The response ended inside this item")
+    original_text = models.TextField()
+    repaired_text = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name = "JSON Repair"
+
+    def __str__(self) -> str:
+        return f"{self.pdf} - Page {self.page_number} ({self.method})"
+
+
+class LLMResponseCache(models.Model):
+    """Raw model output per page input, so re-processing a PDF does not call Groq again"""
+    cache_key = models.CharField(max_length=64, unique=True, help_text="SHA-256 of input hash, model, prompt, temperature and context")
+    model_name = models.CharField(max_length=255)
+    response = models.TextField()
+    hit_count = models.IntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name = "LLM Response Cache"
+        verbose_name_plural = "LLM Response Cache"
+
+    def __str__(self) -> str:
+        return f"{self.model_name} [{self.cache_key[:12]}]"
+
+
+class IngestJob(models.Model):
+    """
+    One page range of a PDF, queued by the admin/trigger and run by the run_ingest_worker daemons.
+    Ranges of the same PDF run in page order (the parser carries state between pages), ranges of
+    different PDFs run in parallel on as many workers as there are. Reprocess ranges wait until
+    ingestion has moved past them.
+    """
+    STATUS_QUEUED = "queued"
+    STATUS_RUNNING = "running"
+    STATUS_DONE = "done"
+    STATUS_FAILED = "failed"
+    STATUS_CHOICES = [
+        (STATUS_QUEUED, "Queued"),
+        (STATUS_RUNNING, "Running"),
+        (STATUS_DONE, "Done"),
+        (STATUS_FAILED, "Failed"),
+    ]
+
+    KIND_INGEST = "ingest"
+    KIND_REPROCESS = "reprocess"
+    KIND_CHOICES = [(KIND_INGEST, "Ingest"), (KIND_REPROCESS, "Reprocess")]
+
+    pdf = models.ForeignKey(PDFUpload, on_delete=models.CASCADE, related_name="ingest_jobs")
+    kind = models.CharField(max_length=16, choices=KIND_CHOICES, default=KIND_INGEST, help_text="Reprocess replaces the questions of an already processed range")
+    start_page = models.IntegerField(default=0, help_text="0-based, first page of the range")
+    end_page = models.IntegerField(default=0, help_text="0-based, exclusive")
+    use_cache = models.BooleanField(default=True, help_text="Read model responses from the LLM cache")
+
+    priority = models.IntegerField(default=0, help_text="Higher runs first")
+    status = models.CharField(max_length=16, choices=STATUS_CHOICES, default=STATUS_QUEUED)
+    attempts = models.IntegerField(default=0)
+    result = models.TextField(blank=True, help_text="Batch summary, or the error of the last failed attempt")
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["status", "priority", "start_page", "id"]),
+        ]
+
+    def __str__(self) -> str:
+        return f"{self.pdf} - Pages {self.start_page + 1}-{self.end_page} ({self.status})"
@@ -0,0 +1,97 @@
+import os
+import hashlib
+from pathlib import Path
+
+from django.conf import settings
+
+from apps.content.constants import PAGE_CACHE_MAX_BYTES
+
+_hash_memo: dict[tuple[str, int, int], str] = {}
+
+
+def file_sha256(path: str) -> str:
+    """Content hash of a PDF, memoized per (path, size, mtime) so a batch only reads the file once."""
+    stat = os.stat(path)
+    memo_key = (path, stat.st_size, stat.st_mtime_ns)
+    if memo_key in _hash_memo:
+        return _hash_memo[memo_key]
+
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+
+    _hash_memo[memo_key] = digest.hexdigest()
+    return _hash_memo[memo_key]
+
+
+class PageImageCache:
+    """
+    Content-addressed cache of rendered page images on disk.
+    Key = PDF SHA-256 + page index + DPI + encoding, so a reset or a re-uploaded copy
+    of the same file never gets rasterized twice. A hit refreshes the file mtime,
+    eviction removes the least recently used files once the cache exceeds `max_bytes`.
+    Eviction scans the whole directory, so it runs once per batch (or warm-up), not per write.
+    """
+
+    def __init__(self, cache_dir: str | None = None, max_bytes: int = PAGE_CACHE_MAX_BYTES) -> None:
+        self.cache_dir = Path(cache_dir or settings.PAGE_CACHE_DIR)
+        self.max_bytes = max_bytes
+
+    def path_for(self, pdf_hash: str, page_num: int, dpi: int, encoding: str) -> Path:
+        return self.cache_dir / pdf_hash[:2] / pdf_hash / f"{page_num}_{dpi}.{encoding}"
+
+    def get(self, pdf_hash: str, page_num: int, dpi: int, encoding: str) -> bytes | None:
+        path = self.path_for(pdf_hash, page_num, dpi, encoding)
+        try:
+            data = path.read_bytes()
+        except FileNotFoundError:
+            return None
+
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return data
+
+    def has(self, pdf_hash: str, page_num: int, dpi: int, encoding: str) -> bool:
+        return self.path_for(pdf_hash, page_num, dpi, encoding).exists()
+
+    def put(self, pdf_hash: str, page_num: int, dpi: int, encoding: str, data: bytes) -> None:
+        path = self.path_for(pdf_hash, page_num, dpi, encoding)
+        path.parent.mkdir(parents=True, exist_ok=True)
+
+        # Write + rename so concurrent render workers never read a half-written file
+        tmp_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+        tmp_path.write_bytes(data)
+        os.replace(tmp_path, path)
+
+    def evict(self) -> int:
+        entries = []
+        total_size = 0
+        for path in self.cache_dir.rglob("*_*.*"):
+            if path.suffix == ".tmp":
+                continue
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+            total_size += stat.st_size
+
+        if total_size <= self.max_bytes:
+            return 0
+
+        removed = 0
+        entries.sort()
+        for _, size, path in entries:
+            if total_size <= self.max_bytes:
+                break
+            try:
+                path.unlink()
+                removed += 1
+            except FileNotFoundError:
+                pass
+            total_size -= size
+
+        return removed
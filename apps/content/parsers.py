@@ -1,8 +1,33 @@
 import re
+from collections.abc import Iterable
 from typing import Any
+
+from django.db import connection
+from django.db.models import Max, Q
+
 from apps.content.models import PDFUpload, Question
 
 
+def clean_ai_response(response: str) -> str:
+    """Strips markdown fences and conversational filler around the JSON list returned by the model."""
+    # Find the first '[' and the last ']'
+    json_match = re.search(r"\[.*\]", response, re.DOTALL)
+    if json_match:
+        response_cleaned = json_match.group(0)
+    else:
+        response_cleaned = response
+
+    # Extra safeguard for common markdown fences
+    response_cleaned = response_cleaned.replace("```json", "").replace("```", "").strip()
+
+    return defuse_unicode_escapes(response_cleaned)
+
+
+def defuse_unicode_escapes(text: str) -> str:
+    """Escapes malformed hallucinated \\u sequences that crash the JSON parser."""
+    return re.sub(r"\\u(?![0-9a-fA-F]{4})", r"\\\\u", text)
+
+
 def get_correct_option(item: dict[str, Any]) -> str:
     correct_opt = item.get("correct_option")
     if not correct_opt:
@@ -14,31 +39,183 @@ def get_correct_option(item: dict[str, Any]) -> str:
     return correct_opt
 
 
+def segments(text: str | None, separator: str) -> list[str]:
+    return [part.strip() for part in (text or "").split(separator) if part.strip()]
+
+
+def contains_run(items: list[str], run: list[str]) -> bool:
+    """Whether `run` appears in `items` as consecutive whole items."""
+    size = len(run)
+    return any(items[start:start + size] == run for start in range(len(items) - size + 1))
+
+
+def append_once(existing: str | None, addition: str, separator: str = "\n\n") -> str:
+    """
+    Appends to a text of an earlier page unless it is already there as whole segments, so reprocessing
+    a page range does not add the same explanation to the questions before it a second time.
+    """
+    existing = existing or ""
+    if contains_run(segments(existing, separator), segments(addition, separator)):
+        return existing
+    return (existing + separator + addition).strip()
+
+
+def as_question_number(value: Any) -> int | None:
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+class ParserSession:
+    """
+    Category state shared by the parsers of all pages of a batch.
+    Loads a (question_number, subcategory) -> id index of the category once, and keeps the loaded
+    Question objects, so linking explanations to earlier pages is a dict lookup instead of a query.
+    Questions carry no PDF, so the index is the category's: acquire_lease never lets two PDFs of one
+    category be processed at once.
+    """
+
+    def __init__(self, category_id: int, before_page: int | None = None) -> None:
+        self.category_id = category_id
+        # Reprocessing from this 1-based page: questions of later pages are about to be replaced
+        self.before_page = before_page
+        # Only a reprocessing run can meet text it already merged into earlier questions
+        self.reprocessing = before_page is not None
+        self.created_after: int | None = None
+        self.by_key: dict[tuple[int, str | None], int] = {}
+        self.by_number: dict[int, int] = {}
+        self.last_id: int | None = None
+        self.questions: dict[int, Question] = {}
+        self._loaded = False
+
+    def _index(self, question_id: int, question_number: int | None, subcategory: str | None) -> None:
+        # Ids only grow, so the latest question wins like the old order_by("-id").first()
+        if question_number is not None:
+            self.by_key[(question_number, subcategory)] = question_id
+            self.by_number[question_number] = question_id
+        if self.last_id is None or question_id > self.last_id:
+            self.last_id = question_id
+
+    def load(self) -> None:
+        if self._loaded:
+            return
+        rows = Question.objects.filter(category_id=self.category_id)
+        if self.before_page is not None:
+            if self.created_after is None:
+                self.created_after = rows.aggregate(newest=Max("id"))["newest"] or 0
+            # Only what comes before the range, plus what the reprocessing itself created since
+            rows = rows.filter(Q(page_number__lt=self.before_page) | Q(page_number__isnull=True) | Q(id__gt=self.created_after))
+        rows = rows.order_by("id").values_list("id", "question_number", "subcategory")
+        for question_id, question_number, subcategory in rows.iterator():
+            self._index(question_id, question_number, subcategory)
+        self._loaded = True
+
+    def invalidate(self) -> None:
+        """Drops everything after a failed save, the in-memory objects may hold rolled back edits."""
+        self.by_key.clear()
+        self.by_number.clear()
+        self.questions.clear()
+        self.last_id = None
+        self._loaded = False
+
+    def find_id(self, question_number: Any, subcategory: str | None) -> int | None:
+        """Latest question with this number, preferring the given subcategory."""
+        question_number = as_question_number(question_number)
+        if question_number is None:
+            return None
+
+        self.load()
+        if subcategory:
+            question_id = self.by_key.get((question_number, subcategory))
+            if question_id:
+                return question_id
+        return self.by_number.get(question_number)
+
+    def prefetch(self, question_ids: list[int]) -> None:
+        missing = [question_id for question_id in question_ids if question_id not in self.questions]
+        if missing:
+            self.questions.update(Question.objects.in_bulk(missing))
+
+    def get(self, question_id: int | None) -> Question | None:
+        if question_id is None:
+            return None
+        if question_id not in self.questions:
+            self.prefetch([question_id])
+        return self.questions.get(question_id)
+
+    def get_last(self) -> Question | None:
+        self.load()
+        return self.get(self.last_id)
+
+    def register_created(self, questions: list[Question]) -> None:
+        """Adds the questions of a saved page to the index."""
+        if not self._loaded or not questions:
+            return
+
+        if connection.features.can_return_rows_from_bulk_insert:
+            for question in questions:
+                self.questions[question.id] = question
+                self._index(question.id, question.question_number, question.subcategory)
+            return
+
+        # MySQL does not return ids from bulk_create, read back what was just inserted
+        rows = Question.objects.filter(category_id=self.category_id, id__gt=max(self.last_id or 0, self.created_after or 0)).order_by("id")
+        for question_id, question_number, subcategory in rows.values_list("id", "question_number", "subcategory"):
+            self._index(question_id, question_number, subcategory)
+
+
 class QuestionParser:
-    def __init__(self, pdf: PDFUpload, buffer: dict[str, Any] | None, current_subcat_state: str | None, pending_explanations: dict[str, str]) -> None:
+    def __init__(
+        self,
+        pdf: PDFUpload,
+        buffer: dict[str, Any] | None,
+        current_subcat_state: str | None,
+        pending_explanations: dict[str, str] | None = None,
+        session: ParserSession | None = None
+    ) -> None:
         self.pdf = pdf
+        self.session = session or ParserSession(pdf.category_id)
         self.new_buffer = buffer
         self.active_subcat = current_subcat_state
         self.questions_to_create: list[Question] = []
+        self.created_by_number: dict[int, Question] = {}
         self.questions_to_update_map: dict[int, Question] = {}
         self.pending_explanations: dict[str, str] = pending_explanations.copy() if pending_explanations else {}
-        self._cached_last_db_q: Question | None = None
         self.page_num: int = 0
 
-    def get_last_db_question(self) -> Question | None:
-        if self._cached_last_db_q:
-            return self._cached_last_db_q
+    def add_question(self, question: Question) -> None:
+        self.questions_to_create.append(question)
+        question_number = as_question_number(question.question_number)
+        if question_number is not None:
+            # First one wins, like the old scan over questions_to_create
+            self.created_by_number.setdefault(question_number, question)
 
-        qs = Question.objects.filter(category_id=self.pdf.category_id)
-        q = qs.order_by("-id").first()
+    def touch(self, question: Question) -> Question:
+        """Marks a saved question as modified so it gets bulk-updated with the page."""
+        self.questions_to_update_map[question.id] = question
+        return question
 
-        if q:
-            if q.id in self.questions_to_update_map:
-                self._cached_last_db_q = self.questions_to_update_map[q.id]
-            else:
-                self._cached_last_db_q = q
-                self.questions_to_update_map[q.id] = q
-        return self._cached_last_db_q
+    def get_last_db_question(self) -> Question | None:
+        q = self.session.get_last()
+        return self.touch(q) if q else None
+
+    def append_to_saved(self, existing: str | None, addition: str) -> str:
+        """Appends to a text of an earlier page, skipping what a reprocessing run already added once."""
+        if self.session.reprocessing:
+            return append_once(existing, addition)
+        return ((existing or "") + f"\n\n{addition}").strip()
+
+    @staticmethod
+    def already_merged(question: Question, text_part: str, options: list[str], expl_part: str) -> bool:
+        """Whether every part of a fragment is in the question as whole words, options and lines, the way handle_fragment joins them."""
+        if not (text_part or options or expl_part):
+            return False
+        return (
+            contains_run(question.text.split(), text_part.split())
+            and contains_run(question.options or [], options)
+            and contains_run(segments(question.explanation, "\n"), segments(expl_part, "\n"))
+        )
 
     def clean_options(self, raw_options: list[str]) -> list[str]:
         cleaned_options = []
@@ -67,7 +244,7 @@ class QuestionParser:
         else:
             last_db_q = self.get_last_db_question()
             if last_db_q:
-                last_db_q.explanation = ((last_db_q.explanation or "") + f"\n\n[Alternatif Soru/Kutu]:\n{box_content}").strip()
+                last_db_q.explanation = self.append_to_saved(last_db_q.explanation, f"[Alternatif Soru/Kutu]:\n{box_content}")
 
     def handle_explanation_only(self, item: dict[str, Any]) -> None:
         explanation_text = (item.get("explanation") or "").strip()
@@ -77,42 +254,20 @@ class QuestionParser:
             return
 
         if linked_q_num:
-            # Check in current batch first
-            found_in_batch = next((q for q in self.questions_to_create if q.question_number == linked_q_num), None)
-            if found_in_batch:
-                found_in_batch.explanation = ((found_in_batch.explanation or "") + f"\n\n{explanation_text}").strip()
+            # Questions of this page first, then the category index
+            target_q = self.created_by_number.get(as_question_number(linked_q_num))
+            if target_q:
+                target_q.explanation = ((target_q.explanation or "") + f"\n\n{explanation_text}").strip()
+                return
+
+            target_q = self.session.get(self.session.find_id(linked_q_num, self.active_subcat))
+            if target_q:
+                self.touch(target_q)
+                target_q.explanation = self.append_to_saved(target_q.explanation, explanation_text)
             else:
-                # Check in updated map
-                found_in_updates = next((q for q in self.questions_to_update_map.values() if q.question_number == linked_q_num), None)
-                if found_in_updates:
-                    found_in_updates.explanation = ((found_in_updates.explanation or "") + f"\n\n{explanation_text}").strip()
-                else:
-                    # Check in DB with Safety Filters
-                    try:
-                        qs = Question.objects.filter(
-                            category_id=self.pdf.category_id, 
-                            question_number=linked_q_num
-                        )
-
-                        recent_q = None
-
-                        # Filter 2: Subcategory Preference
-                        if self.active_subcat:
-                            recent_q = qs.filter(subcategory=self.active_subcat).order_by("-id").first()
-
-                        # Fallback: If no subcategory match (or no subcat), take the most recent in range
-                        if not recent_q:
-                            recent_q = qs.order_by("-id").first()
-
-                        if recent_q:
-                            self.questions_to_update_map[recent_q.id] = recent_q
-                            recent_q.explanation = ((recent_q.explanation or "") + f"\n\n{explanation_text}").strip()
-                        else:
-                            # Truly pending or mismatch
-                            str_linked_q_num = str(linked_q_num)
-                            self.pending_explanations[str_linked_q_num] = (self.pending_explanations.get(str_linked_q_num, "") + f"\n\n{explanation_text}").strip()
-                    except Exception as e:
-                        print(f"Error linking explanation to DB question {linked_q_num}: {e}")
+                # Truly pending or mismatch
+                str_linked_q_num = str(linked_q_num)
+                self.pending_explanations[str_linked_q_num] = (self.pending_explanations.get(str_linked_q_num, "") + f"\n\n{explanation_text}").strip()
         else:
             if self.new_buffer:
                 self.new_buffer["explanation"] = ((self.new_buffer.get("explanation") or "") + f"\n\n{explanation_text}").strip()
@@ -121,7 +276,7 @@ class QuestionParser:
             else:
                 last_db_q = self.get_last_db_question()
                 if last_db_q:
-                    last_db_q.explanation = ((last_db_q.explanation or "") + f"\n\n{explanation_text}").strip()
+                    last_db_q.explanation = self.append_to_saved(last_db_q.explanation, explanation_text)
 
     def handle_fragment(self, item: dict[str, Any], cleaned_options: list[str], current_item_subcategory: str | None, page_num: int) -> None:
         # print(f"🧩 Processing Fragment on Page {page_num}")
@@ -154,7 +309,7 @@ class QuestionParser:
                 # Keep waiting
             else:
                 # print(f"✅ Creating Question from Fragment (Page {page_num})")
-                self.questions_to_create.append(Question(
+                self.add_question(Question(
                     category_id=self.pdf.category_id,
                     subcategory=self.new_buffer.get("subcategory") or current_item_subcategory,
                     question_number=self.new_buffer.get("question_number"),
@@ -178,16 +333,19 @@ class QuestionParser:
                 text_part = (item.get("question") or "").strip()
                 expl_part = (item.get("explanation") or "").strip()
 
-                if text_part:
+                # A reprocessed page: its fragment went into the earlier question the first time
+                merged = self.session.reprocessing and target_q.pk and self.already_merged(target_q, text_part, cleaned_options, expl_part)
+
+                if text_part and not merged:
                     target_q.text = (target_q.text + " " + text_part).strip()
 
-                if cleaned_options:
+                if cleaned_options and not merged:
                     if target_q.options is None:
                         target_q.options = []
                     if isinstance(target_q.options, list):
                         target_q.options.extend(cleaned_options)
 
-                if expl_part:
+                if expl_part and not merged:
                     target_q.explanation = (target_q.explanation or "") + "\n" + expl_part
 
                 # Update correct_option if present in fragment
@@ -196,8 +354,8 @@ class QuestionParser:
                     target_q.correct_option = correct_opt
 
                 # If we modified a DB question, ensure it's in the update map
-                if target_q not in self.questions_to_create and hasattr(target_q, "id"):
-                    self.questions_to_update_map[target_q.id] = target_q
+                if target_q not in self.questions_to_create and target_q.pk:
+                    self.touch(target_q)
 
     def handle_question(self, item: dict[str, Any], cleaned_options: list[str], current_item_subcategory: str | None, page_num: int) -> None:
         q_num = item.get("question_number")
@@ -215,7 +373,7 @@ class QuestionParser:
             # print(f"🔄 Buffering Incomplete Question {q_num} (Page {page_num})")
         else:
             # print(f"✅ Creating Question {q_num} (Page {page_num})")
-            self.questions_to_create.append(Question(
+            self.add_question(Question(
                 category_id=self.pdf.category_id,
                 subcategory=current_item_subcategory,
                 question_number=q_num,
@@ -226,8 +384,19 @@ class QuestionParser:
                 page_number=page_num
             ))
 
-    def parse(self, response_json: list[dict[str, Any]], page_num: int, is_last_page: bool = False) -> tuple[dict[str, Any] | None, int, str | None, dict[str, str], list[Question], list[Question]]:
+    def parse(self, response_json: Iterable[dict[str, Any]], page_num: int, is_last_page: bool = False) -> tuple[dict[str, Any] | None, int, str | None, dict[str, str], list[Question], list[Question]]:
         self.page_num = page_num
+
+        if isinstance(response_json, list):
+            # Load every earlier question this page links an explanation to in one query.
+            # Streamed items can't be looked at ahead, those are loaded as they come.
+            linked_ids = [
+                self.session.find_id(item.get("linked_question_number"), self.active_subcat)
+                for item in response_json
+                if item and item.get("type") == "explanation_only" and item.get("linked_question_number")
+            ]
+            self.session.prefetch([question_id for question_id in linked_ids if question_id])
+
         for item in response_json:
             if not item:
                 continue
@@ -295,7 +464,7 @@ class QuestionParser:
 
         if is_last_page and self.new_buffer:
             # Document is ending, flush the remaining buffer as a final question
-            self.questions_to_create.append(Question(
+            self.add_question(Question(
                 category_id=self.pdf.category_id,
                 subcategory=self.new_buffer.get("subcategory") or self.active_subcat,
                 question_number=self.new_buffer.get("question_number"),
@@ -312,12 +481,13 @@ class QuestionParser:
 
 def parse_and_save_questions(
     pdf: PDFUpload,
-    response_json: list[dict[str, Any]],
+    response_json: Iterable[dict[str, Any]],
     buffer: dict[str, Any] | None,
     current_subcat_state: str | None,
     pending_explanations: dict[str, str],
     page_num: int,
-    is_last_page: bool = False
+    is_last_page: bool = False,
+    session: ParserSession | None = None
 ) -> tuple[dict[str, Any] | None, int, str | None, dict[str, str], list[Question], list[Question]]:
-    parser = QuestionParser(pdf, buffer, current_subcat_state, pending_explanations)
+    parser = QuestionParser(pdf, buffer, current_subcat_state, pending_explanations, session)
     return parser.parse(response_json, page_num, is_last_page)
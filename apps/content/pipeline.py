@@ -0,0 +1,369 @@
+import base64
+import queue
+from collections import deque
+from collections.abc import Callable, Iterator
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from dataclasses import dataclass, field
+from time import perf_counter
+from typing import Any
+
+from django.db import connections
+
+from apps.content.cascade import ModelTier, TierAttempt, get_tiers, validate_page_items
+from apps.content.constants import QUIZ_COLUMN_PROMPT, QUIZ_PROMPT, QUIZ_TEXT_PROMPT
+from apps.content.encoding import EncodedImage
+from apps.content.groq_client import GroqClient
+from apps.content.json_repair import JSONRepairer, RepairOutcome
+from apps.content.llm_cache import ResponseCache
+from apps.content.rendering import init_render_worker, prepare_in_worker
+from apps.content.streaming import JSONItemStream
+
+
+@dataclass
+class PageResponse:
+    response: str | None
+    image: EncodedImage | None = None
+    page_text: str | None = None
+    from_cache: bool = False
+    model_name: str | None = None
+    usage: dict[str, int] | None = None
+    prepare_seconds: float | None = None
+    llm_seconds: float | None = None
+    # Array items decoded from the response, see JSONItemStream
+    items: list[dict[str, Any]] = field(default_factory=list)
+    failed_items: int = 0
+    repaired_items: int = 0
+    # Every repair attempt made on malformed items, stored as JSONRepair rows
+    repairs: list[RepairOutcome] = field(default_factory=list)
+    # Cascade tier that produced the response, and every tier tried for the page
+    tier: str | None = None
+    tier_attempts: list[TierAttempt] = field(default_factory=list)
+    # Requests retried after rate limits or transient API errors
+    api_retries: int = 0
+
+
+def fetch_page_content(
+    groq: GroqClient,
+    page_text: str | None,
+    image: EncodedImage | None,
+    context_text: str | None,
+    cache: ResponseCache | None = None,
+    on_item: Callable[[dict[str, Any]], None] | None = None,
+    columns: list[EncodedImage] | None = None
+) -> PageResponse:
+    """
+    Runs the page through the model cascade: each tier is tried in order until its items pass
+    validate_page_items, the last tier's answer is kept either way.
+    Items reach `on_item` only once their tier passed, except on the last tier where they are
+    passed on while the response streams since there is nothing left to escalate to.
+    A page split into `columns` (see prepare_page) is sent as one request per column.
+    """
+    tiers = get_tiers()
+    attempts = []
+    repairs = []
+    usage = {"prompt_tokens": 0, "completion_tokens": 0}
+    llm_seconds = None
+    api_retries = 0
+
+    for i, tier in enumerate(tiers):
+        is_last_tier = i == len(tiers) - 1
+        tier_on_item = on_item if is_last_tier else None
+        if columns:
+            page_response = fetch_columns_content(groq, tier, columns, context_text, cache, tier_on_item)
+        else:
+            page_response = fetch_tier_content(groq, tier, page_text, image, context_text, cache, tier_on_item)
+
+        problems = validate_page_items(page_response.items, page_response.failed_items) if page_response.response else ["Empty response"]
+        attempts.append(TierAttempt(tier.name, page_response.model_name, not problems, page_response.llm_seconds, problems))
+        repairs.extend(page_response.repairs)
+        for key, value in (page_response.usage or {}).items():
+            usage[key] += value
+        if page_response.llm_seconds is not None:
+            llm_seconds = (llm_seconds or 0) + page_response.llm_seconds
+        api_retries += page_response.api_retries
+
+        if not problems or is_last_tier:
+            break
+        print(f"⤴️ Tier {tier.name} failed validation ({'; '.join(problems[:3])}), escalating to tier {tiers[i + 1].name}.")
+
+    if on_item and not is_last_tier:
+        for item in page_response.items:
+            on_item(item)
+
+    page_response.tier = tier.name
+    page_response.tier_attempts = attempts
+    page_response.repairs = repairs
+    page_response.usage = usage if usage["prompt_tokens"] else None
+    page_response.llm_seconds = llm_seconds
+    page_response.api_retries = api_retries
+    return page_response
+
+
+def fetch_tier_content(
+    groq: GroqClient,
+    tier: ModelTier,
+    page_text: str | None,
+    image: EncodedImage | None,
+    context_text: str | None,
+    cache: ResponseCache | None = None,
+    on_item: Callable[[dict[str, Any]], None] | None = None,
+    prompt: str = QUIZ_PROMPT
+) -> PageResponse:
+    """
+    Sends the page to the tier's text model if it has a text layer, otherwise to its vision model.
+    Responses are read from / written to the response cache when one is given.
+    Decoded array items are passed to `on_item` as soon as they are complete, while the response streams.
+    Malformed items are repaired locally or with a text-only fix call instead of re-sending the page.
+    """
+    model_name = tier.text_model if page_text else tier.model
+    repairer = JSONRepairer(groq, cache)
+    item_stream = JSONItemStream(repairer)
+
+    def emit(items: list[dict[str, Any]]) -> None:
+        for item in items:
+            if on_item:
+                on_item(item)
+
+    def feed(text: str) -> None:
+        emit(item_stream.feed(text))
+
+    if page_text:
+        cache_key = ResponseCache.make_key(page_text.encode("utf-8"), model_name, QUIZ_TEXT_PROMPT, context_text) if cache else None
+    else:
+        cache_key = ResponseCache.make_key(image.data, model_name, prompt, context_text) if cache else None
+
+    if cache_key:
+        cached = cache.get(cache_key)
+        if cached is not None:
+            feed(cached)
+            emit(item_stream.finish())
+            return PageResponse(
+                cached, image, page_text, from_cache=True, model_name=model_name,
+                items=item_stream.items, failed_items=item_stream.failed_items,
+                repaired_items=item_stream.repaired_items, repairs=repairer.outcomes
+            )
+
+    started = perf_counter()
+    if page_text:
+        response = groq.get_quiz_content_from_text(page_text, context_text=context_text, on_text=feed, model=model_name)
+    else:
+        base64_image = base64.b64encode(image.data).decode("utf-8")
+        response = groq.get_quiz_content_from_image(
+            base64_image, context_text=context_text, mime_type=image.mime_type, on_text=feed, model=model_name, prompt=prompt
+        )
+    llm_seconds = perf_counter() - started
+    # Taken before any fix call below replaces the thread's last usage
+    usage = groq.last_usage
+    api_retries = groq.last_retries
+
+    if response and not item_stream.fed_chars:
+        # Streaming is off, decode the complete response instead
+        feed(response)
+    emit(item_stream.finish())
+
+    if cache_key and response:
+        cache.set(cache_key, model_name, response)
+
+    return PageResponse(
+        response, image, page_text, model_name=model_name, usage=usage, llm_seconds=llm_seconds, api_retries=api_retries,
+        items=item_stream.items, failed_items=item_stream.failed_items,
+        repaired_items=item_stream.repaired_items, repairs=repairer.outcomes
+    )
+
+
+def without_continuation(context_text: str | None) -> str | None:
+    """Page context minus the continuation hints, which only concern the top of the left column."""
+    if not context_text:
+        return context_text
+    lines = [line for line in context_text.splitlines() if not line.startswith(("- CONTINUATION NEEDED", "- POSSIBLE CONTINUATION"))]
+    return "\n".join(lines) + "\n" if lines else None
+
+
+def fetch_columns_content(
+    groq: GroqClient,
+    tier: ModelTier,
+    columns: list[EncodedImage],
+    context_text: str | None,
+    cache: ResponseCache | None = None,
+    on_item: Callable[[dict[str, Any]], None] | None = None
+) -> PageResponse:
+    """
+    Sends the column crops of a page to the tier's vision model in parallel and merges the answers
+    in reading order. Items of the left column stream to `on_item` directly, later columns are
+    held back until the columns before them are done.
+    """
+    def fetch_column(index: int, column: EncodedImage) -> PageResponse:
+        try:
+            return fetch_tier_content(
+                groq, tier, None, column, context_text if index == 0 else without_continuation(context_text),
+                cache, on_item if index == 0 else None, QUIZ_COLUMN_PROMPT
+            )
+        finally:
+            # The response cache queries from this thread opened their own connection
+            connections.close_all()
+
+    started = perf_counter()
+    with ThreadPoolExecutor(max_workers=len(columns)) as pool:
+        futures = [pool.submit(fetch_column, index, column) for index, column in enumerate(columns)]
+        responses = []
+        for index, future in enumerate(futures):
+            column_response = future.result()
+            if index > 0 and on_item:
+                for item in column_response.items:
+                    on_item(item)
+            responses.append(column_response)
+    llm_seconds = perf_counter() - started
+
+    usage = {"prompt_tokens": 0, "completion_tokens": 0}
+    for column_response in responses:
+        for key, value in (column_response.usage or {}).items():
+            usage[key] += value
+
+    # Empty if any column came back empty, so the page fails validation like a whole-page call would
+    texts = [column_response.response for column_response in responses]
+    return PageResponse(
+        "\n".join(texts) if all(texts) else None,
+        model_name=responses[0].model_name,
+        from_cache=all(column_response.from_cache for column_response in responses),
+        usage=usage if usage["prompt_tokens"] else None,
+        llm_seconds=None if all(column_response.from_cache for column_response in responses) else llm_seconds,
+        items=[item for column_response in responses for item in column_response.items],
+        failed_items=sum(column_response.failed_items for column_response in responses),
+        repaired_items=sum(column_response.repaired_items for column_response in responses),
+        repairs=[outcome for column_response in responses for outcome in column_response.repairs],
+        api_retries=sum(column_response.api_retries for column_response in responses)
+    )
+
+
+class PageStream:
+    """
+    Hands the items of one page from the LLM thread to the consumer while the response is still
+    streaming. Iterating blocks until the next item arrives and stops when the call is done.
+    """
+    _DONE = object()
+
+    def __init__(self, render_future: Future) -> None:
+        self.render_future = render_future
+        self.items: list[dict[str, Any]] = []
+        self._queue: queue.Queue = queue.Queue()
+        self._finished = False
+        self._response: PageResponse | None = None
+        self._error: BaseException | None = None
+
+    def push(self, item: dict[str, Any]) -> None:
+        self._queue.put(item)
+
+    def finish(self, page_response: PageResponse | None = None, error: BaseException | None = None) -> None:
+        self._response = page_response
+        self._error = error
+        self._queue.put(self._DONE)
+
+    @property
+    def images(self) -> list[EncodedImage]:
+        """What was sent to the vision model: the page image or its column crops, empty for text pages."""
+        _, image, columns, _ = self.render_future.result()
+        return [image] if image else columns
+
+    def __iter__(self) -> Iterator[dict[str, Any]]:
+        # Items already handed out are replayed first, so a retried save sees the whole page
+        yield from list(self.items)
+        while not self._finished:
+            item = self._queue.get()
+            if item is self._DONE:
+                self._finished = True
+                break
+            self.items.append(item)
+            yield item
+
+        if self._error:
+            raise self._error
+
+    def result(self) -> PageResponse:
+        """Waits for the end of the call and returns its PageResponse."""
+        for _ in self:
+            pass
+        return self._response
+
+
+class PagePipeline:
+    """
+    Rasterizes pages in a process pool while several vision calls are in flight.
+    Responses are handed back strictly in page order through `stream()`, so the
+    caller can keep feeding the parser sequentially.
+    """
+
+    def __init__(
+        self,
+        pdf_path: str,
+        pdf_hash: str | None,
+        encoding: str | None,
+        page_nums: list[int],
+        groq: GroqClient,
+        context_provider: Callable[[int], str],
+        concurrency: int,
+        render_workers: int,
+        cache: ResponseCache | None = None,
+        layout_mode: str | None = None
+    ) -> None:
+        self.groq = groq
+        self.encoding = encoding
+        self.layout_mode = layout_mode
+        self.cache = cache
+        self.context_provider = context_provider
+        self.pending_pages: deque[int] = deque(page_nums)
+        self.futures: dict[int, Future] = {}
+        self.streams: dict[int, PageStream] = {}
+        # One extra slot so the next page is already rendered when a call slot frees up
+        self.window = concurrency + 1
+
+        self.render_pool = ProcessPoolExecutor(
+            max_workers=render_workers,
+            initializer=init_render_worker,
+            initargs=(pdf_path, pdf_hash)
+        )
+        self.llm_pool = ThreadPoolExecutor(max_workers=concurrency)
+        self._fill()
+
+    def _fill(self) -> None:
+        while self.pending_pages and len(self.futures) < self.window:
+            page_num = self.pending_pages.popleft()
+            # Text extraction, rasterizing and re-encoding are CPU bound, so they all happen in the worker process
+            render_future = self.render_pool.submit(prepare_in_worker, page_num, self.encoding, self.layout_mode)
+            # Context is captured at submit time, i.e. from the latest page the consumer has parsed
+            context_text = self.context_provider(page_num)
+            stream = self.streams[page_num] = PageStream(render_future)
+            self.futures[page_num] = self.llm_pool.submit(self._call_llm, render_future, context_text, stream)
+
+    def _call_llm(self, render_future: Future, context_text: str, stream: PageStream) -> PageResponse:
+        try:
+            page_text, image, columns, prepare_seconds = render_future.result()
+            page_response = fetch_page_content(
+                self.groq, page_text, image, context_text if context_text else None, self.cache, on_item=stream.push, columns=columns
+            )
+            page_response.prepare_seconds = prepare_seconds
+            if not page_response.response:
+                raise ValueError("Model returned an empty response")
+            stream.finish(page_response)
+            return page_response
+        except BaseException as e:
+            stream.finish(error=e)
+            raise
+        finally:
+            # The response cache queries from this thread opened their own connection
+            connections.close_all()
+
+    def stream(self, page_num: int) -> PageStream:
+        """Items of the page as they arrive, the next page starts rendering right away."""
+        self.futures.pop(page_num)
+        try:
+            return self.streams.pop(page_num)
+        finally:
+            self._fill()
+
+    def close(self) -> None:
+        self.pending_pages.clear()
+        for future in self.futures.values():
+            future.cancel()
+        self.streams.clear()
+        self.llm_pool.shutdown(wait=True, cancel_futures=True)
+        self.render_pool.shutdown(wait=True, cancel_futures=True)
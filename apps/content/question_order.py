@@ -0,0 +1,121 @@
+from array import array
+from collections import Counter
+from collections.abc import Iterable
+from dataclasses import dataclass
+
+from django.core.cache import cache
+from django.db.models import Count, F
+
+from apps.content.constants import CATEGORY_QUESTIONS_CACHE_SECONDS
+from apps.content.models import Category, Question
+
+# Order the quiz walks a category in
+QUESTION_ORDER = ("page_number", "question_number", "id")
+
+
+@dataclass(frozen=True)
+class CategoryQuestions:
+    """
+    A category's question ids in quiz order, with each one's subcategory as an index into `subcategories`
+    and each one's position in `positions`. The map is part of the cached value, built once per version.
+    """
+    version: int
+    ids: array
+    subcategory_indexes: array
+    subcategories: tuple[str | None, ...]
+    positions: dict[int, int]
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def position(self, question_id: int) -> int | None:
+        return self.positions.get(question_id)
+
+    def subcategory(self, position: int) -> str | None:
+        return self.subcategories[self.subcategory_indexes[position]]
+
+
+def cache_key(category_id: int, version: int) -> str:
+    return f"category_questions:v2:{category_id}:{version}"
+
+
+def load_category_questions(category_id: int, version: int) -> CategoryQuestions:
+    rows = Question.objects.filter(category_id=category_id).order_by(*QUESTION_ORDER).values_list("id", "subcategory")
+    ids = array("q")
+    subcategory_indexes = array("I")
+    subcategories: dict[str | None, int] = {}
+    for question_id, subcategory in rows:
+        ids.append(question_id)
+        subcategory_indexes.append(subcategories.setdefault(subcategory, len(subcategories)))
+    positions = {question_id: position for position, question_id in enumerate(ids)}
+    return CategoryQuestions(version, ids, subcategory_indexes, tuple(subcategories), positions)
+
+
+def get_category_questions(category_id: int, version: int | None = None) -> CategoryQuestions:
+    """
+    Read-through cache of load_category_questions. Pass the category's question_version when the
+    category row is already loaded, otherwise it is read here.
+    """
+    if version is None:
+        version = Category.objects.filter(id=category_id).values_list("question_version", flat=True).first() or 0
+
+    key = cache_key(category_id, version)
+    entry = cache.get(key)
+    if entry is None:
+        entry = load_category_questions(category_id, version)
+        cache.set(key, entry, CATEGORY_QUESTIONS_CACHE_SECONDS)
+    return entry
+
+
+def bump_question_version(category_id: int) -> None:
+    """Call in the transaction that changes the category's questions, cached orders of it go stale."""
+    Category.objects.filter(id=category_id).update(question_version=F("question_version") + 1)
+
+
+def subcategory_key(subcategory: str | None) -> str:
+    return subcategory or ""
+
+
+def count_by_subcategory(questions: Iterable[Question]) -> Counter:
+    return Counter(subcategory_key(question.subcategory) for question in questions)
+
+
+def record_question_changes(category_id: int, added: Counter | None = None, removed: Counter | None = None) -> None:
+    """
+    Call in the transaction that writes the category's questions: bumps question_version and moves
+    the stored counts by the created (`added`) and deleted (`removed`) questions per subcategory.
+    """
+    added, removed = added or Counter(), removed or Counter()
+    if not added and not removed:
+        bump_question_version(category_id)
+        return
+
+    # The row lock serialises PDFs of the same category writing at once
+    stored = Category.objects.select_for_update().values_list("subcategory_counts", flat=True).get(id=category_id)
+    counts = Counter(stored)
+    counts.update(added)
+    counts.subtract(removed)
+    Category.objects.filter(id=category_id).update(
+        question_version=F("question_version") + 1,
+        question_count=F("question_count") + added.total() - removed.total(),
+        subcategory_counts={subcategory: count for subcategory, count in counts.items() if count > 0}
+    )
+
+
+def recount_questions(category_ids: Iterable[int]) -> int:
+    """Recomputes the stored counts of the categories from their questions. Returns how many were off."""
+    counts: dict[int, dict[str, int]] = {category_id: {} for category_id in category_ids}
+    rows = Question.objects.filter(category_id__in=counts).values("category_id", "subcategory").annotate(total=Count("id")).order_by()
+    for row in rows:
+        subcategory_counts = counts[row["category_id"]]
+        key = subcategory_key(row["subcategory"])
+        subcategory_counts[key] = subcategory_counts.get(key, 0) + row["total"]
+
+    repaired = 0
+    for category in Category.objects.filter(id__in=counts).only("question_count", "subcategory_counts"):
+        subcategory_counts = counts[category.id]
+        question_count = sum(subcategory_counts.values())
+        if (category.question_count, category.subcategory_counts) != (question_count, subcategory_counts):
+            Category.objects.filter(id=category.id).update(question_count=question_count, subcategory_counts=subcategory_counts)
+            repaired += 1
+    return repaired
@@ -0,0 +1,162 @@
+import re
+import random
+import threading
+from time import monotonic, sleep
+
+from apps.content.constants import (
+    BACKOFF_BASE_SECONDS, BACKOFF_MAX_SECONDS, GROQ_REQUESTS_PER_MINUTE, GROQ_TOKENS_PER_MINUTE
+)
+
+DURATION_PART_RE = re.compile(r"(\d+(?:\.\d+)?)(ms|h|m|s)")
+DURATION_UNITS = {"h": 3600, "m": 60, "s": 1, "ms": 0.001}
+
+
+def parse_reset_duration(value: str | None) -> float | None:
+    """Parses Groq reset headers like '7.66s', '2m59.56s' or '120ms' into seconds."""
+    if not value:
+        return None
+
+    try:
+        return float(value)
+    except ValueError:
+        pass
+
+    parts = DURATION_PART_RE.findall(value)
+    if not parts:
+        return None
+    return sum(float(amount) * DURATION_UNITS[unit] for amount, unit in parts)
+
+
+class TokenBucket:
+    """Classic token bucket. Reservations may go negative, later callers then wait for the debt to refill."""
+
+    def __init__(self, capacity: float, refill_per_second: float) -> None:
+        self.capacity = capacity
+        self.refill_per_second = refill_per_second
+        self.level = capacity
+        self.updated_at = monotonic()
+
+    def refill(self) -> None:
+        now = monotonic()
+        self.level = min(self.capacity, self.level + (now - self.updated_at) * self.refill_per_second)
+        self.updated_at = now
+
+    def reserve(self, amount: float) -> float:
+        """Takes `amount` from the bucket and returns how long the caller has to wait before using it."""
+        self.refill()
+        self.level -= amount
+        if self.level >= 0:
+            return 0.0
+        return -self.level / self.refill_per_second
+
+
+class RateLimitScheduler:
+    """
+    Paces requests against the configured requests-per-minute and tokens-per-minute quota.
+    Shared by every GroqClient in the process (the pipeline threads included), so concurrent
+    calls queue up behind each other instead of all hitting a 429 at once.
+    """
+
+    def __init__(self, requests_per_minute: int = GROQ_REQUESTS_PER_MINUTE, tokens_per_minute: int = GROQ_TOKENS_PER_MINUTE) -> None:
+        self.requests = TokenBucket(requests_per_minute, requests_per_minute / 60)
+        self.tokens = TokenBucket(tokens_per_minute, tokens_per_minute / 60)
+        self.blocked_until = 0.0
+        self.total_wait_seconds = 0.0
+        self.rate_limited_count = 0
+        self._lock = threading.Lock()
+
+    def acquire(self, estimated_tokens: int) -> float:
+        """Blocks until a request of `estimated_tokens` fits the quota. Returns the time waited."""
+        with self._lock:
+            wait = max(
+                self.requests.reserve(1),
+                self.tokens.reserve(estimated_tokens),
+                self.blocked_until - monotonic()
+            )
+            self.total_wait_seconds += max(wait, 0)
+
+        if wait > 0:
+            sleep(wait)
+        return max(wait, 0)
+
+    def record_usage(self, estimated_tokens: int, actual_tokens: int | None) -> None:
+        """Corrects the token bucket once the real usage of a call is known."""
+        if actual_tokens is None:
+            return
+        with self._lock:
+            self.tokens.refill()
+            self.tokens.level = min(self.tokens.capacity, self.tokens.level + estimated_tokens - actual_tokens)
+
+    def update_from_headers(self, headers) -> None:
+        """
+        Syncs with Groq's x-ratelimit-* headers: the token limit/remaining refer to the
+        per-minute window, the request ones to the daily quota.
+        """
+        if not headers:
+            return
+
+        def as_float(name: str) -> float | None:
+            try:
+                return float(headers.get(name))
+            except (TypeError, ValueError):
+                return None
+
+        token_limit = as_float("x-ratelimit-limit-tokens")
+        remaining_tokens = as_float("x-ratelimit-remaining-tokens")
+        remaining_requests = as_float("x-ratelimit-remaining-requests")
+
+        with self._lock:
+            if token_limit:
+                self.tokens.capacity = token_limit
+                self.tokens.refill_per_second = token_limit / 60
+
+            if remaining_tokens is not None:
+                self.tokens.refill()
+                self.tokens.level = min(self.tokens.level, remaining_tokens)
+
+            if remaining_requests is not None and remaining_requests <= 0:
+                reset = parse_reset_duration(headers.get("x-ratelimit-reset-requests"))
+                if reset:
+                    self.blocked_until = max(self.blocked_until, monotonic() + reset)
+
+    def backoff_delay(self, attempt: int, retry_after: float | None = None, rate_limited: bool = False) -> float:
+        """
+        Full-jitter exponential backoff, never shorter than the server's retry-after. Pass
+        `rate_limited` when backing off from a 429, other retries are not counted as one.
+        """
+        delay = random.uniform(0, min(BACKOFF_MAX_SECONDS, BACKOFF_BASE_SECONDS * (2 ** attempt)))
+        if retry_after:
+            delay = max(delay, retry_after)
+
+        with self._lock:
+            if rate_limited:
+                self.rate_limited_count += 1
+            # Nobody else should fire into the limit while we back off
+            self.blocked_until = max(self.blocked_until, monotonic() + delay)
+        return delay
+
+    def state(self) -> dict[str, float]:
+        with self._lock:
+            self.requests.refill()
+            self.tokens.refill()
+            return {
+                "requests_available": round(self.requests.level, 2),
+                "requests_per_minute": round(self.requests.capacity, 2),
+                "tokens_available": round(self.tokens.level),
+                "tokens_per_minute": round(self.tokens.capacity),
+                "blocked_for_seconds": round(max(self.blocked_until - monotonic(), 0), 2),
+                "total_wait_seconds": round(self.total_wait_seconds, 2),
+                "rate_limited_count": self.rate_limited_count
+            }
+
+
+_scheduler: RateLimitScheduler | None = None
+_scheduler_lock = threading.Lock()
+
+
+def get_scheduler() -> RateLimitScheduler:
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = RateLimitScheduler()
+        return _scheduler
@@ -0,0 +1,151 @@
+import io
+from time import perf_counter
+
+import fitz
+from PIL import Image
+
+from apps.content.constants import (
+    COLUMN_DETECT_DPI, COLUMN_GUTTER_MAX_INK, COLUMN_GUTTER_MIN_POINTS, COLUMN_OVERLAP_POINTS, COLUMN_SEARCH_BAND,
+    LAYOUT_COLUMNS, RENDER_DPI, TEXT_LAYER_ENABLED, TRIAGE_INK_LEVEL
+)
+from apps.content.encoding import EncodedImage, encode_page_image
+from apps.content.page_cache import PageImageCache
+from apps.content.text_layer import extract_page_text
+
+# Each render worker process keeps its own handle, PyMuPDF documents are not thread/process safe
+_worker_doc: fitz.Document | None = None
+_worker_pdf_hash: str | None = None
+
+
+def render_page_png(doc: fitz.Document, page_num: int, dpi: int = RENDER_DPI) -> bytes:
+    page = doc.load_page(page_num)
+    pix = page.get_pixmap(dpi=dpi)
+    return pix.tobytes("png")
+
+
+def get_page_png(doc: fitz.Document, pdf_hash: str | None, page_num: int, dpi: int = RENDER_DPI) -> bytes:
+    """Returns the rendered page from the on-disk cache, rasterizing (and caching) it on a miss."""
+    if not pdf_hash:
+        return render_page_png(doc, page_num, dpi)
+
+    cache = PageImageCache()
+    img_bytes = cache.get(pdf_hash, page_num, dpi, "png")
+    if img_bytes is None:
+        img_bytes = render_page_png(doc, page_num, dpi)
+        cache.put(pdf_hash, page_num, dpi, "png", img_bytes)
+
+    return img_bytes
+
+
+def timed_encode(png_bytes: bytes, encoding: str | None) -> EncodedImage:
+    started = perf_counter()
+    image = encode_page_image(png_bytes, encoding)
+    image.encode_seconds = perf_counter() - started
+    return image
+
+
+def prepare_page_image(doc: fitz.Document, pdf_hash: str | None, page_num: int, encoding: str | None = None, dpi: int = RENDER_DPI) -> EncodedImage:
+    """Rendered (or cached) page run through the PDF's encoding profile, ready for the vision call."""
+    return timed_encode(get_page_png(doc, pdf_hash, page_num, dpi), encoding)
+
+
+def find_column_gutter(page: fitz.Page) -> float | None:
+    """
+    x of the gutter between two columns in page points, None for single-column pages.
+    Works on the pixels, so scanned pages without a text layer are split too: the widest run of
+    nearly ink-free pixel columns in the middle band of the page is taken as the gutter.
+    """
+    pix = page.get_pixmap(dpi=COLUMN_DETECT_DPI, colorspace=fitz.csGRAY)
+    samples = pix.samples
+    width, height, stride = pix.width, pix.height, pix.stride
+    first_x, last_x = int(width * COLUMN_SEARCH_BAND[0]), int(width * COLUMN_SEARCH_BAND[1])
+    max_ink_rows = height * COLUMN_GUTTER_MAX_INK
+
+    best_start, best_length, run_start = 0, 0, None
+    for x in range(first_x, last_x + 1):
+        is_clear = x < last_x and sum(1 for y in range(height) if samples[y * stride + x] < TRIAGE_INK_LEVEL) <= max_ink_rows
+        if is_clear and run_start is None:
+            run_start = x
+        elif not is_clear and run_start is not None:
+            # A gutter has ink on both sides, a run reaching the band edge is the margin of a single column
+            if first_x < run_start and x < last_x and x - run_start > best_length:
+                best_start, best_length = run_start, x - run_start
+            run_start = None
+
+    points_per_pixel = 72 / COLUMN_DETECT_DPI
+    if best_length * points_per_pixel < COLUMN_GUTTER_MIN_POINTS:
+        return None
+    return (best_start + best_length / 2) * points_per_pixel
+
+
+def prepare_page_columns(doc: fitz.Document, pdf_hash: str | None, page_num: int, encoding: str | None = None, dpi: int = RENDER_DPI) -> list[EncodedImage]:
+    """
+    Left and right column crops of the rendered (or cached) page, each run through the encoding profile.
+    Empty when the page has no clear gutter.
+    """
+    page = doc.load_page(page_num)
+    gutter = find_column_gutter(page)
+    if gutter is None:
+        return []
+
+    image = Image.open(io.BytesIO(get_page_png(doc, pdf_hash, page_num, dpi)))
+    scale = image.width / page.rect.width
+    split_x = round(gutter * scale)
+    overlap = round(COLUMN_OVERLAP_POINTS * scale)
+
+    columns = []
+    for box in ((0, 0, split_x + overlap, image.height), (split_x - overlap, 0, image.width, image.height)):
+        out = io.BytesIO()
+        image.crop(box).save(out, format="PNG")
+        columns.append(timed_encode(out.getvalue(), encoding))
+    return columns
+
+
+def prepare_page(
+    doc: fitz.Document,
+    pdf_hash: str | None,
+    page_num: int,
+    encoding: str | None = None,
+    layout_mode: str | None = None
+) -> tuple[str | None, EncodedImage | None, list[EncodedImage]]:
+    """
+    Returns (page_text, None, []) when the page has a usable text layer. Otherwise the page goes to
+    the vision model as (None, image, []), or as (None, None, [left, right]) in the "columns" layout mode.
+    Text pages are never rasterized.
+    """
+    if TEXT_LAYER_ENABLED:
+        page_text = extract_page_text(doc.load_page(page_num))
+        if page_text:
+            return page_text, None, []
+
+    if layout_mode == LAYOUT_COLUMNS:
+        columns = prepare_page_columns(doc, pdf_hash, page_num, encoding)
+        if columns:
+            return None, None, columns
+
+    return None, prepare_page_image(doc, pdf_hash, page_num, encoding), []
+
+
+def init_render_worker(pdf_path: str, pdf_hash: str | None = None) -> None:
+    global _worker_doc, _worker_pdf_hash
+    _worker_doc = fitz.open(pdf_path)
+    _worker_pdf_hash = pdf_hash
+
+
+def render_in_worker(page_num: int, dpi: int = RENDER_DPI) -> bytes:
+    return get_page_png(_worker_doc, _worker_pdf_hash, page_num, dpi)
+
+
+def prepare_in_worker(
+    page_num: int,
+    encoding: str | None = None,
+    layout_mode: str | None = None
+) -> tuple[str | None, EncodedImage | None, list[EncodedImage], float]:
+    started = perf_counter()
+    page_text, image, columns = prepare_page(_worker_doc, _worker_pdf_hash, page_num, encoding, layout_mode)
+    return page_text, image, columns, perf_counter() - started
+
+
+def warm_in_worker(page_num: int, dpi: int = RENDER_DPI) -> int:
+    # Only the size goes back to the parent, the image itself stays in the cache
+    return len(render_in_worker(page_num, dpi))
@@ -1,193 +1,666 @@
-import os
-import re
-import json
-import base64
-import subprocess
-from time import sleep
-
-from django.conf import settings
+from collections import Counter, defaultdict
+from collections.abc import Callable, Iterable
+from dataclasses import asdict, dataclass, field
+from time import perf_counter, sleep
+
 from django.db import close_old_connections, transaction, OperationalError
 import fitz
 
-from apps.content.constants import MAX_FILE_SIZE
+from apps.content.cascade import CascadeStats
+from apps.content.dead_letter import classify_error, due_failed_pages, page_ranges, record_failed_page, resolve_failed_page
+from apps.content.encoding import EncodedImage
+from apps.content.constants import LLM_CACHE_ENABLED, PIPELINE_CONCURRENCY, RENDER_WORKERS, TRIAGE_ENABLED
 from apps.content.groq_client import GroqClient
-from apps.content.models import PDFUpload, Question
-from apps.content.parsers import parse_and_save_questions
+from apps.content.leases import LeaseHeartbeat, acquire_lease, release_expired_leases, release_lease, worker_id
+from apps.content.llm_cache import ResponseCache
+from apps.content.metrics import adaptive_batch_size
+from apps.content.models import FailedPage, IngestJob, JSONRepair, PDFUpload, PageResult, ParserCheckpoint, Question
+from apps.content.parsers import ParserSession, clean_ai_response, parse_and_save_questions
+from apps.content.page_cache import PageImageCache, file_sha256
+from apps.content.pipeline import PagePipeline, PageResponse, fetch_page_content
+from apps.content.question_order import count_by_subcategory, record_question_changes, subcategory_key
+from apps.content.rendering import prepare_page
+from apps.content.triage import triage_pages
 from apps.content.github_control import disable_cron
-from django.db.models import F
+from django.db.models import Exists, F, Max, OuterRef, Q, QuerySet
 
 
-def trigger_next_pdf_batch(is_cron: bool = False, batch_size: int = 10) -> dict:
+def trigger_next_pdf_batch(is_cron: bool = False, batch_size: int | None = None) -> dict:
     """
-    Finds the next unprocessed PDF in the queue and starts a worker for it.
-    If called from the cron (is_cron=True), it may disable the cron if the queue is empty or stuck.
+    Queues the remaining pages of every unprocessed PDF that has nothing queued yet for the ingest
+    workers, as ranges of `batch_size` pages or, by default, as one range the workers run in
+    adaptively sized batches. PDFs with a failed range are left alone until it is
+    queued again by hand. Ranges of crashed workers (expired leases) are requeued first, and failed
+    pages whose retry is due are queued as reprocess ranges (see FailedPage).
+    If called from the cron (is_cron=True), it disables the cron once there is nothing left to queue or run.
     Returns a dictionary indicating the result status.
     """
-    pdf_obj = PDFUpload.objects.filter(
+    released_count = release_expired_leases()
+    retry_jobs = enqueue_failed_page_retries()
+
+    pending = PDFUpload.objects.filter(
         total_pages__gt=0,
         last_processed_page__lt=F("total_pages")
-    ).order_by("id").first()
+    )
+    open_jobs = IngestJob.objects.filter(status__in=[IngestJob.STATUS_QUEUED, IngestJob.STATUS_RUNNING])
+    blocking_jobs = IngestJob.objects.filter(pdf=OuterRef("pk")).filter(
+        Q(status__in=[IngestJob.STATUS_QUEUED, IngestJob.STATUS_RUNNING])
+        | Q(status=IngestJob.STATUS_FAILED, end_page__gt=OuterRef("last_processed_page"))
+    )
+    idle_ids = list(pending.filter(~Exists(blocking_jobs)).order_by("id").values_list("id", flat=True))
+
+    if not idle_ids:
+        if not open_jobs.exists():
+            if is_cron:
+                print("🏁 Queue empty. Disabling GitHub Cron...")
+                disable_cron()
+            return {"status": "No pending PDFs found.", "action": "cron_disabled" if is_cron else "none"}
+        return {
+            "status": f"{open_jobs.count()} jobs already queued or running.",
+            "released_leases": released_count,
+            "retry_jobs": len(retry_jobs),
+            "action": "none"
+        }
+
+    jobs = enqueue_pdf_batches(pdf_ids=idle_ids, batch_size=batch_size, whole_pdf=True)
+
+    return {
+        "status": "Page ranges queued for the ingest workers",
+        "pdf_ids": idle_ids,
+        "queued_jobs": len(jobs),
+        "batch_size": batch_size or "adaptive",
+        "released_leases": released_count,
+        "retry_jobs": len(retry_jobs),
+        "action": "batch_queued"
+    }
+
+
+def enqueue_pdf_batches(
+    pdf_ids: list[int],
+    batch_size: int | None = None,
+    use_cache: bool = True,
+    priority: int = 0,
+    whole_pdf: bool = False
+) -> list[IngestJob]:
+    """
+    Queues the next `batch_size` pages of each PDF, after whatever is already processed or queued for it.
+    With `whole_pdf` every remaining page is queued, split into ranges of `batch_size`.
+    Without `batch_size` the size comes from the PDF's measured throughput (see adaptive_batch_size),
+    and a whole PDF is queued as a single range the worker cuts into such batches as it goes.
+    """
+    jobs = []
+    with transaction.atomic():
+        for pdf in PDFUpload.objects.filter(id__in=pdf_ids, total_pages__gt=0).order_by("id"):
+            queued_until = pdf.ingest_jobs.filter(
+                kind=IngestJob.KIND_INGEST, status__in=[IngestJob.STATUS_QUEUED, IngestJob.STATUS_RUNNING]
+            ).aggregate(end=Max("end_page"))["end"]
+            start = max(pdf.last_processed_page, queued_until or 0)
+            size = batch_size or (pdf.total_pages if whole_pdf else adaptive_batch_size(pdf))
+            stop = pdf.total_pages if whole_pdf else min(start + size, pdf.total_pages)
+
+            for range_start in range(start, stop, size):
+                jobs.append(IngestJob(
+                    pdf=pdf,
+                    start_page=range_start,
+                    end_page=min(range_start + size, stop),
+                    use_cache=use_cache,
+                    priority=priority
+                ))
+
+        return IngestJob.objects.bulk_create(jobs)
+
+
+def build_context_text(
+    buffer: dict | None,
+    pending_explanations: dict[str, str],
+    current_subcat_state: str | None,
+    previous_page_parsed: bool = True
+) -> str:
+    """
+    Construct context for the AI from previous page/state.
+    If the previous page is still in flight (pipelined mode) its carry-over is not known yet,
+    so only a generic continuation hint is given and the parser links the fragment on its own.
+    """
+    context_text = ""
+    if not previous_page_parsed:
+        context_text += "- POSSIBLE CONTINUATION: The previous page may have ended with an incomplete question. If the very top of this page continues it without a new question number, mark it as 'type': 'fragment'.\n"
+    elif buffer:
+        q_num = buffer.get("question_number") or "?"
+        q_text = buffer.get("question", "")[:150]
+        context_text += f"- CONTINUATION NEEDED: The previous page ended with an incomplete Question #{q_num}: '{q_text}...'. Please look for its remaining options or text at the very top of this page and mark it as 'type': 'fragment'.\n"
+
+    if pending_explanations:
+        nums = list(pending_explanations.keys())
+        context_text += f"- PENDING EXPLANATIONS: We are still looking for the explanations/answers for these question numbers: {nums}. If you see them isolated on this page, use 'type': 'explanation_only' and 'linked_question_number'.\n"
+
+    if current_subcat_state:
+        context_text += f"- CURRENT SUBCATEGORY: {current_subcat_state}\n"
+
+    return context_text
+
+
+def save_parsed_page(
+    pdf: PDFUpload,
+    response_json: Iterable[dict],
+    buffer: dict | None,
+    current_subcat_state: str | None,
+    pending_explanations: dict[str, str],
+    page_num: int,
+    is_last_page: bool,
+    session: ParserSession | None = None,
+    replace_existing: bool = False,
+    timings: dict[str, float] | None = None
+) -> tuple[dict | None, str | None, dict[str, str], int]:
+    """
+    Parses one page of model output and persists its questions together with the PDF progress.
+    `page_num` is 0-based. Returns the new carry-over state and the number of created questions.
+    Pass the same `session` for every page of a batch so the category index is only loaded once.
+    With `replace_existing` (reprocessing) the page's earlier questions are replaced and the PDF
+    progress stays where it is. The duration of the write transaction goes to `timings["db_seconds"]`.
+    """
+    session = session or ParserSession(pdf.category_id)
+    try:
+        # Parsing only reads (through the session), so a streamed page is parsed as its items
+        # arrive without holding a transaction open. The lease keeps other workers off this PDF.
+        buffer, count, current_subcat_state, pending_explanations, questions_to_create, questions_to_update = parse_and_save_questions(
+            pdf, response_json, buffer, current_subcat_state, pending_explanations, page_num + 1, is_last_page, session
+        )
 
-    if not pdf_obj:
-        if is_cron:
-            print("🏁 Queue empty. Disabling GitHub Cron...")
-            disable_cron()
-        return {"status": "No pending PDFs found.", "action": "cron_disabled" if is_cron else "none"}
+        # Writes and progress go in one transaction so a failure never leaves a half-saved page
+        started = perf_counter()
+        with transaction.atomic():
+            removed = replace_page_questions(pdf, page_num, questions_to_create) if replace_existing else None
 
-    if pdf_obj.is_processing:
-        if is_cron:
-            print(f"⚠️ PDF {pdf_obj.id} is stuck processing. Disabling cron to prevent loops...")
-            disable_cron()
-            return {"status": f"PDF {pdf_obj.id} stuck.", "action": "cron_disabled"}
-        return {"status": f"PDF {pdf_obj.id} is already processing.", "action": "none"}
+            if questions_to_create:
+                Question.objects.bulk_create(questions_to_create)
 
-    # Lock the PDF
-    PDFUpload.objects.filter(id=pdf_obj.id).update(is_processing=True)
+            if questions_to_update:
+                Question.objects.bulk_update(questions_to_update, ["explanation", "text", "options", "correct_option"])
 
-    launch_detached_worker(pdf_ids=[pdf_obj.id], batch_size=batch_size)
+            if replace_existing or questions_to_create or questions_to_update:
+                record_question_changes(pdf.category_id, count_by_subcategory(questions_to_create), removed)
 
-    return {
-        "status": "Detached worker started successfully",
-        "processing_id": pdf_obj.id,
-        "batch_size": batch_size,
-        "progress": f"{min(pdf_obj.last_processed_page + batch_size, pdf_obj.total_pages)}/{pdf_obj.total_pages}",
-        "action": "worker_started"
+            # Save progress inside the transaction to ensure consistency
+            parser_state = {
+                "buffer": buffer,
+                "subcategory": current_subcat_state,
+                "pending_explanations": pending_explanations
+            }
+            update_fields = ["encoding_stats"]
+            if not replace_existing:
+                pdf.last_processed_page = page_num + 1
+                update_fields.append("last_processed_page")
+            if pdf.last_processed_page == page_num + 1:
+                pdf.parser_state = parser_state
+                update_fields.append("parser_state")
+            pdf.save(update_fields=update_fields)
+
+            ParserCheckpoint.objects.update_or_create(pdf=pdf, page_number=page_num + 1, defaults={"state": parser_state})
+
+            session.register_created(questions_to_create)
+
+        if timings is not None:
+            timings["db_seconds"] = perf_counter() - started
+    except Exception:
+        # Loaded questions may carry edits that were just rolled back
+        session.invalidate()
+        raise
+
+    return buffer, current_subcat_state, pending_explanations, count
+
+
+def replace_page_questions(pdf: PDFUpload, page_num: int, new_questions: list[Question]) -> Counter:
+    """
+    Deletes the questions stored for the 0-based `page_num` before its new ones are created and
+    returns how many went per subcategory. A new question without an explanation keeps the one of
+    the question it replaces, that text may have been linked in from a later page that is not part
+    of the reprocessed range.
+    """
+    old_questions = Question.objects.filter(category_id=pdf.category_id, page_number=page_num + 1)
+    old_rows = list(old_questions.values_list("question_number", "subcategory", "explanation"))
+    old_explanations = {
+        (question_number, subcategory): explanation
+        for question_number, subcategory, explanation in old_rows
+        if explanation
     }
 
+    for question in new_questions:
+        if not question.explanation:
+            question.explanation = old_explanations.get((question.question_number, question.subcategory), "")
+
+    old_questions.delete()
+    return Counter(subcategory_key(subcategory) for _, subcategory, _ in old_rows)
+
+
+def load_checkpoint(pdf: PDFUpload, page_num: int) -> dict:
+    """Parser state before the 0-based `page_num`, i.e. as stored after the page before it."""
+    if page_num == 0:
+        return {}
+
+    checkpoint = pdf.parser_checkpoints.filter(page_number=page_num).first()
+    if checkpoint is None:
+        raise ValueError(f"No parser state stored after Page {page_num}, reprocess from an earlier page.")
+    return checkpoint.state
+
+
+def check_reprocess_range(pdf: PDFUpload, start_page: int, end_page: int) -> None:
+    """`start_page` is 0-based, `end_page` exclusive. Only pages that were already processed can be reprocessed."""
+    if not 0 <= start_page < end_page:
+        raise ValueError(f"Invalid page range {start_page + 1}-{end_page}.")
+    if end_page > pdf.last_processed_page:
+        raise ValueError(f"Pages up to {pdf.last_processed_page} are processed, cannot reprocess up to Page {end_page}.")
+    load_checkpoint(pdf, start_page)
+
+
+def enqueue_reprocess(pdf: PDFUpload, start_page: int, end_page: int, use_cache: bool = False, priority: int = 0) -> IngestJob:
+    check_reprocess_range(pdf, start_page, end_page)
+    return IngestJob.objects.create(
+        pdf=pdf,
+        kind=IngestJob.KIND_REPROCESS,
+        start_page=start_page,
+        end_page=end_page,
+        use_cache=use_cache,
+        priority=priority
+    )
+
+
+def reprocess_pages(
+    pdf: PDFUpload,
+    start_page: int,
+    end_page: int,
+    use_cache: bool = False,
+    concurrency: int = PIPELINE_CONCURRENCY,
+    should_stop: Callable[[], bool] | None = None
+) -> str:
+    """
+    Runs the pages [start_page, end_page) again from the parser state stored before them and
+    replaces only their questions. Questions of other pages and their user answers stay as they are.
+    """
+    check_reprocess_range(pdf, start_page, end_page)
+    return process_next_batch(pdf, end_page - start_page, use_cache=use_cache, concurrency=concurrency, should_stop=should_stop, start_page=start_page)
+
+
+def enqueue_failed_page_retries(failed_pages: QuerySet[FailedPage] | None = None, priority: int = 0) -> list[IngestJob]:
+    """
+    Queues one reprocess range (fresh model calls) per run of consecutive failed pages.
+    Without `failed_pages`, the due pages of every PDF that has nothing queued or running are taken.
+    """
+    if failed_pages is None:
+        busy_pdf_ids = IngestJob.objects.filter(status__in=[IngestJob.STATUS_QUEUED, IngestJob.STATUS_RUNNING]).values("pdf_id")
+        failed_pages = due_failed_pages().exclude(pdf_id__in=busy_pdf_ids)
+
+    pages_by_pdf = defaultdict(list)
+    for pdf_id, page_number in failed_pages.values_list("pdf_id", "page_number"):
+        pages_by_pdf[pdf_id].append(page_number)
+
+    jobs = []
+    for pdf in PDFUpload.objects.filter(id__in=pages_by_pdf).order_by("id"):
+        # Pages past the progress are still ahead of the regular ingestion, which will run them anyway
+        for start_page, end_page in page_ranges([n for n in pages_by_pdf[pdf.id] if n <= pdf.last_processed_page]):
+            try:
+                jobs.append(enqueue_reprocess(pdf, start_page, end_page, use_cache=False, priority=priority))
+            except ValueError as e:
+                # Would fail the same way on every trigger, so it waits for a forced retry
+                print(f"⚠️ Cannot retry {pdf.title} Pages {start_page + 1}-{end_page}: {e}")
+                pdf.failed_pages.filter(page_number__gt=start_page, page_number__lte=end_page).update(
+                    status=FailedPage.STATUS_GAVE_UP, next_retry_at=None, error=str(e)
+                )
+    return jobs
+
+
+def retry_failed_pages(
+    pdf: PDFUpload,
+    force: bool = False,
+    concurrency: int = PIPELINE_CONCURRENCY,
+    should_stop: Callable[[], bool] | None = None
+) -> str:
+    """Reprocesses the due failed pages of a PDF in the foreground, `force` takes every unresolved one."""
+    page_numbers = due_failed_pages(force).filter(pdf=pdf, page_number__lte=pdf.last_processed_page).values_list("page_number", flat=True)
+
+    results = []
+    for start_page, end_page in page_ranges(list(page_numbers)):
+        if should_stop and should_stop():
+            break
+        try:
+            results.append(reprocess_pages(pdf, start_page, end_page, use_cache=False, concurrency=concurrency, should_stop=should_stop))
+        except ValueError as e:
+            results.append(f"Pages {start_page + 1}-{end_page}: {e}")
+
+    return " ".join(results) if results else "No failed pages due for a retry."
+
+
+def record_page_result(
+    pdf: PDFUpload,
+    page_num: int,
+    page_response: PageResponse,
+    response_cleaned: str | None,
+    save_seconds: float | None,
+    images: list[EncodedImage] | None = None,
+    db_seconds: float | None = None,
+    db_retries: int = 0,
+    question_count: int = 0
+) -> None:
+    """
+    Keeps the raw model output of a page so the parser can be replayed offline (see replay_pdf),
+    together with its per-stage timings for the ingestion metrics.
+    """
+    usage = page_response.usage or {}
+    encode_seconds = sum(image.encode_seconds for image in images) if images else None
+    if images:
+        upload_bytes = sum(len(image.data) for image in images)
+    else:
+        upload_bytes = len(page_response.page_text.encode("utf-8")) if page_response.page_text else None
+    try:
+        PageResult.objects.update_or_create(
+            pdf=pdf,
+            page_number=page_num + 1,
+            defaults={
+                "source": PageResult.SOURCE_TEXT if page_response.page_text else PageResult.SOURCE_IMAGE,
+                "model_name": page_response.model_name or "",
+                "from_cache": page_response.from_cache,
+                "raw_response": page_response.response or "",
+                "cleaned_response": response_cleaned,
+                "prompt_tokens": usage.get("prompt_tokens"),
+                "completion_tokens": usage.get("completion_tokens"),
+                "prepare_seconds": page_response.prepare_seconds,
+                "render_seconds": page_response.prepare_seconds - (encode_seconds or 0) if page_response.prepare_seconds is not None else None,
+                "encode_seconds": encode_seconds,
+                "upload_bytes": upload_bytes,
+                "llm_seconds": page_response.llm_seconds,
+                "save_seconds": save_seconds,
+                "parse_seconds": save_seconds - db_seconds if save_seconds is not None and db_seconds is not None else None,
+                "db_seconds": db_seconds,
+                "api_retries": page_response.api_retries,
+                "db_retries": db_retries,
+                "question_count": question_count,
+                "repaired_items": page_response.repaired_items,
+                "failed_items": page_response.failed_items,
+                "model_tier": page_response.tier or "",
+                "tier_attempts": [asdict(attempt) for attempt in page_response.tier_attempts]
+            }
+        )
+        JSONRepair.objects.bulk_create([
+            JSONRepair(
+                pdf=pdf,
+                page_number=page_num + 1,
+                method=outcome.method,
+                succeeded=outcome.succeeded,
+                truncated=outcome.truncated,
+                original_text=outcome.original_text,
+                repaired_text=outcome.repaired_text
+            )
+            for outcome in page_response.repairs
+        ])
+    except Exception as e:
+        print(f"⚠️ Could not store page result for Page {page_num}: {e}")
+
+
+@dataclass
+class PageOutcome:
+    """What happened to one page of a batch, stored by record_page_outcome."""
+    page_response: PageResponse | None = None
+    images: list[EncodedImage] = field(default_factory=list)
+    # (error type, message) of a page that goes to the dead-letter queue
+    failure: tuple[str, str] | None = None
+    question_count: int = 0
+    db_retries: int = 0
+    save_seconds: float | None = None
+    save_timings: dict[str, float] = field(default_factory=dict)
+
+
+def fetch_single_page(
+    doc: fitz.Document,
+    pdf: PDFUpload,
+    pdf_hash: str,
+    page_num: int,
+    groq: GroqClient,
+    cache: ResponseCache,
+    context_text: str | None
+) -> tuple[PageResponse, list[EncodedImage]]:
+    """Renders the page and runs it through the model in this thread, for batches without a PagePipeline."""
+    started = perf_counter()
+    page_text, image, columns = prepare_page(doc, pdf_hash, page_num, pdf.image_encoding, pdf.layout_mode)
+    prepare_seconds = perf_counter() - started
+
+    # Text-only prompt if the page has a usable text layer
+    page_response = fetch_page_content(groq, page_text, image, context_text if context_text else None, cache, columns=columns)
+    page_response.prepare_seconds = prepare_seconds
+    if not page_response.response:
+        raise ValueError("Model returned an empty response")
+    return page_response, [image] if image else columns
+
+
+def save_page_items(
+    pdf: PDFUpload,
+    page_items: Iterable[dict],
+    carry_over: tuple[dict | None, str | None, dict[str, str]],
+    page_num: int,
+    is_last_page: bool,
+    session: ParserSession,
+    replace_existing: bool,
+    outcome: PageOutcome
+) -> tuple[dict | None, str | None, dict[str, str]] | None:
+    """
+    Saves the page with save_parsed_page, retrying when the database connection drops.
+    Returns the carry-over (buffer, subcategory, pending explanations) for the next page, or None
+    when the page could not be saved, in which case `outcome.failure` says why.
+    """
+    started = perf_counter()
+    max_retries = 3
+    for attempt in range(max_retries):
+        try:
+            # Ensure we have a fresh connection before starting DB work
+            close_old_connections()
 
-def process_next_batch(pdf: PDFUpload, batch_size: int) -> str:
-    parser_state = pdf.parser_state or {}
+            buffer, subcategory, pending_explanations, count = save_parsed_page(
+                pdf, page_items, *carry_over, page_num, is_last_page, session,
+                replace_existing=replace_existing, timings=outcome.save_timings
+            )
+            outcome.question_count = count
+            return buffer, subcategory, pending_explanations
+
+        except OperationalError:
+            print(f"⚠️ DB Connection lost on Page {page_num} (Attempt {attempt+1}/{max_retries}). Retrying in 2s...")
+            outcome.db_retries += 1
+            close_old_connections()
+            sleep(2)
+        except Exception as e:
+            # Non-recoverable error (e.g. logic error, integrity error), not retried
+            print(f"❌ Error saving questions on Page {page_num}: {e}")
+            outcome.failure = (classify_error(e), str(e))
+            return None
+        finally:
+            outcome.save_seconds = perf_counter() - started
+
+    print(f"⏭️ Skipping Page {page_num} after {max_retries} failed database attempts.")
+    outcome.failure = (FailedPage.ERROR_DATABASE, f"{max_retries} failed database attempts")
+    return None
+
+
+def record_page_outcome(pdf: PDFUpload, page_num: int, outcome: PageOutcome, cascade_stats: CascadeStats) -> None:
+    """
+    Stores the page's PageResult and sends failed pages to the dead-letter queue instead of losing
+    them (see retry_failed_pages). A page with undecodable items counts as failed.
+    """
+    page_response = outcome.page_response
+    if page_response:
+        if page_response.repaired_items:
+            print(f"🩹 Repaired {page_response.repaired_items} malformed items on Page {page_num}.")
+        if page_response.failed_items:
+            print(f"❌ Skipped {page_response.failed_items} undecodable items on Page {page_num}.")
+            print("--- RAW AI RESPONSE ---")
+            print(page_response.response)
+            print("-----------------------")
+            outcome.failure = outcome.failure or (FailedPage.ERROR_DECODE, f"{page_response.failed_items} undecodable items")
+
+        cascade_stats.record(page_response.tier_attempts)
+        record_page_result(
+            pdf, page_num, page_response, clean_ai_response(page_response.response) if page_response.response else None,
+            outcome.save_seconds, outcome.images, outcome.save_timings.get("db_seconds"), outcome.db_retries, outcome.question_count
+        )
+
+    if outcome.failure:
+        record_failed_page(pdf, page_num, *outcome.failure, payload=(page_response.response or "") if page_response else "")
+    else:
+        resolve_failed_page(pdf, page_num)
+
+
+def process_next_batch(
+    pdf: PDFUpload,
+    batch_size: int,
+    use_cache: bool = True,
+    concurrency: int = PIPELINE_CONCURRENCY,
+    should_stop: Callable[[], bool] | None = None,
+    start_page: int | None = None
+) -> str:
+    """
+    Processes up to `batch_size` pages from the last processed page on.
+    `should_stop` is checked before every page, the batch ends early (with progress saved) once it returns True.
+    A `start_page` reprocesses already processed pages from there instead, see reprocess_pages.
+    """
+    reprocessing = start_page is not None
+    if reprocessing:
+        parser_state = load_checkpoint(pdf, start_page)
+    else:
+        parser_state = pdf.parser_state or {}
+        start_page = pdf.last_processed_page
     buffer = parser_state.get("buffer")
     current_subcat_state = parser_state.get("subcategory", "Genel")
     pending_explanations = parser_state.get("pending_explanations", {})
 
     doc = fitz.open(pdf.file.path)
-    start_page = pdf.last_processed_page
 
     if pdf.total_pages != len(doc):
         pdf.total_pages = len(doc)
         pdf.save(update_fields=["total_pages"])
 
     groq = GroqClient()
+    session = ParserSession(pdf.category_id, before_page=start_page + 1 if reprocessing else None)
+    cache = ResponseCache(enabled=use_cache and LLM_CACHE_ENABLED)
     total_created = 0
+    total_repaired = 0
+    total_failed = 0
+    cascade_stats = CascadeStats()
+    pdf_hash = file_sha256(pdf.file.path)
+
+    page_nums = [page_num for page_num in range(start_page, start_page + batch_size) if page_num < len(doc)]
+    next_page_to_parse = start_page
+    parsed_until = start_page
+    # What the pages after the range were parsed with, compared with the new carry-over at the end
+    following_state = pdf.parser_checkpoints.filter(page_number=start_page + batch_size).first() if reprocessing else None
+
+    def pipeline_context(page_num: int) -> str:
+        # Called when a page is submitted, reads the carry-over of the latest parsed page
+        return build_context_text(buffer, pending_explanations, current_subcat_state, previous_page_parsed=(page_num == next_page_to_parse))
+
+    # Blank, cover, index and duplicate pages never reach the model, see PageTriage
+    triage = triage_pages(doc, pdf, page_nums) if TRIAGE_ENABLED else {}
+    skipped_pages = {page_num for page_num, decision in triage.items() if decision.should_skip}
+    model_page_nums = [page_num for page_num in page_nums if page_num not in skipped_pages]
+
+    pipeline = None
+    if concurrency > 1 and len(model_page_nums) > 1:
+        pipeline = PagePipeline(
+            pdf.file.path, pdf_hash, pdf.image_encoding, model_page_nums, groq, pipeline_context, concurrency, RENDER_WORKERS, cache,
+            pdf.layout_mode
+        )
 
-    for i in range(batch_size):
-        page_num = start_page + i
-        if page_num >= len(doc):
-            break
-
-        try:
-            # Construct context for the AI from previous page/state
-            context_text = ""
-            if buffer:
-                q_num = buffer.get("question_number") or "?"
-                q_text = buffer.get("question", "")[:150]
-                context_text += f"- CONTINUATION NEEDED: The previous page ended with an incomplete Question #{q_num}: '{q_text}...'. Please look for its remaining options or text at the very top of this page and mark it as 'type': 'fragment'.\n"
-
-            if pending_explanations:
-                nums = list(pending_explanations.keys())
-                context_text += f"- PENDING EXPLANATIONS: We are still looking for the explanations/answers for these question numbers: {nums}. If you see them isolated on this page, use 'type': 'explanation_only' and 'linked_question_number'.\n"
-
-            if current_subcat_state:
-                context_text += f"- CURRENT SUBCATEGORY: {current_subcat_state}\n"
-
-            page = doc.load_page(page_num)
-            pix = page.get_pixmap(dpi=300)
-            img_bytes = pix.tobytes("png")
-            base64_image = base64.b64encode(img_bytes).decode("utf-8")
-
-            # 1. External API Call with Context
-            response = groq.get_quiz_content_from_image(base64_image, context_text=context_text if context_text else None)
-
-            if response:
-                response_cleaned = ""
-                # Clean up potential markdown formatting or conversational filler
-                # Find the first '[' and the last ']'
-                json_match = re.search(r"\[.*\]", response, re.DOTALL)
-                if json_match:
-                    response_cleaned = json_match.group(0)
-                else:
-                    response_cleaned = response
-
-                # Extra safeguard for common markdown fences
-                response_cleaned = response_cleaned.replace("```json", "").replace("```", "").strip()
-
-                # Defuse malformed hallucinated \u escapes that crash the JSON parser
-                response_cleaned = re.sub(r"\\u(?![0-9a-fA-F]{4})", r"\\\\u", response_cleaned)
-
-                response_json = json.loads(response_cleaned)
-
-                # 2. Database Operations with Retry Logic
-                max_retries = 3
-                for attempt in range(max_retries):
-                    try:
-                        # Ensure we have a fresh connection before starting DB work
-                        close_old_connections()
-
-                        with transaction.atomic():
-                            # Parsing logic reads/writes to DB, so it must be inside the atomic block
-                            # to prevent partial updates if the subsequent bulk_create or pdf.save fails.
-                            is_last_page = (page_num == len(doc) - 1)
-                            buffer, count, current_subcat_state, pending_explanations, questions_to_create, questions_to_update = parse_and_save_questions(
-                                pdf, response_json, buffer, current_subcat_state, pending_explanations, page_num + 1, is_last_page
-                            )
-
-                            if questions_to_create:
-                                Question.objects.bulk_create(questions_to_create)
-                                total_created += count
-
-                            if questions_to_update:
-                                Question.objects.bulk_update(questions_to_update, ["explanation", "text", "options", "correct_option"])
-
-                            # Save progress inside the transaction to ensure consistency
-                            pdf.last_processed_page = page_num + 1
-                            pdf.parser_state = {
-                                "buffer": buffer,
-                                "subcategory": current_subcat_state,
-                                "pending_explanations": pending_explanations
-                            }
-                            pdf.save(update_fields=["last_processed_page", "parser_state"])
-
-                        # Success - exit retry loop
-                        break
-
-                    except OperationalError:
-                        print(f"⚠️ DB Connection lost on Page {page_num} (Attempt {attempt+1}/{max_retries}). Retrying in 2s...")
-                        close_old_connections()
-                        sleep(2)
-                    except Exception as e:
-                        # Non-recoverable error (e.g. logic error, integrity error)
-                        print(f"❌ Error saving questions on Page {page_num}: {e}")
-                        # Don't retry logic errors
-                        break
-                else:
-                    print(f"⏭️ Skipping Page {page_num} after {max_retries} failed database attempts.")
-
-        except json.JSONDecodeError as e:
-            print(f"❌ Error decoding JSON on page {page_num}: {e}")
-            if 'response_cleaned' in locals():
-                print("--- RAW AI RESPONSE ---")
-                print(response_cleaned)
-                print("-----------------------")
-        except Exception as e:
-            print(f"Error processing page {page_num}: {e}")
-
-        sleep(3)
+    try:
+        for page_num in page_nums:
+            if should_stop and should_stop():
+                print(f"🛑 Stop requested, ending batch before Page {page_num}.")
+                break
 
-    return f"Processed pages {start_page} to {pdf.last_processed_page}. Added {total_created} questions."
+            next_page_to_parse = page_num
+            outcome = PageOutcome()
+            stream = None
 
+            try:
+                if page_num in skipped_pages:
+                    # Saved with no items, so progress and the carry-over state still move past the page
+                    print(f"⏭️ Skipping Page {page_num} ({triage[page_num].get_kind_display().lower()}).")
+                    page_items = []
+                elif pipeline:
+                    # Rendering and the vision call already ran ahead. Items are handed to the parser
+                    # while the model is still writing the page, the next page renders meanwhile.
+                    stream = pipeline.stream(page_num)
+                    page_items = stream
+                    outcome.images = stream.images
+                else:
+                    context_text = build_context_text(buffer, pending_explanations, current_subcat_state)
+                    outcome.page_response, outcome.images = fetch_single_page(doc, pdf, pdf_hash, page_num, groq, cache, context_text)
+                    page_items = outcome.page_response.items
+
+                if outcome.images:
+                    pdf.encoding_stats[str(page_num + 1)] = {
+                        "original_bytes": sum(image.original_bytes for image in outcome.images),
+                        "encoded_bytes": sum(len(image.data) for image in outcome.images),
+                        "mime_type": outcome.images[0].mime_type,
+                        "requests": len(outcome.images)
+                    }
+
+                carry_over = save_page_items(
+                    pdf, page_items, (buffer, current_subcat_state, pending_explanations), page_num, page_num == len(doc) - 1, session,
+                    reprocessing, outcome
+                )
+                if carry_over:
+                    buffer, current_subcat_state, pending_explanations = carry_over
+                    total_created += outcome.question_count
+                    parsed_until = page_num + 1
+
+                if stream:
+                    outcome.page_response = stream.result()
 
-def background_worker(pdf_ids: list[int], batch_size: int) -> None:
+            except Exception as e:
+                print(f"Error processing page {page_num}: {e}")
+                outcome.failure = outcome.failure or (classify_error(e), str(e))
+
+            record_page_outcome(pdf, page_num, outcome, cascade_stats)
+            if outcome.page_response:
+                total_repaired += outcome.page_response.repaired_items
+            if outcome.failure:
+                total_failed += 1
+
+    finally:
+        if pipeline:
+            pipeline.close()
+        # Pages rendered by the batch may have pushed the cache over its size cap
+        PageImageCache().evict()
+
+    pacing = groq.scheduler.state()
+    progress = f"Processed pages {start_page} to {pdf.last_processed_page}"
+    if reprocessing:
+        progress = f"Reprocessed pages {start_page + 1} to {parsed_until}"
+        new_state = {"buffer": buffer, "subcategory": current_subcat_state, "pending_explanations": pending_explanations}
+        if following_state and parsed_until == start_page + batch_size and following_state.state != new_state:
+            # Page Y+1 was parsed with the old carry-over (e.g. a question continued from Page Y)
+            print(f"⚠️ Carry-over after Page {parsed_until} changed, the pages after the range may need reprocessing too.")
+            progress += f" (carry-over after Page {parsed_until} changed, check the following pages)"
+
+    return (
+        f"{progress}. Added {total_created} questions. "
+        f"Repaired {total_repaired} malformed items. Failed pages {total_failed}. {cache.summary()}. "
+        f"Rate limit waits {pacing['total_wait_seconds']}s, 429s {pacing['rate_limited_count']}. {cascade_stats.summary()}."
+    )
+
+
+def background_worker(pdf_ids: list[int], batch_size: int | None = None, use_cache: bool = True) -> None:
     print(f"--- 🚀 Starting Background Batch (Count: {len(pdf_ids)}) ---", flush=True)
+    owner = worker_id()
 
     for pdf_id in pdf_ids:
+        close_old_connections()
+        if not acquire_lease(pdf_id, owner):
+            print(f"⚠️ PDF {pdf_id} is leased by another worker, skipping.", flush=True)
+            continue
+
         try:
             # Re-fetch PDF to ensure fresh state
-            close_old_connections()
             pdf = PDFUpload.objects.get(id=pdf_id)
             print(f"▶️ Processing: {pdf.title}...", flush=True)
 
-            result = process_next_batch(pdf, batch_size)
+            with LeaseHeartbeat(pdf_id, owner) as heartbeat:
+                result = process_next_batch(pdf, batch_size or adaptive_batch_size(pdf), use_cache=use_cache, should_stop=heartbeat.lost.is_set)
             print(f"✅ Finished {pdf.title}: {result}", flush=True)
 
         except PDFUpload.DoesNotExist:
@@ -197,39 +670,9 @@ def background_worker(pdf_ids: list[int], batch_size: int) -> None:
         finally:
             try:
                 close_old_connections()
-                # Use a fresh fetch to unlock, just in case
-                PDFUpload.objects.filter(id=pdf_id).update(is_processing=False)
+                release_lease(pdf_id, owner)
                 print(f"🔓 [BG] Unlocked PDF {pdf_id}", flush=True)
             except Exception as e:
                 print(f"💀 [BG] Critical Error: Could not unlock PDF {pdf_id}: {e}", flush=True)
 
     print("--- 🏁 Batch Complete ---", flush=True)
-
-
-def launch_detached_worker(pdf_ids: list[int], batch_size: int = 10):
-    """
-    Spawns an independent OS-level process to run the PDF batch.
-    """
-    log_path = os.path.join(settings.BASE_DIR, "parser_bg.log")
-
-    if os.path.exists(log_path) and os.path.getsize(log_path) > MAX_FILE_SIZE:
-        backup_path = f"{log_path}.old"
-        if os.path.exists(backup_path):
-            os.remove(backup_path)
-
-        os.rename(log_path, backup_path)
-
-    manage_py_path = os.path.join(settings.BASE_DIR, "manage.py")
-    id_strs = [str(pid) for pid in pdf_ids]
-
-    command = ["python", manage_py_path, "process_pdf_batch"] + id_strs + ["--batch_size", str(batch_size)]
-
-    with open(log_path, "a") as log_file:
-        subprocess.Popen(
-            command,
-            stdout=log_file,
-            stderr=subprocess.STDOUT,
-            start_new_session=True,
-            close_fds=True,
-            cwd=settings.BASE_DIR
-        )
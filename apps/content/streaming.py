@@ -0,0 +1,101 @@
+import json
+from typing import Any
+
+from apps.content.json_repair import JSONRepairer
+from apps.content.parsers import defuse_unicode_escapes
+
+
+class JSONItemStream:
+    """
+    Pulls complete objects out of the top-level JSON array of a streamed response, chunk by chunk.
+    Text around the array (markdown fences, chatter) is ignored. An item that does not decode goes
+    through the `repairer` if one is given, and is skipped instead of failing the whole page otherwise.
+    """
+
+    def __init__(self, repairer: JSONRepairer | None = None) -> None:
+        self.repairer = repairer
+        self.items: list[dict[str, Any]] = []
+        self.failed_items = 0
+        self.repaired_items = 0
+        self.fed_chars = 0
+        self._in_array = False
+        self._depth = 0
+        self._in_string = False
+        self._escaped = False
+        self._current: list[str] = []
+
+    def feed(self, text: str) -> list[dict[str, Any]]:
+        """Returns the items completed by this chunk."""
+        self.fed_chars += len(text)
+        completed = []
+
+        for char in text:
+            if not self._in_array:
+                if char == "[":
+                    self._in_array = True
+                continue
+
+            if self._depth > 0:
+                self._current.append(char)
+
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif char == "\\":
+                    self._escaped = True
+                elif char == '"':
+                    self._in_string = False
+                continue
+
+            if char == '"' and self._depth > 0:
+                self._in_string = True
+            elif char in "{[":
+                if self._depth == 0:
+                    self._current = [char]
+                self._depth += 1
+            elif char in "}]":
+                if self._depth == 0:
+                    # End of the top-level array, a continuation may open a new one
+                    self._in_array = False
+                    continue
+                self._depth -= 1
+                if self._depth == 0:
+                    item = self._decode("".join(self._current))
+                    self._current = []
+                    if item is not None:
+                        completed.append(item)
+
+        self.items.extend(completed)
+        return completed
+
+    def finish(self) -> list[dict[str, Any]]:
+        """Call once the response is complete, recovers the last item if the response was cut off inside it."""
+        if self._depth == 0 or not self._current:
+            return []
+
+        text = "".join(self._current)
+        self._current = []
+        self._depth = 0
+        self._in_string = False
+        self._escaped = False
+
+        item = self._decode(text, truncated=True)
+        completed = [item] if item is not None else []
+        self.items.extend(completed)
+        return completed
+
+    def _decode(self, text: str, truncated: bool = False) -> dict[str, Any] | None:
+        try:
+            if truncated:
+                raise json.JSONDecodeError("Response ended inside the item", text, len(text))
+            item = json.loads(defuse_unicode_escapes(text))
+        except json.JSONDecodeError as e:
+            item = self.repairer.repair(text, truncated=truncated) if self.repairer else None
+            if item is None:
+                print(f"⚠️ Skipping undecodable item ({e}): {text[:80]}...")
+                self.failed_items += 1
+                return None
+            print(f"🩹 Repaired malformed item: {text[:80]}...")
+            self.repaired_items += 1
+        return item if isinstance(item, dict) else None
+
@@ -1,9 +1,69 @@
-from django.test import TestCase
-from apps.content.models import PDFUpload, Category, Test, Question
-from apps.content.parsers import QuestionParser
+import base64
+import io
+import json
+import os
+import signal
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+from datetime import timedelta
+from unittest import mock
+import fitz
+from PIL import Image
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.management import call_command
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+from apps.content.cascade import validate_page_items
+from apps.content.constants import FAILED_PAGE_MAX_ATTEMPTS, QUIZ_COLUMN_PROMPT
+from apps.content.dead_letter import page_ranges, record_failed_page, resolve_failed_page
+from apps.content.encoding import EncodedImage, encode_page_image
+from apps.content.groq_client import GroqClient
+from apps.content.llm_cache import ResponseCache
+from apps.content.metrics import adaptive_batch_size, pages_per_minute, pdf_metrics
+from apps.content.ingest_worker import IngestWorker
+from apps.content.leases import acquire_lease, release_expired_leases, release_lease
+from apps.content.models import FailedPage, IngestJob, PDFUpload, PageResult, PageTriage, Category, Test, Question
+from apps.content.page_cache import PageImageCache, file_sha256
+from apps.content.parsers import ParserSession, QuestionParser
+from apps.content.pipeline import PagePipeline, PageResponse, fetch_page_content
+from apps.content.question_order import cache_key, get_category_questions, recount_questions
+from apps.content.rate_limiter import RateLimitScheduler, parse_reset_duration
+from apps.content.rendering import find_column_gutter
+from apps.content.services import check_reprocess_range, enqueue_failed_page_retries, enqueue_pdf_batches, load_checkpoint, save_parsed_page
+from apps.content.json_repair import JSONRepairer
+from apps.content.streaming import JSONItemStream
+from apps.content.text_layer import order_blocks_two_column
+from apps.content.triage import triage_pages
 from django.core.files.uploadedfile import SimpleUploadedFile
 
 
+class PDFFixture:
+    """
+    A PDF of the HEMATOLOJİ category, created with the `pdf_fields` of the test class.
+    bulk_create skips PDFUpload.save(), which would enable the cron and queue a batch itself.
+    """
+    pdf_fields = {"total_pages": 3}
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.category = Category.objects.create(test=Test.objects.create(name="DAHİLİYE"), name="HEMATOLOJİ")
+        cls.pdf = PDFUpload.objects.bulk_create([PDFUpload(category=cls.category, title="A", **cls.pdf_fields)])[0]
+
+    def save(self, page_num: int, items: list[dict], replace_existing: bool = False) -> None:
+        """Saves the page like a batch does, from the carry-over of the previous page or of the checkpoint when reprocessing."""
+        state = load_checkpoint(self.pdf, page_num) if replace_existing else self.pdf.parser_state
+        session = ParserSession(self.category.id, before_page=page_num + 1 if replace_existing else None)
+        save_parsed_page(
+            self.pdf, items, state.get("buffer"), state.get("subcategory", "Genel"), state.get("pending_explanations", {}),
+            page_num, page_num == self.pdf.total_pages - 1, session, replace_existing=replace_existing
+        )
+
+
 class QuestionParserTests(TestCase):
     def setUp(self):
         self.test_obj = Test.objects.create(name="DAHİLİYE")
@@ -76,6 +136,55 @@ class QuestionParserTests(TestCase):
         # Check Explanation Update
         self.assertEqual(updated_q.explanation, "Initial explanation\ncontinued explanation")
 
+    def test_fragment_repeating_earlier_text_is_appended_outside_reprocessing(self):
+        initial_q = Question.objects.create(
+            category=self.category, subcategory="Anemiler", question_number=1, text="Hangisi doğrudur? Hangisi",
+            options=["A) Option 1"], correct_option="?", explanation="Açıklama", page_number=1
+        )
+        fragment_item = {"type": "fragment", "question": "Hangisi", "explanation": "Açıklama", "correct_option": "A", "is_continuation": True}
+
+        parser = QuestionParser(self.pdf, buffer=None, current_subcat_state="Anemiler")
+        parser.handle_fragment(fragment_item, ["A) Option 1"], "Anemiler", page_num=2)
+        updated_q = parser.questions_to_update_map[initial_q.id]
+        self.assertEqual(updated_q.text, "Hangisi doğrudur? Hangisi Hangisi")
+        self.assertEqual(updated_q.options, ["A) Option 1", "A) Option 1"])
+        self.assertEqual((updated_q.explanation, updated_q.correct_option), ("Açıklama\nAçıklama", "A"))
+
+        # Reprocessing the page finds it already merged, only the answer is taken over
+        initial_q.refresh_from_db()
+        session = ParserSession(self.category.id, before_page=2)
+        parser = QuestionParser(self.pdf, buffer=None, current_subcat_state="Anemiler", session=session)
+        parser.handle_fragment(fragment_item, ["A) Option 1"], "Anemiler", page_num=2)
+        updated_q = parser.questions_to_update_map[initial_q.id]
+        self.assertEqual((updated_q.text, updated_q.options, updated_q.correct_option), (initial_q.text, initial_q.options, "A"))
+
+    def test_reprocessing_skips_only_text_merged_as_whole_segments(self):
+        initial_q = Question.objects.create(
+            category=self.category, subcategory="Anemiler", question_number=1, text="Hangisi doğrudur?",
+            options=["A) Option 1"], correct_option="A", explanation="Doğru cevap A. Ayrıca bakınız", page_number=1
+        )
+        session = ParserSession(self.category.id, before_page=2)
+        parser = QuestionParser(self.pdf, buffer=None, current_subcat_state="Anemiler", session=session)
+
+        # Repeated inside a word or a line, not as a part this question was built from
+        parser.handle_fragment({"type": "fragment", "question": "doğru", "explanation": "Doğru cevap A."}, [], "Anemiler", page_num=2)
+        parser.handle_explanation_only({"linked_question_number": 1, "explanation": "Ayrıca"})
+
+        updated_q = parser.questions_to_update_map[initial_q.id]
+        self.assertEqual(updated_q.text, "Hangisi doğrudur? doğru")
+        self.assertEqual(updated_q.explanation, "Doğru cevap A. Ayrıca bakınız\nDoğru cevap A.\n\nAyrıca")
+
+    def test_question_cut_off_by_a_truncated_response_is_buffered(self):
+        stream = JSONItemStream(JSONRepairer())
+        stream.feed('[{"type": "question", "question_number": 1, "question": "Soru", "options": ["A) a", "B) b')
+        stream.finish()
+
+        parser = QuestionParser(self.pdf, buffer=None, current_subcat_state="Anemiler")
+        parser.parse(stream.items, page_num=1)
+
+        self.assertEqual(parser.questions_to_create, [])
+        self.assertEqual((parser.new_buffer["question_number"], parser.new_buffer["options"]), (1, ["A) a", "B) b"]))
+
     def test_handle_fragment_does_not_overwrite_correct_option_with_unknown(self):
         """
         Test that handle_fragment ignores correct_option if it's missing or invalid in the fragment.
@@ -105,3 +214,711 @@ class QuestionParserTests(TestCase):
 
         # Should remain "A"
         self.assertEqual(updated_q.correct_option, "A")
+
+    def test_session_links_explanations_through_the_index(self):
+        Question.objects.create(category=self.category, subcategory="Anemiler", question_number=5, text="Q5a", options=[], correct_option="A", page_number=1)
+        linked = Question.objects.create(category=self.category, subcategory="Lösemiler", question_number=5, text="Q5b", options=[], correct_option="B", page_number=2)
+        session = ParserSession(self.category.id)
+        page = [{"type": "explanation_only", "linked_question_number": 5, "correct_option": "B", "explanation": "Açıklama"}]
+
+        # One query for the index, one for the linked question
+        with self.assertNumQueries(2):
+            parser = QuestionParser(self.pdf, buffer=None, current_subcat_state="Lösemiler", session=session)
+            parser.parse(page, page_num=3)
+        self.assertEqual(parser.questions_to_update_map[linked.id].explanation, "Açıklama")
+
+        # The next page of the batch reuses both
+        with self.assertNumQueries(0):
+            parser = QuestionParser(self.pdf, buffer=None, current_subcat_state="Lösemiler", session=session)
+            parser.parse([dict(page[0], explanation="Devamı")], page_num=4)
+        self.assertEqual(parser.questions_to_update_map[linked.id].explanation, "Açıklama\n\nDevamı")
+
+
+class PageImageCacheTests(SimpleTestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp_dir.cleanup)
+
+    def test_get_returns_stored_bytes_for_same_key_only(self):
+        cache = PageImageCache(self.tmp_dir.name, max_bytes=1024)
+        cache.put("ab" * 32, 3, 300, "png", b"page-3")
+
+        self.assertEqual(cache.get("ab" * 32, 3, 300, "png"), b"page-3")
+        self.assertIsNone(cache.get("ab" * 32, 3, 150, "png"))
+        self.assertIsNone(cache.get("cd" * 32, 3, 300, "png"))
+
+    def test_evicts_least_recently_used_pages_over_size_cap(self):
+        cache = PageImageCache(self.tmp_dir.name, max_bytes=10)
+        pdf_hash = "ab" * 32
+
+        cache.put(pdf_hash, 0, 300, "png", b"12345")
+        cache.put(pdf_hash, 1, 300, "png", b"12345")
+        # Make page 0 the oldest on disk, then touch it through a hit so page 1 becomes the LRU entry
+        os.utime(cache.path_for(pdf_hash, 0, 300, "png"), (0, 0))
+        os.utime(cache.path_for(pdf_hash, 1, 300, "png"), (1, 1))
+        cache.get(pdf_hash, 0, 300, "png")
+
+        cache.put(pdf_hash, 2, 300, "png", b"12345")
+        # Writes never scan the directory, eviction runs once per batch
+        self.assertTrue(cache.has(pdf_hash, 1, 300, "png"))
+        self.assertEqual(cache.evict(), 1)
+
+        self.assertTrue(cache.has(pdf_hash, 0, 300, "png"))
+        self.assertFalse(cache.has(pdf_hash, 1, 300, "png"))
+        self.assertTrue(cache.has(pdf_hash, 2, 300, "png"))
+
+
+class EncodePageImageTests(SimpleTestCase):
+    def test_lowers_quality_and_size_until_within_byte_budget(self):
+        # Random noise barely compresses, so the budget can only be met by the fallback steps
+        img = Image.frombytes("RGB", (2000, 2800), os.urandom(2000 * 2800 * 3))
+        out = io.BytesIO()
+        img.save(out, format="PNG")
+        png_bytes = out.getvalue()
+
+        profile = {"format": "jpeg", "quality": 90, "grayscale": True, "max_pixels": None, "max_bytes": 400_000}
+        with mock.patch.dict("apps.content.encoding.IMAGE_ENCODING_PROFILES", {"test": profile}):
+            encoded = encode_page_image(png_bytes, "test")
+
+        self.assertEqual(encoded.mime_type, "image/jpeg")
+        self.assertLessEqual(len(encoded.data), 400_000)
+        self.assertEqual(encoded.bytes_saved, len(png_bytes) - len(encoded.data))
+
+
+class TextLayerOrderTests(SimpleTestCase):
+    def test_reads_left_column_then_right_between_full_width_headers(self):
+        def block(name, x0, y0, x1):
+            return {"name": name, "bbox": (x0, y0, x1, y0 + 10)}
+
+        blocks = [
+            block("right-1", 310, 50, 580),
+            block("left-1", 20, 60, 290),
+            block("header", 20, 10, 580),
+            block("left-2", 20, 200, 290),
+            block("right-2", 310, 100, 580),
+            block("header-2", 20, 400, 580),
+            block("right-3", 310, 420, 580),
+            block("left-3", 20, 430, 290),
+        ]
+
+        ordered = [b["name"] for b in order_blocks_two_column(blocks, page_width=600)]
+
+        self.assertEqual(ordered, ["header", "left-1", "left-2", "right-1", "right-2", "header-2", "left-3", "right-3"])
+
+
+class ResponseCacheTests(TestCase):
+    def test_key_changes_with_model_prompt_and_context(self):
+        key = ResponseCache.make_key(b"page", "model-a", "prompt", None)
+
+        self.assertEqual(key, ResponseCache.make_key(b"page", "model-a", "prompt", None))
+        self.assertNotEqual(key, ResponseCache.make_key(b"other page", "model-a", "prompt", None))
+        self.assertNotEqual(key, ResponseCache.make_key(b"page", "model-b", "prompt", None))
+        self.assertNotEqual(key, ResponseCache.make_key(b"page", "model-a", "edited prompt", None))
+        self.assertNotEqual(key, ResponseCache.make_key(b"page", "model-a", "prompt", "- CURRENT SUBCATEGORY: Genel"))
+
+    def test_counts_hits_and_misses_and_can_be_bypassed(self):
+        cache = ResponseCache()
+        key = ResponseCache.make_key(b"page", "model-a", "prompt", None)
+
+        self.assertIsNone(cache.get(key))
+        cache.set(key, "model-a", "[]")
+        self.assertEqual(cache.get(key), "[]")
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+
+        self.assertIsNone(ResponseCache(enabled=False).get(key))
+
+
+class RateLimitSchedulerTests(SimpleTestCase):
+    def test_parse_reset_duration(self):
+        self.assertAlmostEqual(parse_reset_duration("2m59.56s"), 179.56)
+        self.assertAlmostEqual(parse_reset_duration("7.66s"), 7.66)
+        self.assertAlmostEqual(parse_reset_duration("120ms"), 0.12)
+        self.assertIsNone(parse_reset_duration(None))
+
+    @mock.patch("apps.content.rate_limiter.sleep")
+    def test_paces_requests_once_the_minute_budget_is_spent(self, mocked_sleep):
+        scheduler = RateLimitScheduler(requests_per_minute=2, tokens_per_minute=10_000)
+
+        self.assertEqual(scheduler.acquire(100), 0)
+        self.assertEqual(scheduler.acquire(100), 0)
+        waited = scheduler.acquire(100)
+
+        # Third request has to wait for half a minute's refill (2 requests per 60s)
+        self.assertAlmostEqual(waited, 30, delta=1)
+        mocked_sleep.assert_called_once()
+
+    @mock.patch("apps.content.rate_limiter.sleep")
+    def test_remaining_tokens_header_slows_down_the_next_call(self, mocked_sleep):
+        scheduler = RateLimitScheduler(requests_per_minute=100, tokens_per_minute=6_000)
+        scheduler.update_from_headers({"x-ratelimit-limit-tokens": "6000", "x-ratelimit-remaining-tokens": "0"})
+
+        waited = scheduler.acquire(1_000)
+
+        # 6000 TPM refills 100 tokens per second
+        self.assertAlmostEqual(waited, 10, delta=0.5)
+        self.assertEqual(scheduler.state()["tokens_per_minute"], 6000)
+
+    def test_only_backoffs_from_a_429_count_as_rate_limited(self):
+        scheduler = RateLimitScheduler()
+
+        scheduler.backoff_delay(0)
+        scheduler.backoff_delay(1, retry_after=0.5, rate_limited=True)
+
+        self.assertEqual(scheduler.state()["rate_limited_count"], 1)
+
+
+class IngestQueueTests(TestCase):
+    def setUp(self):
+        test = Test.objects.create(name="DAHİLİYE")
+        categories = [Category.objects.create(test=test, name=name) for name in ("HEMATOLOJİ", "ENDOKRİN")]
+        # bulk_create skips PDFUpload.save(), which would enable the cron and queue a batch itself
+        self.first, self.second = PDFUpload.objects.bulk_create([
+            PDFUpload(category=categories[0], title="A", total_pages=10),
+            PDFUpload(category=categories[1], title="B", total_pages=10),
+        ])
+
+    def test_enqueue_splits_remaining_pages_into_ranges(self):
+        self.first.last_processed_page = 3
+        self.first.save(update_fields=["last_processed_page"])
+
+        enqueue_pdf_batches([self.first.id], batch_size=4, whole_pdf=True)
+        # The next batch is queued after the open ranges
+        enqueue_pdf_batches([self.first.id], batch_size=4)
+
+        ranges = list(IngestJob.objects.order_by("id").values_list("start_page", "end_page"))
+        self.assertEqual(ranges, [(3, 7), (7, 10)])
+
+    def test_workers_claim_different_pdfs_and_ranges_in_page_order(self):
+        enqueue_pdf_batches([self.first.id, self.second.id], batch_size=5, whole_pdf=True)
+        IngestJob.objects.filter(pdf=self.second).update(priority=1)
+
+        worker = IngestWorker()
+        claimed = [worker.claim_next_job(), worker.claim_next_job(), worker.claim_next_job()]
+
+        self.assertEqual([(job.pdf_id, job.start_page) for job in claimed[:2]], [(self.second.id, 0), (self.first.id, 0)])
+        self.assertEqual([job.attempts for job in claimed[:2]], [1, 1])
+        # Second ranges wait until the first ones are processed
+        self.assertIsNone(claimed[2])
+        self.assertEqual(PDFUpload.objects.filter(is_processing=True).count(), 2)
+
+    def test_pdfs_of_one_category_are_never_processed_at_once(self):
+        sibling = PDFUpload.objects.bulk_create([PDFUpload(category=self.first.category, title="A2", total_pages=10)])[0]
+        enqueue_pdf_batches([self.first.id, sibling.id], batch_size=5)
+
+        job = IngestWorker().claim_next_job()
+        self.assertIsNone(IngestWorker().claim_next_job())
+        self.assertFalse(acquire_lease(sibling.id if job.pdf_id == self.first.id else self.first.id, "other-host:1"))
+
+        release_lease(job.pdf_id, job.pdf.lease_owner)
+        self.assertIsNotNone(IngestWorker().claim_next_job())
+
+    def test_expired_lease_is_released_and_taken_over(self):
+        enqueue_pdf_batches([self.first.id], batch_size=5)
+        crashed = IngestWorker()
+        job = crashed.claim_next_job()
+        self.assertTrue(PDFUpload.objects.get(id=self.first.id).has_active_lease())
+
+        # The crashed worker stops renewing, nobody else may take the PDF until the lease runs out
+        self.assertIsNone(IngestWorker().claim_next_job())
+        PDFUpload.objects.filter(id=self.first.id).update(lease_expires_at=timezone.now() - timedelta(seconds=1))
+
+        self.assertEqual(release_expired_leases(), 1)
+        taken_over = IngestWorker()
+        taken_over.worker_id = "other-host:1"
+        resumed = taken_over.claim_next_job()
+
+        self.assertEqual(resumed.id, job.id)
+        self.assertEqual(resumed.attempts, 2)
+        self.assertEqual(PDFUpload.objects.get(id=self.first.id).lease_owner, "other-host:1")
+
+    def test_sigterm_requeues_the_rest_of_the_range_and_releases_the_lease(self):
+        for signum in (signal.SIGTERM, signal.SIGINT):
+            self.addCleanup(signal.signal, signum, signal.getsignal(signum))
+        enqueue_pdf_batches([self.first.id], whole_pdf=True)
+
+        def run_batch(pdf, batch_size, should_stop=None, **kwargs):
+            # The supervisor stops the worker while Page 4 is in progress, the batch ends after it
+            signal.raise_signal(signal.SIGTERM)
+            self.assertTrue(should_stop())
+            pdf.last_processed_page = 4
+            PDFUpload.objects.filter(id=pdf.id).update(last_processed_page=4)
+            return "stopped"
+
+        with mock.patch("apps.content.ingest_worker.process_next_batch", side_effect=run_batch) as process:
+            IngestWorker(poll_seconds=0).run()
+
+        process.assert_called_once()
+        job = IngestJob.objects.get()
+        self.assertEqual((job.status, job.start_page, job.end_page, job.attempts), (IngestJob.STATUS_QUEUED, 4, 10, 0))
+        pdf = PDFUpload.objects.get(id=self.first.id)
+        self.assertFalse(pdf.has_active_lease())
+        self.assertEqual(pdf.lease_owner, "")
+
+
+class StreamingTests(SimpleTestCase):
+    def test_items_are_completed_across_chunks(self):
+        response = '```json\n[{"question": "a [b] {c}", "options": ["A) \\"x\\""]}, {"broken": }, {"question": "d"}]\n```'
+        stream = JSONItemStream()
+
+        completed = [item for i in range(0, len(response), 7) for item in stream.feed(response[i:i + 7])]
+
+        self.assertEqual(completed, [{"question": "a [b] {c}", "options": ['A) "x"']}, {"question": "d"}])
+        self.assertEqual(stream.failed_items, 1)
+
+    @mock.patch("apps.content.groq_client.Groq")
+    def test_truncated_response_is_continued(self, mocked_groq):
+        def chunks(*texts, finish_reason):
+            for i, text in enumerate(texts):
+                last = i == len(texts) - 1
+                yield SimpleNamespace(
+                    choices=[SimpleNamespace(delta=SimpleNamespace(content=text), finish_reason=finish_reason if last else None)],
+                    x_groq=SimpleNamespace(usage=SimpleNamespace(prompt_tokens=10, completion_tokens=5, total_tokens=15)) if last else None
+                )
+
+        responses = [chunks('[{"question": "a"}, {"ques', finish_reason="length"), chunks('```json\ntion": "b"}]', finish_reason="stop")]
+        create = mocked_groq.return_value.chat.completions.with_raw_response.create
+        create.side_effect = lambda **kwargs: SimpleNamespace(headers={}, parse=lambda: responses.pop(0))
+
+        client = GroqClient(scheduler=RateLimitScheduler())
+        stream = JSONItemStream()
+        response = client.get_quiz_content_from_text("page", on_text=stream.feed)
+
+        self.assertEqual(stream.items, [{"question": "a"}, {"question": "b"}])
+        self.assertEqual(response, '[{"question": "a"}, {"question": "b"}]')
+        self.assertEqual(client.last_usage, {"prompt_tokens": 20, "completion_tokens": 10})
+        # The continuation carries the partial answer
+        self.assertEqual(create.call_args.kwargs["messages"][-2], {"role": "assistant", "content": '[{"question": "a"}, {"ques'})
+
+
+class JSONRepairTests(SimpleTestCase):
+    def test_near_misses_are_repaired_locally(self):
+        response = '[{"question": "Who said "no"?", "options": ["A", "B",],}, {"question": "cut off", "options": ["A", "B'
+        repairer = JSONRepairer()
+        stream = JSONItemStream(repairer)
+
+        stream.feed(response)
+        stream.finish()
+
+        self.assertEqual(stream.items, [
+            {"question": 'Who said "no"?', "options": ["A", "B"]},
+            {"question": "cut off", "options": ["A", "B"], "is_incomplete": True}
+        ])
+        self.assertEqual(stream.repaired_items, 2)
+        self.assertEqual([(o.method, o.succeeded, o.truncated) for o in repairer.outcomes], [("local", True, False), ("local", True, True)])
+
+    def test_fix_call_is_text_only_and_recorded(self):
+        groq = mock.Mock()
+        groq.fix_json.return_value = '```json\n{"question": "fixed"}\n```'
+        repairer = JSONRepairer(groq)
+
+        item = repairer.repair('{"question" "fixed"}')
+
+        self.assertEqual(item, {"question": "fixed"})
+        groq.fix_json.assert_called_once_with('{"question" "fixed"}')
+        self.assertEqual([(o.method, o.succeeded) for o in repairer.outcomes], [("local", False), ("llm", True)])
+
+
+class CascadeTests(SimpleTestCase):
+    def test_validator_flags_broken_questions(self):
+        items = [
+            {"type": "question", "question_number": 5, "question": "a", "options": ["A) x", "B) y"], "correct_option": "B"},
+            {"type": "question", "question_number": 5, "question": "variant", "options": ["A) x", "B) y"], "correct_option": "A"},
+            {"type": "question", "question_number": 4, "question": " ", "options": ["A) x"], "correct_option": "C"},
+            {"type": "question", "question_number": 6, "question": "cut", "options": [], "is_incomplete": True},
+        ]
+
+        problems = validate_page_items(items)
+
+        self.assertEqual(problems, [
+            "Q4 has no text", "Q4 has 1 options", "Q4 has correct_option C outside its 1 options", "Q4 follows Q5"
+        ])
+
+    def test_only_failing_pages_escalate(self):
+        valid = '[{"type": "question", "question_number": 1, "question": "q", "options": ["A) x", "B) y"], "correct_option": "A"}]'
+        groq = mock.Mock(last_usage=None, last_retries=0)
+        groq.get_quiz_content_from_text.side_effect = lambda *args, model, **kwargs: valid if model == "strong-text" else '[{"type": "question"}]'
+        pushed = []
+
+        with mock.patch("apps.content.cascade.MODEL_TIERS", [
+            {"name": "fast", "model": "fast-vision", "text_model": "fast-text"},
+            {"name": "strong", "model": "strong-vision", "text_model": "strong-text"},
+        ]):
+            page_response = fetch_page_content(groq, "page text", None, None, on_item=pushed.append)
+
+        self.assertEqual(page_response.tier, "strong")
+        self.assertEqual([(a.tier, a.passed) for a in page_response.tier_attempts], [("fast", False), ("strong", True)])
+        self.assertEqual(pushed, page_response.items)
+        self.assertEqual(len(pushed), 1)
+
+
+class TriageTests(PDFFixture, TestCase):
+    pdf_fields = {"total_pages": 5}
+
+    def test_blank_index_and_duplicate_pages_are_skipped(self):
+        body = "\n".join(f"{n}. Hangisi hemolitik anemi bulgusudur? A) Retikülositoz B) Lökopeni" for n in range(1, 15))
+        index = "İÇİNDEKİLER\n" + "\n".join(f"Bölüm {n} ........ {n * 10}" for n in range(1, 12))
+
+        doc = fitz.open()
+        for text in ("", "Hematoloji\n" + body, body, body, index):
+            page = doc.new_page()
+            if text:
+                page.insert_text((40, 60), text, fontsize=9)
+
+        decisions = triage_pages(doc, self.pdf, list(range(5)))
+
+        self.assertEqual([decisions[n].kind for n in range(5)], ["blank", "content", "content", "duplicate", "index"])
+        self.assertEqual(decisions[3].duplicate_of, 3)
+
+        # A stored decision is reused, so an override sticks
+        PageTriage.objects.filter(pdf=self.pdf, page_number=4).update(override=PageTriage.OVERRIDE_PROCESS)
+        self.assertFalse(triage_pages(doc, self.pdf, [3])[3].should_skip)
+
+    def test_question_pages_resembling_an_index_or_an_earlier_page_are_kept(self):
+        # Options ending in lab values, and the keyword inside a sentence
+        lab_values = "The table of contents of a blood count:\n" + "\n".join(
+            f"{label}) Hemoglobin {value}" for label, value in zip("ABCDEABCDE", (12, 9, 140, 7, 11, 300, 45, 8, 90, 13))
+        )
+        question = "1. Hangisi hemolitik anemi bulgusudur?\nA) Retikülositoz\nB) Lökopeni"
+
+        doc = fitz.open()
+        for text in (lab_values, question, question.replace("Lökopeni", "Trombositoz")):
+            doc.new_page().insert_text((40, 60), text, fontsize=9)
+
+        decisions = triage_pages(doc, self.pdf, list(range(3)))
+        self.assertEqual([decisions[n].kind for n in range(3)], ["content", "content", "content"])
+
+
+class ColumnSplitTests(SimpleTestCase):
+    def test_gutter_is_found_between_two_columns(self):
+        words = ["hemolitik", "anemi", "retikülositoz", "lökopeni", "trombosit", "ferritin", "demir", "hemoglobin"]
+        doc = fitz.open()
+        for columns in ([(40, 48), (320, 48)], [(40, 100)]):
+            page = doc.new_page()
+            for row, y in enumerate(range(60, 780, 12)):
+                for x, width in columns:
+                    # Lines that fill the column, with word gaps at different places on every row
+                    text = " ".join(words[(row + i) % len(words)] for i in range(12))
+                    page.insert_text((x, y), text[:width], fontsize=10)
+
+        gutter = find_column_gutter(doc.load_page(0))
+
+        self.assertTrue(250 < gutter < 320, gutter)
+        self.assertIsNone(find_column_gutter(doc.load_page(1)))
+
+    def test_columns_are_merged_in_reading_order(self):
+        right_done = threading.Event()
+        calls = {}
+
+        def answer(base64_image, context_text=None, prompt=None, **kwargs):
+            column = base64.b64decode(base64_image).decode()
+            calls[column] = (context_text, prompt)
+            if column == "left":
+                # The right column finishes first, its items must still come second
+                right_done.wait(5)
+                return '[{"type": "question", "question_number": 1, "question": "q", "options": ["A) x", "B) y"], "correct_option": "A"}]'
+            right_done.set()
+            return '[{"type": "question", "question_number": 2, "question": "q", "options": ["A) x", "B) y"], "correct_option": "B"}]'
+
+        groq = mock.Mock(last_usage=None, last_retries=0)
+        groq.get_quiz_content_from_image.side_effect = answer
+        columns = [EncodedImage(b"left", "image/png", 4, 1, 1), EncodedImage(b"right", "image/png", 5, 1, 1)]
+        context = "- CONTINUATION NEEDED: Question #9\n- CURRENT SUBCATEGORY: Genel\n"
+        pushed = []
+
+        page_response = fetch_page_content(groq, None, None, context, on_item=pushed.append, columns=columns)
+
+        self.assertEqual([item["question_number"] for item in pushed], [1, 2])
+        self.assertEqual(page_response.items, pushed)
+        self.assertEqual(calls["left"], (context, QUIZ_COLUMN_PROMPT))
+        self.assertEqual(calls["right"], ("- CURRENT SUBCATEGORY: Genel\n", QUIZ_COLUMN_PROMPT))
+
+
+class PagePipelineTests(SimpleTestCase):
+    def test_pages_come_back_in_page_order_and_errors_reach_the_consumer(self):
+        second_done = threading.Event()
+
+        def prepare(page_num, encoding=None, layout_mode=None):
+            return f"page {page_num}", None, [], 0.0
+
+        def fetch(groq, page_text, image, context_text, cache=None, on_item=None, columns=None):
+            page_num = int(page_text.split()[1])
+            if page_num == 1:
+                # Page 2 finishes first, its items must still come second
+                second_done.wait(5)
+            if page_num == 3:
+                raise RuntimeError("Groq is down")
+            item = {"type": "question", "question_number": page_num}
+            on_item(item)
+            if page_num == 2:
+                second_done.set()
+            return PageResponse("[]", page_text=page_text, items=[item])
+
+        with (
+            # Threads instead of processes so the stubs below apply to the render calls too
+            mock.patch("apps.content.pipeline.ProcessPoolExecutor", ThreadPoolExecutor),
+            mock.patch("apps.content.pipeline.init_render_worker"),
+            mock.patch("apps.content.pipeline.prepare_in_worker", side_effect=prepare),
+            mock.patch("apps.content.pipeline.fetch_page_content", side_effect=fetch),
+        ):
+            pipeline = PagePipeline("test.pdf", None, None, [1, 2, 3], mock.Mock(), lambda page_num: "", concurrency=2, render_workers=2)
+            try:
+                pages = [[item["question_number"] for item in pipeline.stream(page_num)] for page_num in (1, 2)]
+                with self.assertRaisesMessage(RuntimeError, "Groq is down"):
+                    list(pipeline.stream(3))
+            finally:
+                pipeline.close()
+
+        self.assertTrue(second_done.is_set())
+        self.assertEqual(pages, [[1], [2]])
+
+
+class ReprocessTests(PDFFixture, TestCase):
+    def setUp(self):
+        self.pages = [
+            [{"type": "question", "question_number": 1, "question": "Soru 1", "options": ["A) a", "B) b"], "correct_option": "A"}],
+            [
+                {"type": "question", "question_number": 2, "question": "Soru 2 (yanlış okundu)", "options": ["A) a", "B) b"], "correct_option": "B"},
+                {"type": "question", "question_number": 3, "question": "Soru 3", "options": ["A) a"], "is_incomplete": True},
+            ],
+            [
+                {"type": "fragment", "question": "devamı", "options": ["B) b"], "correct_option": "A"},
+                {"type": "explanation_only", "linked_question_number": 1, "correct_option": "A", "explanation": "Açıklama 1"},
+            ],
+        ]
+
+    def test_only_questions_of_the_range_are_replaced(self):
+        for page_num, items in enumerate(self.pages):
+            self.save(page_num, items)
+        first, third = Question.objects.get(question_number=1), Question.objects.get(question_number=3)
+        self.assertEqual(third.page_number, 3)
+
+        with self.assertRaises(ValueError):
+            check_reprocess_range(self.pdf, 2, 4)
+
+        corrected = [dict(self.pages[1][0], question="Soru 2"), self.pages[1][1]]
+        self.save(1, corrected, replace_existing=True)
+        self.save(2, self.pages[2], replace_existing=True)
+
+        self.assertEqual(list(Question.objects.order_by("question_number").values_list("question_number", "page_number")), [(1, 1), (2, 2), (3, 3)])
+        self.assertEqual(Question.objects.get(question_number=2).text, "Soru 2")
+        # Questions before the range keep their rows, and the linked explanation is not added twice
+        first.refresh_from_db()
+        self.assertEqual(first.explanation, "Açıklama 1")
+        self.assertNotEqual(Question.objects.get(question_number=3).id, third.id)
+        self.assertEqual(Question.objects.get(question_number=3).text, "Soru 3 devamı")
+
+        self.pdf.refresh_from_db()
+        self.assertEqual(self.pdf.last_processed_page, 3)
+        self.assertEqual(self.pdf.parser_checkpoints.count(), 3)
+
+
+class DeadLetterTests(PDFFixture, TestCase):
+    pdf_fields = {"total_pages": 6, "last_processed_page": 6}
+
+    def test_failed_pages_are_retried_in_ranges_until_given_up(self):
+        self.assertEqual(page_ranges([5, 1, 2]), [(0, 2), (4, 5)])
+
+        record_failed_page(self.pdf, 0, FailedPage.ERROR_API, "Connection error.")
+        record_failed_page(self.pdf, 1, FailedPage.ERROR_DECODE, "2 undecodable items", payload='[{"type": "question", "question": "Soru')
+        # Not due yet
+        self.assertEqual(enqueue_failed_page_retries(), [])
+
+        FailedPage.objects.update(next_retry_at=timezone.now())
+        jobs = enqueue_failed_page_retries()
+        self.assertEqual([(job.kind, job.start_page, job.end_page, job.use_cache) for job in jobs], [(IngestJob.KIND_REPROCESS, 0, 2, False)])
+        # Nothing more while the retry is queued
+        self.assertEqual(enqueue_failed_page_retries(), [])
+
+        for _ in range(FAILED_PAGE_MAX_ATTEMPTS - 1):
+            failed = record_failed_page(self.pdf, 0, FailedPage.ERROR_API, "Connection error.")
+        self.assertEqual((failed.attempts, failed.status, failed.next_retry_at), (FAILED_PAGE_MAX_ATTEMPTS, FailedPage.STATUS_GAVE_UP, None))
+
+        resolve_failed_page(self.pdf, 1)
+        self.assertEqual(FailedPage.objects.get(page_number=2).status, FailedPage.STATUS_RESOLVED)
+
+
+class IngestMetricsTests(PDFFixture, TestCase):
+    pdf_fields = {"total_pages": 36, "last_processed_page": 6}
+
+    def test_throughput_eta_and_stage_percentiles(self):
+        started = timezone.now()
+        # Two runs of 3 pages, 20s per page, an hour apart
+        finished = [started + timedelta(seconds=20 * n) for n in range(3)] + [started + timedelta(hours=1, seconds=20 * n) for n in range(3)]
+        self.assertAlmostEqual(pages_per_minute(finished), 3.0)
+
+        for n, finished_at in enumerate(finished, start=1):
+            PageResult.objects.create(
+                pdf=self.pdf, page_number=n, llm_seconds=n, render_seconds=0.5, prompt_tokens=900, completion_tokens=300,
+                question_count=4, from_cache=n == 6
+            )
+            PageResult.objects.filter(pdf=self.pdf, page_number=n).update(updated_at=finished_at)
+
+        metrics = pdf_metrics(self.pdf)
+        self.assertAlmostEqual(metrics.eta_minutes, 10.0)
+        self.assertEqual(metrics.stages["llm"], (3, 6))
+        self.assertEqual(metrics.stages["db"], (None, None))
+        self.assertEqual(metrics.tokens_per_question, 300)
+
+        admin_user = User.objects.create_superuser("admin", "admin@example.com", "pass")
+        self.client.force_login(admin_user)
+        response = self.client.get("/admin/content/pdfupload/metrics/")
+        self.assertContains(response, "3.0")
+        self.assertContains(response, "3.00 / 6.00")
+
+
+class AdaptiveBatchTests(PDFFixture, TestCase):
+    pdf_fields = {"total_pages": 300}
+
+    def finish_pages(self, seconds_per_page: int) -> None:
+        started = timezone.now()
+        for n in range(1, 6):
+            PageResult.objects.update_or_create(pdf=self.pdf, page_number=n)
+            PageResult.objects.filter(pdf=self.pdf, page_number=n).update(updated_at=started + timedelta(seconds=seconds_per_page * n))
+
+    def test_batch_size_follows_page_latency(self):
+        self.assertEqual(adaptive_batch_size(self.pdf, target_seconds=600), 600 // 30)
+        self.finish_pages(5)
+        self.assertEqual(adaptive_batch_size(self.pdf, target_seconds=600), 120)
+        self.finish_pages(100)
+        self.assertEqual(adaptive_batch_size(self.pdf, target_seconds=600), 6)
+
+    def test_worker_runs_a_long_range_in_adaptive_batches(self):
+        enqueue_pdf_batches([self.pdf.id], whole_pdf=True)
+        self.assertEqual(list(IngestJob.objects.values_list("start_page", "end_page")), [(0, 300)])
+
+        def run_batch(pdf, batch_size, **kwargs):
+            pdf.last_processed_page += batch_size
+            return "ok"
+
+        worker = IngestWorker()
+        with mock.patch("apps.content.ingest_worker.adaptive_batch_size", return_value=120), \
+                mock.patch("apps.content.ingest_worker.process_next_batch", side_effect=run_batch) as process:
+            for _ in range(3):
+                worker.run_job(worker.claim_next_job())
+                PDFUpload.objects.filter(id=self.pdf.id).update(last_processed_page=process.call_args.args[0].last_processed_page)
+
+        self.assertEqual([call.args[1] for call in process.call_args_list], [120, 120, 60])
+        job = IngestJob.objects.get()
+        self.assertEqual((job.status, job.attempts), (IngestJob.STATUS_DONE, 1))
+
+
+class CategoryQuestionsCacheTests(PDFFixture, TestCase):
+    pdf_fields = {"total_pages": 2}
+
+    def setUp(self):
+        cache.clear()
+
+    def test_ingestion_bumps_the_version_of_the_cached_order(self):
+        self.save(1, [{"type": "question", "subcategory": "Lösemiler", "question_number": 1, "question": "Soru 1", "options": ["A) a", "B) b"], "correct_option": "A"}])
+        self.category.refresh_from_db()
+        questions = get_category_questions(self.category.id, self.category.question_version)
+        with self.assertNumQueries(0):
+            self.assertEqual(get_category_questions(self.category.id, self.category.question_version), questions)
+
+        self.save(0, [{"type": "question", "subcategory": "Anemiler", "question_number": 5, "question": "Soru 5", "options": ["A) a", "B) b"], "correct_option": "B"}])
+        self.category.refresh_from_db()
+        questions = get_category_questions(self.category.id)
+        self.assertEqual(list(questions.ids), list(Question.objects.order_by("page_number").values_list("id", flat=True)))
+        self.assertEqual([questions.subcategory(position) for position in range(len(questions))], ["Anemiler", "Lösemiler"])
+        self.assertEqual(questions.version, self.category.question_version)
+        self.assertEqual([questions.position(question_id) for question_id in questions.ids], [0, 1])
+        self.assertIsNone(questions.position(0))
+        # The position map travels in the cached value, a hit does not build it again
+        self.assertEqual(cache.get(cache_key(self.category.id, questions.version)).positions, {question_id: n for n, question_id in enumerate(questions.ids)})
+
+
+class QuestionCountTests(PDFFixture, TestCase):
+    pdf_fields = {"total_pages": 2}
+
+    def item(self, number: int, subcategory: str) -> dict:
+        return {"type": "question", "subcategory": subcategory, "question_number": number, "question": f"Soru {number}", "options": ["A) a", "B) b"], "correct_option": "A"}
+
+    def assert_counts(self, total: int, subcategory_counts: dict[str, int]) -> None:
+        self.category.refresh_from_db()
+        self.assertEqual((self.category.question_count, self.category.subcategory_counts), (total, subcategory_counts))
+
+    def test_ingestion_keeps_the_counts_and_recount_repairs_them(self):
+        self.save(0, [self.item(1, "Anemiler"), self.item(2, "Anemiler")])
+        self.save(1, [self.item(3, "Lösemiler")])
+        self.assert_counts(3, {"Anemiler": 2, "Lösemiler": 1})
+
+        self.save(0, [self.item(1, "Anemiler")], replace_existing=True)
+        self.assert_counts(2, {"Anemiler": 1, "Lösemiler": 1})
+
+        Question.objects.filter(subcategory="Lösemiler").delete()
+        self.assertEqual(recount_questions([self.category.id]), 1)
+        self.assert_counts(1, {"Anemiler": 1})
+        self.assertEqual(recount_questions([self.category.id]), 0)
+
+    def test_replay_counts_the_replayed_questions_once(self):
+        pages = [[self.item(1, "Anemiler"), self.item(2, "Anemiler")], [self.item(3, "Lösemiler")]]
+        for page_num, items in enumerate(pages):
+            self.save(page_num, items)
+            PageResult.objects.create(pdf=self.pdf, page_number=page_num + 1, raw_response=json.dumps(items, ensure_ascii=False))
+        PDFUpload.objects.filter(id=self.pdf.id).update(last_processed_page=2)
+
+        call_command("replay_pdf", self.pdf.id, stdout=io.StringIO())
+
+        self.assertEqual(sorted(Question.objects.values_list("question_number", flat=True)), [1, 2, 3])
+        self.assert_counts(3, {"Anemiler": 2, "Lösemiler": 1})
+
+
+class ReplayPDFTests(PDFFixture, TestCase):
+    def item(self, number: int, text: str, subcategory: str = "Anemiler") -> dict:
+        return {"type": "question", "subcategory": subcategory, "question_number": number, "question": text, "options": ["A) a", "B) b"], "correct_option": "A"}
+
+    def test_replay_rebuilds_the_questions_from_the_stored_responses(self):
+        self.save(0, [self.item(1, "Soru 1 (yanlış okundu)"), self.item(2, "Soru 2")])
+        self.save(1, [])
+        self.save(2, [self.item(3, "Soru 3", "Lösemiler")])
+        # Page 1 was corrected in its stored response, Page 2 was triaged away and Page 3 has no stored response
+        PageResult.objects.create(pdf=self.pdf, page_number=1, raw_response=json.dumps([self.item(1, "Soru 1"), self.item(2, "Soru 2")], ensure_ascii=False))
+        PageTriage.objects.create(pdf=self.pdf, page_number=2, kind=PageTriage.KIND_BLANK)
+
+        out = io.StringIO()
+        call_command("replay_pdf", self.pdf.id, stdout=out)
+
+        self.assertEqual(list(Question.objects.order_by("question_number").values_list("question_number", "page_number", "text")), [
+            (1, 1, "Soru 1"), (2, 1, "Soru 2")
+        ])
+        self.category.refresh_from_db()
+        self.assertEqual((self.category.question_count, self.category.subcategory_counts), (2, {"Anemiler": 2}))
+        # The page without a response is reported, and progress does not move back
+        self.assertIn("without a usable stored response: [3]", out.getvalue())
+        self.pdf.refresh_from_db()
+        self.assertEqual(self.pdf.last_processed_page, 3)
+
+
+class WarmPageCacheTests(PDFFixture, TestCase):
+    def setUp(self):
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        settings_override = override_settings(MEDIA_ROOT=tmp_dir.name, PAGE_CACHE_DIR=os.path.join(tmp_dir.name, "page_cache"))
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        doc = fitz.open()
+        for n in range(3):
+            doc.new_page().insert_text((40, 60), f"Sayfa {n + 1}", fontsize=12)
+        # Stored without PDFUpload.save(), like the fixture PDF
+        self.pdf.file.save("test.pdf", ContentFile(doc.tobytes()), save=False)
+        PDFUpload.objects.filter(id=self.pdf.id).update(file=self.pdf.file.name)
+
+    def warm(self) -> str:
+        out = io.StringIO()
+        # Threads instead of processes so the settings override reaches the render calls
+        with mock.patch("apps.content.management.commands.warm_page_cache.ProcessPoolExecutor", ThreadPoolExecutor):
+            call_command("warm_page_cache", self.pdf.id, "--dpi", "20", stdout=out)
+        return out.getvalue()
+
+    def test_renders_only_the_pages_missing_from_the_cache(self):
+        pdf_hash = file_sha256(self.pdf.file.path)
+        PageImageCache().put(pdf_hash, 1, 20, "png", b"page-2")
+
+        out = self.warm()
+
+        self.assertIn("1/3 pages already cached", out)
+        self.assertIn("Rendered 2/2 pages", out)
+        self.assertTrue(all(PageImageCache().has(pdf_hash, page_num, 20, "png") for page_num in range(3)))
+        self.assertEqual(PageImageCache().get(pdf_hash, 1, 20, "png"), b"page-2")
+        self.assertNotIn("Rendered", self.warm())
@@ -0,0 +1,70 @@
+import fitz
+
+from apps.content.constants import TEXT_LAYER_MAX_GARBAGE_RATIO, TEXT_LAYER_MAX_IMAGE_RATIO, TEXT_LAYER_MIN_CHARS
+
+# Blocks may overhang the page middle by this much (in points) and still count as one column
+COLUMN_TOLERANCE = 10
+
+
+def _block_text(block: dict) -> str:
+    lines = []
+    for line in block.get("lines", []):
+        line_text = "".join(span.get("text", "") for span in line.get("spans", [])).strip()
+        if line_text:
+            lines.append(line_text)
+    return "\n".join(lines)
+
+
+def order_blocks_two_column(blocks: list[dict], page_width: float) -> list[dict]:
+    """
+    Orders text blocks the way QUIZ_PROMPT asks the model to read: left column top to bottom,
+    then right column top to bottom. A full-width block (e.g. a chapter header) closes the
+    columns above it, so the text below the header starts a new left/right pass.
+    """
+    middle = page_width / 2
+    ordered: list[dict] = []
+    left: list[dict] = []
+    right: list[dict] = []
+
+    for block in sorted(blocks, key=lambda b: (b["bbox"][1], b["bbox"][0])):
+        x0, _, x1, _ = block["bbox"]
+        if x1 <= middle + COLUMN_TOLERANCE:
+            left.append(block)
+        elif x0 >= middle - COLUMN_TOLERANCE:
+            right.append(block)
+        else:
+            ordered += left + right + [block]
+            left, right = [], []
+
+    return ordered + left + right
+
+
+def get_image_coverage(page: fitz.Page) -> float:
+    page_area = abs(page.rect) or 1
+    image_area = sum(abs(fitz.Rect(info["bbox"]) & page.rect) for info in page.get_image_info())
+    return min(image_area / page_area, 1.0)
+
+
+def extract_page_text(page: fitz.Page) -> str | None:
+    """
+    Returns the page text in two-column reading order if the text layer is usable, otherwise None.
+    Scanned pages (no/little text), image-heavy pages (diagrams the model has to see) and pages
+    with broken font encodings all fall back to the vision call.
+    """
+    blocks = [b for b in page.get_text("dict", flags=fitz.TEXTFLAGS_TEXT)["blocks"] if b.get("type") == 0]
+    texts = [_block_text(block) for block in order_blocks_two_column(blocks, page.rect.width)]
+    page_text = "\n\n".join(text for text in texts if text)
+
+    visible_chars = [ch for ch in page_text if not ch.isspace()]
+    if len(visible_chars) < TEXT_LAYER_MIN_CHARS:
+        return None
+
+    # Replacement characters and private-use glyphs mean the fonts have no usable unicode mapping
+    garbage = sum(1 for ch in visible_chars if ch == "\ufffd" or "\ue000" <= ch <= "\uf8ff")
+    if garbage / len(visible_chars) > TEXT_LAYER_MAX_GARBAGE_RATIO:
+        return None
+
+    if get_image_coverage(page) > TEXT_LAYER_MAX_IMAGE_RATIO:
+        return None
+
+    return page_text
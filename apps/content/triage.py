@@ -0,0 +1,171 @@
+import hashlib
+import io
+import re
+from collections.abc import Callable
+from dataclasses import dataclass
+
+import fitz
+from PIL import Image, ImageChops, ImageStat
+
+from apps.content.constants import (
+    TRIAGE_BLANK_MAX_CHARS, TRIAGE_BLANK_MAX_INK, TRIAGE_CONFIRM_DPI, TRIAGE_COVER_MAX_CHARS, TRIAGE_COVER_PAGES, TRIAGE_DPI,
+    TRIAGE_DUPLICATE_MAX_DISTANCE, TRIAGE_DUPLICATE_MAX_PIXEL_DIFF, TRIAGE_HASH_SIZE, TRIAGE_INDEX_HEADING_LINES, TRIAGE_INDEX_KEYWORDS,
+    TRIAGE_INDEX_MIN_LINE_RATIO, TRIAGE_INDEX_MIN_LINES, TRIAGE_INK_LEVEL
+)
+from apps.content.models import PageTriage, PDFUpload
+
+# "Hematopoez ........ 12" or "Anemiler … 45": a leader before the page number
+LEADER_LINE_RE = re.compile(r"(\.{3,}|…)\s*\d{1,4}$")
+# "3.2 Anemiler 45", only an index line when the numbers down the page form a page-number column
+TRAILING_NUMBER_RE = re.compile(r"\s(\d{1,4})$")
+# "A) ..." option labels, a page with any of them is never a cover
+OPTION_RE = re.compile(r"(^|\s)[A-E]\)\s")
+
+
+@dataclass
+class PageFeatures:
+    text_chars: int
+    ink_coverage: float
+    phash: str
+    text_hash: str
+    is_index: bool
+    has_options: bool
+
+
+def difference_hash(image: Image.Image, hash_size: int = TRIAGE_HASH_SIZE) -> str:
+    """Perceptual (difference) hash: one bit per horizontally adjacent pixel pair of a tiny grayscale copy."""
+    small = image.convert("L").resize((hash_size + 1, hash_size), Image.Resampling.LANCZOS)
+    pixels = list(small.getdata())
+    bits = 0
+    for row in range(hash_size):
+        for col in range(hash_size):
+            left = pixels[row * (hash_size + 1) + col]
+            right = pixels[row * (hash_size + 1) + col + 1]
+            bits = (bits << 1) | (left > right)
+    return f"{bits:0{hash_size * hash_size // 4}x}"
+
+
+def hamming_distance(a: str, b: str) -> int:
+    return (int(a, 16) ^ int(b, 16)).bit_count()
+
+
+def heading_text(line: str) -> str:
+    # Python lowercases "İ" to "i" plus a combining dot
+    return line.replace("İ", "i").lower().strip(" :")
+
+
+def looks_like_index(page_text: str) -> bool:
+    lines = [line.strip() for line in page_text.splitlines() if line.strip()]
+    # The keyword counts as a heading line of its own, not anywhere in the text
+    if any(heading_text(line) in TRIAGE_INDEX_KEYWORDS for line in lines[:TRIAGE_INDEX_HEADING_LINES]):
+        return True
+    if len(lines) < TRIAGE_INDEX_MIN_LINES:
+        return False
+
+    leader_lines = sum(1 for line in lines if LEADER_LINE_RE.search(line))
+    # Numbered options and lab values end in numbers too, but not in ones rising down the page
+    page_numbers = [int(match.group(1)) for line in lines if (match := TRAILING_NUMBER_RE.search(line))]
+    column_lines = len(page_numbers) if page_numbers == sorted(page_numbers) else 0
+    return max(leader_lines, column_lines) / len(lines) >= TRIAGE_INDEX_MIN_LINE_RATIO
+
+
+def page_features(page: fitz.Page) -> PageFeatures:
+    page_text = page.get_text()
+    normalized = " ".join(page_text.split())
+
+    pix = page.get_pixmap(dpi=TRIAGE_DPI, colorspace=fitz.csGRAY)
+    image = Image.open(io.BytesIO(pix.tobytes("png")))
+    histogram = image.convert("L").histogram()
+    ink_coverage = sum(histogram[:TRIAGE_INK_LEVEL]) / max(sum(histogram), 1)
+
+    return PageFeatures(
+        text_chars=sum(1 for ch in page_text if not ch.isspace()),
+        ink_coverage=ink_coverage,
+        phash=difference_hash(image),
+        text_hash=hashlib.sha256(normalized.encode("utf-8")).hexdigest() if normalized else "",
+        is_index=looks_like_index(page_text),
+        has_options=bool(OPTION_RE.search(page_text))
+    )
+
+
+def _gray_render(page: fitz.Page) -> Image.Image:
+    pix = page.get_pixmap(dpi=TRIAGE_CONFIRM_DPI, colorspace=fitz.csGRAY)
+    return Image.open(io.BytesIO(pix.tobytes("png"))).convert("L")
+
+
+def pixel_difference(page: fitz.Page, other: fitz.Page) -> float:
+    """Mean grayscale difference (0-255) of two pages, re-renders of the same page stay close to 0."""
+    image, other_image = _gray_render(page), _gray_render(other)
+    if other_image.size != image.size:
+        other_image = other_image.resize(image.size)
+    return ImageStat.Stat(ImageChops.difference(image, other_image)).mean[0]
+
+
+def classify_page(
+    features: PageFeatures,
+    page_num: int,
+    earlier: list[PageTriage],
+    looks_same: Callable[[int], bool] | None = None
+) -> tuple[str, int | None]:
+    """
+    Returns (kind, duplicate_of page number). `page_num` is 0-based, `earlier` are triaged pages
+    processed before it. `looks_same(page_number)` confirms a hash match against an earlier page.
+    """
+    if features.ink_coverage <= TRIAGE_BLANK_MAX_INK and features.text_chars <= TRIAGE_BLANK_MAX_CHARS:
+        return PageTriage.KIND_BLANK, None
+
+    # Scanned covers have no text layer and look like any scanned page, those are left to the model
+    if page_num < TRIAGE_COVER_PAGES and 0 < features.text_chars <= TRIAGE_COVER_MAX_CHARS and not features.has_options:
+        return PageTriage.KIND_COVER, None
+
+    if features.is_index:
+        return PageTriage.KIND_INDEX, None
+
+    for other in earlier:
+        if other.kind == PageTriage.KIND_BLANK or not other.phash or len(other.phash) != len(features.phash):
+            continue
+        # Pages with a text layer must have the same text, the pixels alone decide only for scans
+        if (features.text_hash or other.text_hash) and features.text_hash != other.text_hash:
+            continue
+        if hamming_distance(features.phash, other.phash) > TRIAGE_DUPLICATE_MAX_DISTANCE:
+            continue
+        if looks_same is None or looks_same(other.page_number):
+            return PageTriage.KIND_DUPLICATE, other.page_number
+
+    return PageTriage.KIND_CONTENT, None
+
+
+def triage_pages(doc: fitz.Document, pdf: PDFUpload, page_nums: list[int]) -> dict[int, PageTriage]:
+    """
+    Triage decisions for `page_nums` (0-based), keyed by page number. Pages triaged before keep
+    their stored decision, so an override made in the admin sticks.
+    """
+    stored = {triage.page_number: triage for triage in PageTriage.objects.filter(pdf=pdf)}
+    decisions = {}
+
+    for page_num in page_nums:
+        triage = stored.get(page_num + 1)
+        if triage is None:
+            page = doc.load_page(page_num)
+            features = page_features(page)
+            earlier = [other for number, other in sorted(stored.items()) if number <= page_num]
+            kind, duplicate_of = classify_page(
+                features, page_num, earlier,
+                lambda page_number: pixel_difference(page, doc.load_page(page_number - 1)) <= TRIAGE_DUPLICATE_MAX_PIXEL_DIFF
+            )
+            triage = PageTriage.objects.create(
+                pdf=pdf,
+                page_number=page_num + 1,
+                kind=kind,
+                duplicate_of=duplicate_of,
+                text_chars=features.text_chars,
+                ink_coverage=features.ink_coverage,
+                phash=features.phash,
+                text_hash=features.text_hash
+            )
+            stored[triage.page_number] = triage
+            if triage.should_skip:
+                print(f"🗂️ Page {page_num} triaged as {triage.get_kind_display().lower()}, it will be skipped.")
+        decisions[page_num] = triage
+
+    return decisions
@@ -145,6 +145,9 @@ MEDIA_ROOT = os.path.join(BASE_DIR, "media")
 
 DEFAULT_FILE_STORAGE = "django.core.files.storage.FileSystemStorage"
 
+# Rendered PDF page images, reused across resets/retries of the same file
+PAGE_CACHE_DIR = os.environ.get("PAGE_CACHE_DIR", os.path.join(BASE_DIR, "page_cache"))
+
 TELEGRAM_BOT_TOKEN = os.environ.get("TELEGRAM_BOT_TOKEN")
 
 # GitHub Configuration